@@ -0,0 +1,122 @@
+"""Contains the GuildActors class, which runs each guild's mutations one at a time through its own mailbox."""
+
+import asyncio
+import inspect
+
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable
+
+from config import ACTOR_IDLE_TIMEOUT
+
+
+class GuildActors:
+    """Class that gives each guild a serial mailbox, so a job that awaits between reading and changing a guild cannot interleave with another job for the same guild.
+
+    Jobs for one guild run in the order they were submitted, one at a time. Jobs for different guilds run concurrently. A guild's worker is started on its first job and stops once its mailbox has been empty for `ACTOR_IDLE_TIMEOUT` seconds.
+
+    A job must not `run` another job for its own guild and wait for it, as that job would never start. The same goes for a `turn` block.
+    """
+
+    def __init__(self) -> None:
+        """Initialise the GuildActors with no running workers."""
+        self.mailboxes: dict[int, asyncio.Queue] = {}
+        self.workers: dict[int, asyncio.Task] = {}
+        self.jobs = 0
+
+    def __len__(self) -> int:
+        return len(self.workers)
+
+    def queued(self) -> int:
+        """Get the number of jobs waiting across all mailboxes."""
+        return sum(mailbox.qsize() for mailbox in self.mailboxes.values())
+
+    async def run(self, guild_id: int, func: Callable[..., Any], *args: Any) -> Any:
+        """Run a job in a guild's mailbox and wait for its result.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The ID of the guild the job reads and changes.
+        func: `Callable[..., Any]`
+            The job. May be a plain function or a coroutine function.
+        *args: `Any`
+            The arguments to call `func` with.
+
+        Returns
+        -------
+        `Any`
+            The job's return value. Exceptions raised by the job are raised here."""
+        return await self._submit(guild_id, func, args)
+
+    @asynccontextmanager
+    async def turn(self, guild_id: int) -> AsyncIterator[None]:
+        """Wait for a guild's turn in its mailbox, and hold it for the body of an `async with` block.
+
+        For code such as command handlers that check and change a guild with awaits in between. Keep the block short, as the guild's other jobs wait for it.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The ID of the guild the block reads and changes."""
+        loop = asyncio.get_running_loop()
+        started = loop.create_future()
+        finished = loop.create_future()
+
+        async def hold():
+            # the block may have been cancelled before its turn came
+            if not started.done():
+                started.set_result(None)
+            await finished
+
+        self._submit(guild_id, hold, ())
+        try:
+            await started
+            yield
+        finally:
+            if not finished.done():
+                finished.set_result(None)
+
+    def _submit(
+        self, guild_id: int, func: Callable[..., Any], args: tuple
+    ) -> asyncio.Future:
+        """Put a job in a guild's mailbox, starting its worker if needed, and return the future for its result."""
+        mailbox = self.mailboxes.get(guild_id)
+        if mailbox is None:
+            mailbox = self.mailboxes[guild_id] = asyncio.Queue()
+            self.workers[guild_id] = asyncio.create_task(
+                self._work(guild_id, mailbox)
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        mailbox.put_nowait((func, args, future))
+        return future
+
+    async def _work(self, guild_id: int, mailbox: asyncio.Queue) -> None:
+        """Run a guild's jobs one at a time until its mailbox has been idle for `ACTOR_IDLE_TIMEOUT` seconds."""
+        while True:
+            try:
+                func, args, future = await asyncio.wait_for(
+                    mailbox.get(), ACTOR_IDLE_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                if mailbox.empty():
+                    del self.mailboxes[guild_id]
+                    del self.workers[guild_id]
+                    return
+                continue
+
+            # the caller stopped waiting before the job started
+            if future.cancelled():
+                continue
+
+            try:
+                result = func(*args)
+                if inspect.isawaitable(result):
+                    result = await result
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+            self.jobs += 1
@@ -0,0 +1,92 @@
+"""Contains the AuthorCache class, which remembers the authors of recently reacted to messages."""
+
+import sys
+import time
+
+from collections import OrderedDict, deque
+
+from config import MESSAGE_AUTHOR_TTL, MESSAGE_AUTHOR_CACHE
+
+
+class AuthorCache:
+    """Class that maps the IDs of recently reacted to messages to their authors' IDs, so removed reactions can be credited without fetching the message.
+
+    Entries expire `MESSAGE_AUTHOR_TTL` seconds after they were added, and at most `MESSAGE_AUTHOR_CACHE` are kept, least recently used first out. Looking up and adding an author take O(1).
+    Expired entries are dropped from the front of an expiry queue as new ones are added, since every entry lives for the same time.
+    """
+
+    def __init__(self) -> None:
+        """Initialise the AuthorCache with no entries."""
+        # message ID -> (expiry, author ID), least recently used first
+        self.entries: OrderedDict[int, tuple[float, int]] = OrderedDict()
+        # (expiry, message ID) in the order they were added, may hold outdated entries for messages that were added again or dropped
+        self.expiries: deque[tuple[float, int]] = deque()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def memory(self) -> int:
+        """Get the approximate memory used by the entries and the expiry queue, in bytes."""
+        # each entry holds an ID and a tuple of an expiry and an ID, and each queue item a tuple of an expiry and an ID
+        return (
+            sys.getsizeof(self.entries)
+            + len(self.entries) * (32 + 56 + 24 + 32)
+            + sys.getsizeof(self.expiries)
+            + len(self.expiries) * (56 + 24)
+        )
+
+    def get(self, message_id: int) -> int | None:
+        """Get the author of a message, if it is cached and has not expired.
+
+        Parameters
+        ----------
+        message_id: `int`
+            The ID of the message.
+
+        Returns
+        -------
+        `int | None`
+            The ID of the author of the message, or `None` if it is not cached."""
+        entry = self.entries.get(message_id)
+        if entry is None or entry[0] <= time.monotonic():
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(message_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, message_id: int, author_id: int) -> None:
+        """Cache the author of a message for `MESSAGE_AUTHOR_TTL` seconds, dropping expired entries and the least recently used ones over `MESSAGE_AUTHOR_CACHE`.
+
+        Parameters
+        ----------
+        message_id: `int`
+            The ID of the message.
+        author_id: `int`
+            The ID of the author of the message."""
+        now = time.monotonic()
+        expires = now + MESSAGE_AUTHOR_TTL
+        self.entries[message_id] = (expires, author_id)
+        self.entries.move_to_end(message_id)
+        self.expiries.append((expires, message_id))
+
+        while self.expiries and self.expiries[0][0] <= now:
+            expired, expired_id = self.expiries.popleft()
+            # skip items for messages that were since added again or dropped
+            entry = self.entries.get(expired_id)
+            if entry is not None and entry[0] == expired:
+                del self.entries[expired_id]
+
+        if len(self.entries) > MESSAGE_AUTHOR_CACHE:
+            self.entries.popitem(last=False)
+        # messages dropped by the cap leave items behind until they expire
+        if len(self.expiries) > 2 * MESSAGE_AUTHOR_CACHE:
+            self.expiries = deque(
+                sorted(
+                    (expires, message_id)
+                    for message_id, (expires, _) in self.entries.items()
+                )
+            )
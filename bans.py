@@ -0,0 +1,211 @@
+"""Contains the BanManager class, which keeps temporary bans from giving aura and sends their direct messages in the background."""
+
+import discord
+import asyncio
+import heapq
+import sqlite3
+import time
+
+from collections import OrderedDict
+
+from discord.ext import tasks
+
+from models import *
+from database import ConnectionManager
+from logging_aura import LoggingManager
+from db_functions import load_bans, save_bans
+from config import BAN_SNAPSHOT_INTERVAL, DM_QUEUE_SIZE, DM_CHANNEL_CACHE
+
+
+class BanManager:
+    """Class that keeps the users temporarily banned from giving aura in each guild.
+
+    Bans are kept per guild as a mapping of user IDs to expiry times, so checking, adding and lifting a ban take O(1). A single task lifts bans as they expire, driven by a heap of expiry times.
+    The active bans are saved to the `temp_bans` table every `BAN_SNAPSHOT_INTERVAL` seconds when they have changed, and loaded on startup so bans survive restarts.
+    Ban notifications are sent from a background queue, reusing cached DM channels.
+
+    Parameters
+    ----------
+    client: `discord.Client`
+        The Discord client instance.
+    db: `ConnectionManager`
+        The connection manager to save and load the bans with.
+    guilds: `dict[int, Guild]`
+        A dictionary mapping guild IDs to their respective Guild objects.
+    logging_manager: `LoggingManager`
+        The logging manager, used to log bans.
+    """
+
+    def __init__(
+        self,
+        client: discord.Client,
+        db: ConnectionManager,
+        guilds: dict[int, Guild],
+        logging_manager: LoggingManager,
+    ) -> None:
+        """Initialise the BanManager with the bans saved before the last shutdown that have not expired yet."""
+        self.client = client
+        self.db = db
+        self.guilds = guilds
+        self.logging_manager = logging_manager
+
+        # guild ID -> user ID -> expiry timestamp
+        self.bans: dict[int, dict[int, float]] = {}
+        # (expiry, guild ID, user ID), may hold outdated entries for bans that were extended
+        self.expiries: list[tuple[float, int, int]] = []
+        self.wake = asyncio.Event()
+        self.dirty = False
+
+        self.dm_queue: asyncio.Queue[tuple[int, str]] = asyncio.Queue(DM_QUEUE_SIZE)
+        # user ID -> DM channel ID, least recently used first
+        self.dm_channels: OrderedDict[int, int] = OrderedDict()
+        self.dms_dropped = 0
+
+        now = time.time()
+        for guild_id, user_id, expires in load_bans(db):
+            if expires > now:
+                self.bans.setdefault(guild_id, {})[user_id] = expires
+                self.expiries.append((expires, guild_id, user_id))
+        heapq.heapify(self.expiries)
+
+    def __len__(self) -> int:
+        return sum(len(users) for users in self.bans.values())
+
+    def is_banned(self, guild_id: int, user_id: int) -> bool:
+        """Check if a user is temporarily banned from giving aura in a guild.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The ID of the guild.
+        user_id: `int`
+            The ID of the user.
+
+        Returns
+        -------
+        `bool`
+            Whether the user is banned."""
+        expires = self.bans.get(guild_id, {}).get(user_id)
+        return expires is not None and expires > time.time()
+
+    def ban(self, guild_id: int, user_id: int) -> None:
+        """Temporarily ban a user from giving aura for the guild's penalty, log it and queue a direct message.
+
+        Banning a user who is already banned extends their ban without logging or notifying them again.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The ID of the guild.
+        user_id: `int`
+            The ID of the user to tempban."""
+        penalty = self.guilds[guild_id].limits.penalty
+        expires = time.time() + penalty
+        already_banned = self.is_banned(guild_id, user_id)
+        users = self.bans.setdefault(guild_id, {})
+        if users.get(user_id, 0) >= expires:
+            return
+
+        users[user_id] = expires
+        heapq.heappush(self.expiries, (expires, guild_id, user_id))
+        self.dirty = True
+        self.wake.set()
+        if already_banned:
+            return
+
+        if self.guilds[guild_id].log_channel_id is not None:
+            self.logging_manager.log_event(
+                guild_id, user_id, user_id, LogEvent.SPAMMING
+            )
+
+        guild = self.client.get_guild(guild_id)
+        try:
+            self.dm_queue.put_nowait(
+                (
+                    user_id,
+                    f"<@{user_id}>\nYou have been temporarily banned for {penalty} seconds from giving aura in {guild.name if guild else 'a server'} due to spamming reactions.",
+                )
+            )
+        except asyncio.QueueFull:
+            # a ban storm is not worth a backlog of notifications
+            self.dms_dropped += 1
+
+    def unban(self, guild_id: int, user_id: int) -> None:
+        """Lift a user's temporary ban in a guild, if they have one.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The ID of the guild.
+        user_id: `int`
+            The ID of the user."""
+        users = self.bans.get(guild_id)
+        if users is not None and users.pop(user_id, None) is not None:
+            if not users:
+                del self.bans[guild_id]
+            self.dirty = True
+
+    @tasks.loop(seconds=0)
+    async def expire_bans(self):
+        """Lift the bans that have expired, then sleep until the next one expires or a ban is added."""
+        self.wake.clear()
+        now = time.time()
+        while self.expiries and self.expiries[0][0] <= now:
+            expires, guild_id, user_id = heapq.heappop(self.expiries)
+            # skip entries for bans that were since extended or lifted
+            if self.bans.get(guild_id, {}).get(user_id) == expires:
+                self.unban(guild_id, user_id)
+
+        timeout = self.expiries[0][0] - now if self.expiries else None
+        try:
+            await asyncio.wait_for(self.wake.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    @tasks.loop(seconds=BAN_SNAPSHOT_INTERVAL)
+    async def snapshot_bans(self):
+        """Save the active bans if they have changed since the last snapshot.
+
+        Runs every `BAN_SNAPSHOT_INTERVAL` seconds."""
+        if self.dirty:
+            await self.save()
+
+    async def save(self) -> None:
+        """Replace the saved snapshot with the active bans.
+
+        If the write fails, the bans stay marked as changed and are retried on the next snapshot."""
+        self.dirty = False
+        rows = [
+            (guild_id, user_id, int(expires))
+            for guild_id, users in self.bans.items()
+            for user_id, expires in users.items()
+        ]
+        try:
+            await self.db.run_write(save_bans, rows)
+        except sqlite3.Error as e:
+            print(f"Failed to save {len(rows)} temporary bans: {e}")
+            self.dirty = True
+
+    @tasks.loop(seconds=0)
+    async def send_dms(self):
+        """Send the next queued direct message, opening and caching a DM channel if the user has none cached."""
+        user_id, content = await self.dm_queue.get()
+        try:
+            channel_id = self.dm_channels.get(user_id)
+            if channel_id is None:
+                user = self.client.get_user(user_id)
+                if user is None:
+                    user = await self.client.fetch_user(user_id)
+                    print(f"Fetched user {user_id}. Reason: Temp ban direct message.")
+                channel_id = (await user.create_dm()).id
+                self.dm_channels[user_id] = channel_id
+                if len(self.dm_channels) > DM_CHANNEL_CACHE:
+                    self.dm_channels.popitem(last=False)
+            else:
+                self.dm_channels.move_to_end(user_id)
+
+            await self.client.get_partial_messageable(
+                channel_id, type=discord.ChannelType.private
+            ).send(content)
+        except discord.HTTPException as e:
+            print(f"Failed to send direct message to user {user_id}: {e}")
@@ -0,0 +1,113 @@
+"""Contains the BaselineManager class, which caches each user's baseline aura for the timeframe leaderboards."""
+
+import heapq
+import time
+
+from database import ConnectionManager
+from guild_store import GuildStore
+from db_functions import build_baselines, load_baselines, load_baseline_state
+from config import TIMEFRAME_DAYS
+
+# snapshots are taken twice a day, so baselines built longer ago than this are out of date
+BASELINE_MAX_AGE = 12 * 60 * 60
+
+
+class BaselineManager:
+    """Class that caches each user's aura at the start of every timeframe, so timeframe leaderboards are computed from memory.
+
+    A baseline is a user's latest snapshot at or before the start of the period. It only moves when snapshots are taken, so the baselines are rebuilt into the `period_baselines` table after every snapshot run, and loaded into memory per guild on first use.
+
+    Parameters
+    ----------
+    db: `ConnectionManager`
+        The connection manager to build and load baselines with.
+    guilds: `GuildStore`
+        The guild store, mapping guild IDs to `Guild` objects.
+    """
+
+    def __init__(self, db: ConnectionManager, guilds: GuildStore) -> None:
+        """Initialise the BaselineManager with the time the persisted baselines were built."""
+        self.db = db
+        self.guilds = guilds
+        self.built = load_baseline_state(db)
+        self.baselines: dict[int, dict[str, dict[int, int]]] = {}
+        # bumped on every rebuild, so loads that started before it are discarded
+        self.generation = 0
+
+    @property
+    def stale(self) -> bool:
+        """Whether snapshots may have been taken since the baselines were built."""
+        return time.time() - self.built >= BASELINE_MAX_AGE
+
+    async def rebuild(self) -> None:
+        """Rebuild the persisted baselines on the writer thread and drop the cached ones."""
+        start = time.perf_counter()
+        built = await self.db.run_write(build_baselines, TIMEFRAME_DAYS)
+        self.built = int(time.time())
+        self.baselines = {}
+        self.generation += 1
+        print(f"Built {built} baselines in {time.perf_counter() - start:.2f}s.")
+
+    async def get(self, guild_id: int, timeframe: str) -> dict[int, int]:
+        """Get a guild's baselines for a timeframe, loading the guild's baselines if they are not cached.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The ID of the guild.
+        timeframe: `str`
+            One of `TIMEFRAME_DAYS`.
+
+        Returns
+        -------
+        `dict[int, int]`
+            Maps each user ID to their baseline aura."""
+        baselines = self.baselines.get(guild_id)
+        if baselines is None:
+            generation = self.generation
+            baselines = await self.db.run_read(load_baselines, guild_id)
+            if generation == self.generation:
+                self.baselines[guild_id] = baselines
+        return baselines.get(timeframe, {})
+
+    async def leaderboard(
+        self, guild_id: int, timeframe: str, start: int, count: int
+    ) -> tuple[list[tuple[int, int]], int]:
+        """Get a range of a guild's opted in users by aura gained over a timeframe.
+
+        Users without a baseline are left out.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The ID of the guild.
+        timeframe: `str`
+            One of `TIMEFRAME_DAYS`.
+        start: `int`
+            The 0-based position of the first entry.
+        count: `int`
+            The maximum number of entries.
+
+        Returns
+        -------
+        `tuple[list[tuple[int, int]], int]`
+            The `(user_id, gain)` of each entry, highest gain first, and the total number of ranked users."""
+        baselines = await self.get(guild_id, timeframe)
+        users = self.guilds[guild_id].users
+
+        gains = []
+        for user_id, baseline in baselines.items():
+            user = users.get(user_id)
+            if user is not None and user.opted_in:
+                gains.append((user_id, user.aura - baseline))
+
+        top = heapq.nlargest(
+            start + count, gains, key=lambda item: (item[1], -item[0])
+        )
+        return top[start:], len(gains)
+
+    def evict(self) -> None:
+        """Drop the cached baselines of guilds that are no longer resident."""
+        for guild_id in list(self.baselines):
+            if guild_id not in self.guilds.resident:
+                del self.baselines[guild_id]
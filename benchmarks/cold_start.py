@@ -0,0 +1,105 @@
+"""Benchmarks the cold start: loading every table with load_data, and building the GuildStore from the recently active guilds.
+
+Builds a temporary database of `--guilds` guilds sharing `--users` users, with a few reactions and a limits row per guild, of which `--active` were updated within `GUILD_IDLE_TIMEOUT`.
+load_data prints the time taken by each table.
+Run from the repository root:
+
+    python -m benchmarks.cold_start [--guilds 10000] [--users 1000000] [--active 0.1]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from database import ConnectionManager
+from guild_store import GuildStore
+from db_functions import load_data
+from config import GUILD_IDLE_TIMEOUT
+
+REACTIONS = ("👍", "👎", "🔥", "💀")
+
+
+def populate(db: ConnectionManager, guilds: int, users: int, active: float) -> None:
+    """Insert the guilds, with `users` users spread evenly over them and the `active` fraction updated recently."""
+    random.seed(0)
+    now = int(time.time())
+    conn = db.writer
+    with conn:
+        conn.executemany(
+            "INSERT INTO guilds (id, last_update) VALUES (?, ?)",
+            (
+                (
+                    guild_id,
+                    now if random.random() < active else now - 2 * GUILD_IDLE_TIMEOUT,
+                )
+                for guild_id in range(guilds)
+            ),
+        )
+        conn.executemany(
+            """
+            INSERT INTO users (
+                guild_id, user_id, aura, aura_contribution, num_pos_given,
+                num_pos_received, num_neg_given, num_neg_received, opted_in,
+                giving_allowed, receiving_allowed
+            ) VALUES (?, ?, ?, 0, 0, 0, 0, 0, 1, 1, 1)
+        """,
+            (
+                (user_id % guilds, user_id, random.randint(-100, 10000))
+                for user_id in range(users)
+            ),
+        )
+        conn.executemany(
+            "INSERT INTO reactions (guild_id, emoji, points) VALUES (?, ?, ?)",
+            (
+                (guild_id, emoji, points)
+                for guild_id in range(guilds)
+                for emoji, points in zip(REACTIONS, (1, -1, 2, -2))
+            ),
+        )
+        conn.executemany(
+            """
+            INSERT INTO limits (
+                guild_id, interval_long, threshold_long, interval_short,
+                threshold_short, penalty, adding_cooldown, removing_cooldown
+            ) VALUES (?, 60, 10, 15, 5, 300, 10, 10)
+        """,
+            ((guild_id,) for guild_id in range(guilds)),
+        )
+
+
+def run(guilds: int, users: int, active: float) -> None:
+    """Build the database and time loading it."""
+    with tempfile.TemporaryDirectory() as directory:
+        db = ConnectionManager(os.path.join(directory, "bench.db"))
+        try:
+            start = time.perf_counter()
+            populate(db, guilds, users, active)
+            print(
+                f"Inserted {guilds} guilds and {users} users in {time.perf_counter() - start:.1f}s."
+            )
+
+            start = time.perf_counter()
+            loaded = load_data(db)
+            print(
+                f"load_data: {time.perf_counter() - start:.2f}s for {len(loaded)} guilds"
+            )
+            del loaded
+
+            start = time.perf_counter()
+            store = GuildStore(db)
+            print(
+                f"GuildStore: {time.perf_counter() - start:.2f}s for {len(store.resident)} active guilds"
+            )
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--active", type=float, default=0.1)
+    args = parser.parse_args()
+    run(args.guilds, args.users, args.active)
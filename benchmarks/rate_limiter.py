@@ -0,0 +1,148 @@
+"""Benchmarks the RateLimiter against the deque timelines it replaced: recording reactions, memory, sweeping and a giver with a full window.
+
+Builds a temporary database of `--guilds` guilds, records one reaction for each of `--givers` distinct givers spread over them, then sweeps the windows once the long interval has passed.
+Also times `--hits` reactions from one giver whose long window never empties.
+Run from the repository root:
+
+    python -m benchmarks.rate_limiter [--givers 1000000] [--guilds 100] [--hits 6000]
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+
+from collections import defaultdict, deque
+
+from database import ConnectionManager
+from guild_store import GuildStore
+from rate_limiter import RateLimiter
+from models import ReactionEvent
+
+
+class DequeTimelines:
+    """The rolling timelines from the old TimelinesManager, returning whether the giver would be banned instead of banning them."""
+
+    def __init__(self, guilds: GuildStore) -> None:
+        self.guilds = guilds
+        self.rolling_add = defaultdict(deque)
+        self.rolling_remove = defaultdict(deque)
+
+    def hit(self, guild_id: int, user_id: int, event: ReactionEvent) -> bool:
+        current_time = time.time()
+
+        if event.is_add:
+            rolling = self.rolling_add
+        else:
+            rolling = self.rolling_remove
+
+        rolling[(guild_id, user_id)].append(current_time)
+
+        while (
+            rolling[(guild_id, user_id)]
+            and rolling[(guild_id, user_id)][0]
+            < current_time - self.guilds[guild_id].limits.interval_long
+        ):
+            rolling[(guild_id, user_id)].popleft()
+
+        if (
+            len(rolling[(guild_id, user_id)])
+            > self.guilds[guild_id].limits.threshold_long
+        ):
+            return True
+
+        short_rolling = [
+            1
+            for t in rolling[(guild_id, user_id)]
+            if t >= current_time - self.guilds[guild_id].limits.interval_short
+        ]
+        return sum(short_rolling) > self.guilds[guild_id].limits.threshold_short
+
+    def __len__(self) -> int:
+        return len(self.rolling_add) + len(self.rolling_remove)
+
+
+def record(limiter: RateLimiter | DequeTimelines, givers: int, guilds: int) -> None:
+    """Record one reaction for each giver, spread evenly over the guilds."""
+    for user_id in range(givers):
+        limiter.hit(user_id % guilds, user_id, ReactionEvent.ADD)
+
+
+def time_givers(
+    name: str, limiter: RateLimiter | DequeTimelines, givers: int, guilds: int
+) -> None:
+    """Time recording one reaction per giver and report the peak memory allocated while doing so.
+
+    Tracing the allocations slows both limiters down, so compare the times with each other rather than with production."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    record(limiter, givers, guilds)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{name}: {givers} givers in {elapsed:.1f}s, peak {peak / 2**20:.0f} MiB, {len(limiter)} windows"
+    )
+
+
+def time_full_window(
+    name: str, limiter: RateLimiter | DequeTimelines, guild_id: int, hits: int
+) -> None:
+    """Time a single giver reacting `hits` times within one long interval."""
+    start = time.perf_counter()
+    for _ in range(hits):
+        limiter.hit(guild_id, 0, ReactionEvent.ADD)
+    elapsed = time.perf_counter() - start
+    print(f"{name}: one giver, {hits} hits: {elapsed / hits * 1e6:.1f} us per event")
+
+
+async def run(givers: int, guilds: int, hits: int) -> None:
+    """Build the database and time both rate limiters side by side."""
+    with tempfile.TemporaryDirectory() as directory:
+        db = ConnectionManager(os.path.join(directory, "bench.db"))
+        try:
+            conn = db.writer
+            with conn:
+                conn.executemany(
+                    "INSERT INTO guilds (id) VALUES (?)",
+                    ((guild_id,) for guild_id in range(guilds)),
+                )
+            store = GuildStore(db)
+            for guild_id in range(guilds):
+                await store.load(guild_id)
+
+            old = DequeTimelines(store)
+            time_givers("deque timelines", old, givers, guilds)
+            del old
+            limiter = RateLimiter(store)
+            time_givers("RateLimiter", limiter, givers, guilds)
+
+            # let every window pass instead of waiting out the long interval
+            for guild_id in range(guilds):
+                store[guild_id].limits.interval_long = 0
+            start = time.perf_counter()
+            await limiter.sweep.coro(limiter)
+            print(
+                f"RateLimiter sweep: {(time.perf_counter() - start) * 1000:.0f} ms, {len(limiter)} windows left"
+                " (the deque timelines never drop a key)"
+            )
+
+            # limits high enough that the giver is never banned, so every hit does the full check
+            limits = store[0].limits
+            limits.interval_long = limits.interval_short = 3600
+            limits.threshold_long = limits.threshold_short = hits + 1
+            time_full_window("deque timelines", DequeTimelines(store), 0, hits)
+            time_full_window("RateLimiter", RateLimiter(store), 0, hits)
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--givers", type=int, default=1000000)
+    parser.add_argument("--guilds", type=int, default=100)
+    parser.add_argument("--hits", type=int, default=6000)
+    args = parser.parse_args()
+    asyncio.run(run(args.givers, args.guilds, args.hits))
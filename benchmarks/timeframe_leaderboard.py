@@ -0,0 +1,107 @@
+"""Benchmarks the timeframe leaderboards: building the period baselines, loading a guild's baselines and ranking every timeframe.
+
+Builds a temporary database with one guild of `--users` users, each with `--snapshots` snapshots taken twice a day, then times each stage.
+Run from the repository root:
+
+    python -m benchmarks.timeframe_leaderboard [--users 100000] [--snapshots 60]
+"""
+
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import tempfile
+import time
+
+from database import ConnectionManager
+from guild_store import GuildStore
+from baselines import BaselineManager
+from db_functions import load_baselines
+from models import SnapshotResolution
+from config import TIMEFRAME_DAYS
+
+GUILD_ID = 1
+
+
+def populate(db: ConnectionManager, users: int, snapshots: int) -> None:
+    """Insert one guild whose users each have `snapshots` snapshots taken twice a day, ending now."""
+    random.seed(0)
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    conn = db.writer
+    with conn:
+        conn.execute("INSERT INTO guilds (id) VALUES (?)", (GUILD_ID,))
+        conn.executemany(
+            "INSERT INTO users (guild_id, user_id, aura) VALUES (?, ?, ?)",
+            (
+                (GUILD_ID, user_id, random.randint(0, 10000))
+                for user_id in range(users)
+            ),
+        )
+        for i in range(snapshots, 0, -1):
+            taken = (now - datetime.timedelta(hours=12 * i)).strftime(
+                "%Y-%m-%d %H:%M:%S"
+            )
+            conn.executemany(
+                """
+                INSERT INTO user_snapshots (
+                    guild_id, user_id, aura, aura_contribution, num_pos_given,
+                    num_pos_received, num_neg_given, num_neg_received,
+                    snapshot_time, resolution
+                ) VALUES (?, ?, ?, 0, 0, 0, 0, 0, ?, ?)
+            """,
+                (
+                    (
+                        GUILD_ID,
+                        user_id,
+                        random.randint(0, 10000),
+                        taken,
+                        SnapshotResolution.RAW.level,
+                    )
+                    for user_id in range(users)
+                ),
+            )
+
+
+async def run(users: int, snapshots: int) -> None:
+    """Build the database and time each stage of the timeframe leaderboards."""
+    with tempfile.TemporaryDirectory() as directory:
+        db = ConnectionManager(os.path.join(directory, "bench.db"))
+        try:
+            start = time.perf_counter()
+            populate(db, users, snapshots)
+            print(
+                f"Inserted {users} users x {snapshots} snapshots in {time.perf_counter() - start:.1f}s."
+            )
+
+            guilds = GuildStore(db)
+            await guilds.load(GUILD_ID)
+            baseline_manager = BaselineManager(db, guilds)
+
+            start = time.perf_counter()
+            await baseline_manager.rebuild()
+            print(f"build_baselines: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+            start = time.perf_counter()
+            await db.run_read(load_baselines, GUILD_ID)
+            print(f"load_baselines: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+            await baseline_manager.get(GUILD_ID, "day")
+            for timeframe in TIMEFRAME_DAYS:
+                start = time.perf_counter()
+                top, total = await baseline_manager.leaderboard(
+                    GUILD_ID, timeframe, 0, 99
+                )
+                print(
+                    f"leaderboard {timeframe}: {(time.perf_counter() - start) * 1000:.0f} ms ({total} ranked users)"
+                )
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--snapshots", type=int, default=60)
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.snapshots))
@@ -0,0 +1,180 @@
+"""Contains the LeaderboardScheduler class, which refreshes persistent leaderboards shortly after they change."""
+
+import discord
+import asyncio
+import heapq
+import time
+
+from discord.ext import tasks
+
+from guild_store import GuildStore
+from funcs import Functions
+from config import BOARD_MIN_DELAY, BOARD_MAX_DELAY, BOARD_BUSY_RATE, BOARD_WORKERS
+
+
+class LeaderboardScheduler:
+    """Class that refreshes a guild's persistent leaderboard after its ranking changes, instead of polling every guild.
+
+    A change marks the guild dirty and schedules a refresh after a delay that adapts to how busy the guild is: guilds with a steady stream of changes are refreshed every `BOARD_MIN_DELAY` seconds, while a burst of changes in a quiet guild is coalesced into one refresh up to `BOARD_MAX_DELAY` seconds later.
+    Due refreshes run concurrently, at most `BOARD_WORKERS` at a time and at most one per guild, so a slow or rate limited channel only holds up its own guild.
+
+    Parameters
+    ----------
+    client: `discord.Client`
+        The Discord client instance.
+    guilds: `GuildStore`
+        The guild store, mapping guild IDs to `Guild` objects. The scheduler listens for its ranking changes.
+    funcs: `Functions`
+        The shared utility functions, used to render and edit the leaderboards.
+    """
+
+    def __init__(
+        self, client: discord.Client, guilds: GuildStore, funcs: Functions
+    ) -> None:
+        """Initialise the LeaderboardScheduler and start listening for ranking changes."""
+        self.client = client
+        self.guilds = guilds
+        self.funcs = funcs
+
+        # guild ID -> monotonic time its refresh is due, for dirty guilds
+        self.due: dict[int, float] = {}
+        # (due, guild ID), may hold outdated entries that no longer match `due`
+        self.queue: list[tuple[float, int]] = []
+        self.changes: dict[int, int] = {}
+        # changes per second, averaged over recent refreshes
+        self.rates: dict[int, float] = {}
+        self.last_refresh: dict[int, float] = {}
+
+        self.running: set[int] = set()
+        self.workers = asyncio.Semaphore(BOARD_WORKERS)
+        self.wake = asyncio.Event()
+        self._tasks: set[asyncio.Task] = set()
+        self.refreshes = 0
+
+        guilds.rank_listeners.append(self.mark)
+
+    def delay(self, guild_id: int) -> float:
+        """Get how long to wait after a guild's first unrefreshed change, in seconds.
+
+        Halves for every `BOARD_BUSY_RATE` changes per second the guild has recently averaged, between `BOARD_MIN_DELAY` and `BOARD_MAX_DELAY`.
+        """
+        rate = self.rates.get(guild_id, 0.0)
+        return max(BOARD_MIN_DELAY, BOARD_MAX_DELAY / (1 + rate / BOARD_BUSY_RATE))
+
+    def _schedule(self, guild_id: int, due: float) -> None:
+        """Schedule a guild's refresh, no sooner than `BOARD_MIN_DELAY` after its last one."""
+        due = max(due, self.last_refresh.get(guild_id, 0.0) + BOARD_MIN_DELAY)
+        self.due[guild_id] = due
+        heapq.heappush(self.queue, (due, guild_id))
+        self.wake.set()
+
+    def mark(self, guild_id: int) -> None:
+        """Mark a guild's leaderboard as changed, scheduling a refresh if one is not already scheduled.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The ID of the guild."""
+        self.changes[guild_id] = self.changes.get(guild_id, 0) + 1
+        if guild_id not in self.due:
+            self._schedule(guild_id, time.monotonic() + self.delay(guild_id))
+
+    def refresh_all(self) -> None:
+        """Schedule an immediate refresh of every resident guild's leaderboard, e.g. at startup."""
+        now = time.monotonic()
+        for guild_id in self.guilds:
+            if self.guilds[guild_id].board_msg_id is not None:
+                self.changes.setdefault(guild_id, 0)
+                self._schedule(guild_id, now)
+
+    @tasks.loop(seconds=0)
+    async def dispatch(self):
+        """Start the refreshes that are due, then sleep until the next one is due or a guild is marked."""
+        self.wake.clear()
+        timeout = None
+
+        while self.queue:
+            due, guild_id = self.queue[0]
+            if self.due.get(guild_id) != due or guild_id in self.running:
+                # outdated, or picked up again when the running refresh finishes
+                heapq.heappop(self.queue)
+                continue
+
+            now = time.monotonic()
+            if due > now:
+                timeout = due - now
+                break
+
+            heapq.heappop(self.queue)
+            del self.due[guild_id]
+            self.running.add(guild_id)
+            task = asyncio.create_task(self.refresh(guild_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        try:
+            await asyncio.wait_for(self.wake.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def refresh(self, guild_id: int) -> None:
+        """Re-render and edit a guild's persistent leaderboard, waiting for a free worker.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The ID of the guild."""
+        try:
+            async with self.workers:
+                now = time.monotonic()
+                changes = self.changes.pop(guild_id, 0)
+                last = self.last_refresh.get(guild_id)
+                if last is not None:
+                    # idle time beyond the longest delay does not count towards the rate
+                    elapsed = max(min(now - last, 4 * BOARD_MAX_DELAY), BOARD_MIN_DELAY)
+                    self.rates[guild_id] = (
+                        self.rates.get(guild_id, 0.0) + changes / elapsed
+                    ) / 2
+                self.last_refresh[guild_id] = now
+
+                await self.guilds.load(guild_id)
+                if guild_id not in self.guilds:
+                    return
+                guild = self.guilds[guild_id]
+                if guild.msgs_channel_id is None or guild.board_msg_id is None:
+                    return
+                channel = self.client.get_channel(guild.msgs_channel_id)
+                if channel is None:
+                    return
+
+                try:
+                    board_msg = channel.get_partial_message(guild.board_msg_id)
+                    await self.funcs.edit_if_changed(
+                        board_msg,
+                        await self.funcs.get_leaderboard(guild_id, "all", True),
+                    )
+                    self.refreshes += 1
+                except discord.NotFound:
+                    pass
+                except discord.Forbidden:
+                    print(
+                        f"Forbidden to send leaderboard to channel {guild.msgs_channel_id} in guild {guild_id}."
+                    )
+                except discord.HTTPException as e:
+                    print(f"Failed to update leaderboard: HTTPException: {e}")
+        finally:
+            self.running.discard(guild_id)
+            # changes made while the refresh was running
+            if guild_id in self.due:
+                self._schedule(guild_id, self.due[guild_id])
+
+    def evict(self) -> None:
+        """Forget the refresh history of guilds that are no longer resident and have nothing scheduled."""
+        for guild_id in list(self.last_refresh):
+            if (
+                guild_id not in self.guilds.resident
+                and guild_id not in self.due
+                and guild_id not in self.running
+            ):
+                del self.last_refresh[guild_id]
+                self.rates.pop(guild_id, None)
@@ -1,10 +1,51 @@
-UPDATE_INTERVAL = 10  # how often to update the leaderboard
+BOARD_MIN_DELAY = 2  # refresh a busy guild's leaderboard at most this often, in seconds
+BOARD_MAX_DELAY = 10  # refresh a quiet guild's leaderboard at most this long after a change, in seconds
+BOARD_BUSY_RATE = 1  # every this many changes per second halves the leaderboard refresh delay
+BOARD_WORKERS = 8  # leaderboard edits sent concurrently
+INGEST_GUILD_BACKLOG = 10000  # reaction events queued or being applied in a guild before its gateway handlers wait
+INGEST_BATCH_SIZE = 1000  # max reaction events applied in one batch
+ACTOR_IDLE_TIMEOUT = 60  # stop a guild's actor after its mailbox has been empty this long
+COOLDOWN_SWEEP_INTERVAL = 10  # how often to drop expired cooldowns, and the width of their expiry buckets
+RATE_LIMIT_SWEEP_INTERVAL = 60  # how often to drop idle rate limit windows
+MESSAGE_AUTHOR_TTL = 3600  # how long to remember the author of a reacted to message, in seconds
+MESSAGE_AUTHOR_CACHE = 200000  # message authors kept in memory
+MESSAGE_AUTHOR_FLUSH_INTERVAL = 10  # how often to save newly seen message authors to the database
+MESSAGE_AUTHOR_PRUNE_INTERVAL = 3600  # how often to prune the saved message authors
+MESSAGE_AUTHOR_RETENTION = 90  # forget the authors of messages older than this many days
+MESSAGE_AUTHOR_ROWS = 5000000  # max message authors kept in the database
+NEGATIVE_CACHE_TTL = 900  # how long to remember a message, channel or user that could not be fetched, in seconds
+NEGATIVE_CACHE_SIZE = 100000  # unresolvable messages, channels and users kept in memory
+BAN_SNAPSHOT_INTERVAL = 30  # how often to save changed temporary bans to the database
+DM_QUEUE_SIZE = 1000  # direct messages queued before new ones are dropped
+DM_CHANNEL_CACHE = 10000  # DM channel IDs kept in memory
+LEADERBOARD_PAGE_SIZE = 25  # users per leaderboard page
+EMOJI_PAGE_SIZE = 20  # emojis per emoji list page
+PAGE_CACHE_SIZE = 1000  # rendered pages kept in memory
 LOGGING_INTERVAL = 10  # how often to send logs
+LAG_PROBE_INTERVAL = 1  # how often to measure event loop lag
+AVATAR_DEBOUNCE = 300  # record at most one avatar change per user in this long
 
 OWNER_ID = 355938178265251842
 LOG_CHANNEL_ID = 1368888031716835420
 
 DB = "aura_data.db"  # database file name
+FLUSH_INTERVAL = 250  # how often the write-behind flusher checks for pending changes, in ms
+FLUSH_MAX_CHANGES = 500  # flush as soon as this many rows are pending
+FLUSH_MAX_LAG = 2000  # flush once the oldest pending change is this old, in ms
+JOURNAL_COMPACT_INTERVAL = 60  # how often to fold the aura journal into the users table
+JOURNAL_COMPACT_SIZE = 10000  # fold the aura journal early once it has this many entries
+GUILD_IDLE_TIMEOUT = 3600  # evict guilds from memory after this long without use
+GUILD_CACHE_USERS = 1000000  # max users kept in memory across resident guilds
+GUILD_EVICT_INTERVAL = 60  # how often to check for guilds to evict
+DB_READERS = 4  # number of pooled read-only connections
+DB_CACHE_SIZE = 16384  # page cache per connection, in KiB
+DB_MMAP_SIZE = 256 * 1024 * 1024  # memory-mapped I/O limit per connection, in bytes
+DB_STATEMENT_CACHE = 256  # prepared statements kept per connection
+SNAPSHOT_RAW_RETENTION = 30  # keep snapshots at full resolution for this many days
+SNAPSHOT_DAILY_RETENTION = 120  # then one per day for this many days
+SNAPSHOT_WEEKLY_RETENTION = 400  # then one per week for this many days
+SNAPSHOT_MONTHLY_RETENTION = 1830  # then one per month for this many days
+TIMEFRAME_DAYS = {"day": 1, "week": 7, "month": 30, "quarter": 91, "year": 365}  # days covered by each timeframe leaderboard
 
 PRIVACY_URL = "https://engiw.github.io/aura-tos/privacypolicy"
 TOS_URL = "https://engiw.github.io/aura-tos/termsofservice"
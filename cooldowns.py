@@ -1,9 +1,13 @@
 """Contains the CooldownManager class, which manages the cooldowns for reactions across all guilds."""
 
+import sys
 import time
 
-from collections import defaultdict
+from discord.ext import tasks
+
 from models import *
+from guild_store import GuildStore
+from config import COOLDOWN_SWEEP_INTERVAL
 
 
 class CooldownManager:
@@ -11,30 +15,45 @@ class CooldownManager:
 
     This class is responsible for tracking the cooldowns for adding and removing reactions, ensuring that users cannot spam reactions within the specified cooldown periods.
 
+    Only active cooldowns are stored, as the time they began keyed by guild, giver and recipient. A guild-user-author without an entry is not on cooldown, so checks never create entries.
+    Each cooldown is also filed in a bucket of `COOLDOWN_SWEEP_INTERVAL` seconds by when it expires, and `sweep` drops the expired ones bucket by bucket.
+
     Parameters
     ----------
-    guilds: `dict[int, Guild]`
-        A dictionary mapping guild IDs to their respective Guild objects.
+    guilds: `GuildStore`
+        The guild store, mapping guild IDs to `Guild` objects, for their cooldowns.
     """
 
-    def __init__(self, guilds: dict[int, Guild]) -> None:
-        """Initialize the CooldownManager with specified cooldowns."""
+    def __init__(self, guilds: GuildStore) -> None:
+        """Initialize the CooldownManager with no active cooldowns."""
         self.guilds = guilds
-        self._cooldowns: defaultdict[tuple[int], UserCooldowns] = defaultdict(dict)
+        # (guild ID, user ID, author ID) -> timestamp the cooldown began
+        self._adding: dict[tuple[int, int, int], int] = {}
+        self._removing: dict[tuple[int, int, int], int] = {}
+        # expiry bucket -> (is add, key, began) of the cooldowns expiring in it
+        self._buckets: dict[int, list[tuple[bool, tuple[int, int, int], int]]] = {}
 
-    def ensure_cooldown(self, guild_id: int, user_id: int, author_id: int) -> None:
-        """Ensure the guild's cooldowns exist in `_adding_cooldowns` and `_removing_cooldowns` and ensure a cooldown object exists for a guild-user-author group.
+    def __len__(self) -> int:
+        return len(self._adding) + len(self._removing)
 
-        Parameters
-        ----------
-        guild_id: `int`
-            The ID of the guild.
-        user_id: `int`
-            The ID of the user giving or removing the reaction.
-        author_id: `int`
-            The ID of the user receiving the reaction."""
-        if (guild_id, user_id, author_id) not in self._cooldowns:
-            self._cooldowns[(guild_id, user_id, author_id)] = UserCooldowns()
+    def memory(self) -> int:
+        """Get the approximate memory used by the active cooldowns and their buckets, in bytes."""
+        # each cooldown holds a 3-tuple key of ints and a timestamp, shared with its bucket entry
+        return (
+            sys.getsizeof(self._adding)
+            + sys.getsizeof(self._removing)
+            + sys.getsizeof(self._buckets)
+            + sum(
+                sys.getsizeof(bucket) + len(bucket) * 64
+                for bucket in self._buckets.values()
+            )
+            + len(self) * (64 + 3 * 32 + 32)
+        )
+
+    def _cooldown(self, guild_id: int, is_add: bool) -> int:
+        """Get a guild's current adding or removing cooldown, in seconds."""
+        limits = self.guilds[guild_id].limits
+        return limits.adding_cooldown if is_add else limits.removing_cooldown
 
     def start_cooldown(
         self, guild_id: int, user_id: int, author_id: int, event: ReactionEvent
@@ -51,15 +70,15 @@ class CooldownManager:
             The ID of the user receiving the reaction.
         event: `ReactionEvent`
             The event type that triggered the cooldown."""
-        self.ensure_cooldown(guild_id, user_id, author_id)
-        if event.is_add:
-            self._cooldowns[(guild_id, user_id, author_id)].add_cooldown_began = int(
-                time.time()
-            )
-        else:
-            self._cooldowns[(guild_id, user_id, author_id)].remove_cooldown_began = int(
-                time.time()
-            )
+        cooldown = self._cooldown(guild_id, event.is_add)
+        if cooldown <= 0:
+            return
+
+        now = int(time.time())
+        key = (guild_id, user_id, author_id)
+        (self._adding if event.is_add else self._removing)[key] = now
+        bucket = (now + cooldown) // COOLDOWN_SWEEP_INTERVAL
+        self._buckets.setdefault(bucket, []).append((event.is_add, key, now))
 
     def end_cooldown(
         self, guild_id: int, user_id: int, author_id: int, event: ReactionEvent
@@ -76,11 +95,10 @@ class CooldownManager:
             The ID of the user receiving the reaction.
         event: `ReactionEvent`
             The event type that triggered the cooldown."""
-        self.ensure_cooldown(guild_id, user_id, author_id)
-        if event.is_add:
-            self._cooldowns[(guild_id, user_id, author_id)].add_cooldown_began = 0
-        else:
-            self._cooldowns[(guild_id, user_id, author_id)].remove_cooldown_began = 0
+        # its bucket entry is skipped when swept
+        (self._adding if event.is_add else self._removing).pop(
+            (guild_id, user_id, author_id), None
+        )
 
     def is_cooldown_complete(
         self, guild_id: int, user_id: int, author_id: int, event: ReactionEvent
@@ -97,17 +115,35 @@ class CooldownManager:
             The ID of the user receiving the reaction.
         event: `ReactionEvent`
             The event type that triggered the cooldown."""
-        self.ensure_cooldown(guild_id, user_id, author_id)
-        # does not need to set it back to 0 because if the user isnt on cooldown anymore it makes no difference when checking: will still be true either way.
-        if event.is_add:
-            return (
-                int(time.time())
-                - self._cooldowns[(guild_id, user_id, author_id)].add_cooldown_began
-                >= self.guilds[guild_id].limits.adding_cooldown
-            )
-        else:
-            return (
-                int(time.time())
-                - self._cooldowns[(guild_id, user_id, author_id)].remove_cooldown_began
-                >= self.guilds[guild_id].limits.removing_cooldown
-            )
+        began = (self._adding if event.is_add else self._removing).get(
+            (guild_id, user_id, author_id)
+        )
+        # expired cooldowns that have not been swept yet still compare as complete
+        return (
+            began is None
+            or int(time.time()) - began >= self._cooldown(guild_id, event.is_add)
+        )
+
+    @tasks.loop(seconds=COOLDOWN_SWEEP_INTERVAL)
+    async def sweep(self):
+        """Drop the cooldowns in the buckets that have expired.
+
+        Runs every `COOLDOWN_SWEEP_INTERVAL` seconds. A cooldown that is still active because its guild lengthened its cooldown since it began is filed again in a later bucket. Cooldowns of guilds that are no longer resident are dropped."""
+        now = int(time.time())
+        current = now // COOLDOWN_SWEEP_INTERVAL
+        for bucket in [bucket for bucket in self._buckets if bucket < current]:
+            for is_add, key, began in self._buckets.pop(bucket):
+                cooldowns = self._adding if is_add else self._removing
+                # ended, or restarted and filed again
+                if cooldowns.get(key) != began:
+                    continue
+
+                guild = self.guilds.resident.get(key[0])
+                cooldown = 0 if guild is None else self._cooldown(key[0], is_add)
+                expiry_bucket = (began + cooldown) // COOLDOWN_SWEEP_INTERVAL
+                if expiry_bucket < current:
+                    del cooldowns[key]
+                else:
+                    self._buckets.setdefault(expiry_bucket, []).append(
+                        (is_add, key, began)
+                    )
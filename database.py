@@ -0,0 +1,159 @@
+"""Contains the ConnectionManager class, which owns the long-lived SQLite connections used across the bot."""
+
+import os
+import queue
+import sqlite3
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable
+
+from db_create import create_db
+from config import DB, DB_READERS, DB_CACHE_SIZE, DB_MMAP_SIZE, DB_STATEMENT_CACHE
+
+
+class ConnectionManager:
+    """Class that owns a single writer connection and a pool of read-only connections to the database.
+
+    The database runs in WAL mode, so readers see the last committed state and never wait on the writer.
+    Each connection keeps a cache of prepared statements, so queries should use constant SQL text with parameters.
+
+    From coroutines, use `run_read` and `run_write`, which run the query on the reader thread pool or the dedicated writer thread so the event loop is never blocked on SQLite.
+
+    Parameters
+    ----------
+    db_filename: `str`, optional
+        The name of the database file. Defaults to "aura_data.db".
+    readers: `int`, optional
+        The number of pooled read-only connections. Defaults to `DB_READERS`.
+    """
+
+    def __init__(self, db_filename: str = DB, readers: int = DB_READERS) -> None:
+        """Open the writer and reader connections, creating the database if it does not exist."""
+        self.db_filename = db_filename
+
+        exists = os.path.exists(db_filename)
+        self.writer = self._connect(db_filename)
+        self.writer.execute("PRAGMA journal_mode = WAL")
+        # also applies any schema migrations missing from an older database
+        create_db(self.writer)
+        if not exists:
+            print(f"Database {db_filename} was not found, so it was created.")
+
+        self._readers = queue.LifoQueue()
+        for _ in range(readers):
+            self._readers.put(self._connect(f"file:{db_filename}?mode=ro", uri=True))
+
+        self._write_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="db-writer"
+        )
+        self._read_executor = ThreadPoolExecutor(
+            max_workers=readers, thread_name_prefix="db-reader"
+        )
+
+    @staticmethod
+    def _connect(database: str, uri: bool = False) -> sqlite3.Connection:
+        """Open a connection with the shared pragmas applied."""
+        conn = sqlite3.connect(
+            database,
+            uri=uri,
+            check_same_thread=False,
+            cached_statements=DB_STATEMENT_CACHE,
+        )
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA cache_size = {-DB_CACHE_SIZE}")
+        conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA busy_timeout = 5000")
+        return conn
+
+    @contextmanager
+    def reader(self):
+        """Borrow a read-only connection from the pool for the duration of the `with` block.
+
+        Yields
+        ------
+        `sqlite3.Connection`
+            A read-only connection."""
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Run the `with` block in a transaction on the writer connection.
+
+        Commits if the block completes and rolls back if it raises. Must only be used from one thread at a time.
+
+        Yields
+        ------
+        `sqlite3.Cursor`
+            A cursor on the writer connection."""
+        cursor = self.writer.cursor()
+        try:
+            yield cursor
+            self.writer.commit()
+        except BaseException:
+            self.writer.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    async def run_read(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Run `func(conn, *args)` with a pooled read-only connection on the reader thread pool.
+
+        Parameters
+        ----------
+        func: `Callable`
+            The query function. Receives a `sqlite3.Connection` followed by `args`.
+        *args: `Any`
+            The arguments to pass to `func`. Must not be mutated by the event loop while the query runs.
+
+        Returns
+        -------
+        `Any`
+            The return value of `func`."""
+
+        def run():
+            with self.reader() as conn:
+                return func(conn, *args)
+
+        return await asyncio.get_running_loop().run_in_executor(
+            self._read_executor, run
+        )
+
+    async def run_write(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Run `func(cursor, *args)` in a transaction on the dedicated writer thread.
+
+        Writes run one at a time in the order they were submitted.
+
+        Parameters
+        ----------
+        func: `Callable`
+            The write function. Receives a `sqlite3.Cursor` on the writer connection followed by `args`.
+        *args: `Any`
+            The arguments to pass to `func`. Must not be mutated by the event loop while the write runs.
+
+        Returns
+        -------
+        `Any`
+            The return value of `func`."""
+
+        def run():
+            with self.transaction() as cursor:
+                return func(cursor, *args)
+
+        return await asyncio.get_running_loop().run_in_executor(
+            self._write_executor, run
+        )
+
+    def close(self) -> None:
+        """Wait for queued queries, then close every connection. Checkpoints the WAL into the main database file."""
+        self._write_executor.shutdown(wait=True)
+        self._read_executor.shutdown(wait=True)
+        while not self._readers.empty():
+            self._readers.get().close()
+        self.writer.close()
@@ -1,253 +1,440 @@
 """Provides functions to load and save data to a SQLite database."""
 
 import sqlite3
+import datetime
 import time
 
 from models import *
-from db_create import create_db
-from config import DB
-
+from database import ConnectionManager
+from config import (
+    SNAPSHOT_RAW_RETENTION,
+    SNAPSHOT_DAILY_RETENTION,
+    SNAPSHOT_WEEKLY_RETENTION,
+    SNAPSHOT_MONTHLY_RETENTION,
+)
+
+# days each snapshot tier is kept before it is rolled up into the next, or deleted for the last
+SNAPSHOT_RETENTION = {
+    SnapshotResolution.RAW: SNAPSHOT_RAW_RETENTION,
+    SnapshotResolution.DAILY: SNAPSHOT_DAILY_RETENTION,
+    SnapshotResolution.WEEKLY: SNAPSHOT_WEEKLY_RETENTION,
+    SnapshotResolution.MONTHLY: SNAPSHOT_MONTHLY_RETENTION,
+}
+
+
+def _guild_from_row(row: tuple) -> Guild:
+    """Build a `Guild` without users, reactions or limits from a `guilds` row."""
+    return Guild(
+        info_msg_id=row[1],
+        board_msg_id=row[2],
+        msgs_channel_id=row[3],
+        log_channel_id=row[4],
+        last_update=row[5],
+    )
+
+
+def _user_from_row(row: tuple) -> User:
+    """Build a `User` from a `users` row."""
+    return User(
+        aura=row[2],
+        aura_contribution=row[3],
+        num_pos_given=row[4],
+        num_pos_received=row[5],
+        num_neg_given=row[6],
+        num_neg_received=row[7],
+        opted_in=bool(row[8]),
+        giving_allowed=bool(row[9]),
+        receiving_allowed=bool(row[10]),
+    )
+
+
+def _limits_from_row(row: tuple) -> Limits:
+    """Build a `Limits` from a `limits` row."""
+    return Limits(
+        interval_long=row[1],
+        threshold_long=row[2],
+        interval_short=row[3],
+        threshold_short=row[4],
+        penalty=row[5],
+        adding_cooldown=row[6],
+        removing_cooldown=row[7],
+    )
+
+
+def load_data(db: ConnectionManager, active_since: int = None) -> dict[int, Guild]:
+    """Load the guild data from the SQLite database.
 
-def update_time_and_save(guild_id: int, guilds: dict[int, Guild]):
-    """Update the last update time for a guild and save the data.
+    Streams each table once, ordered by guild ID, and attaches the rows to their guild in a single pass.
+    Guilds with no limits row get the default limits. Rows belonging to a guild that does not exist are ignored.
 
     Parameters
     ----------
-    guild_id: `int`
-        The ID of the guild to update.
-    guilds: `Dict[int, Guild]`
-        A dictionary of guilds, where the key is the guild ID and the value is a `Guild` object.
+    db: `ConnectionManager`
+        The connection manager to read the data with.
+    active_since: `int`, optional
+        If given, only load guilds last updated at or after this timestamp.
     """
 
-    if guild_id in guilds:
-        guilds[guild_id].last_update = int(time.time())
-    save_data(guilds)
+    guilds = {}
+    if active_since is None:
+        guild_where = where = ""
+        params = ()
+    else:
+        guild_where = " WHERE last_update >= ?"
+        where = " WHERE guild_id IN (SELECT id FROM guilds WHERE last_update >= ?)"
+        params = (active_since,)
+
+    with db.reader() as conn:
+        start = time.perf_counter()
+        for guild_row in conn.execute(
+            f"SELECT * FROM guilds{guild_where} ORDER BY id", params
+        ):
+            guilds[guild_row[0]] = _guild_from_row(guild_row)
+        _log_load("guilds", len(guilds), start)
+
+        start = time.perf_counter()
+        count = 0
+        current_id = None
+        users = {}
+        for user_row in conn.execute(
+            f"SELECT * FROM users{where} ORDER BY guild_id", params
+        ):
+            if user_row[0] != current_id:
+                current_id = user_row[0]
+                users = guilds[current_id].users if current_id in guilds else {}
+            users[user_row[1]] = _user_from_row(user_row)
+            count += 1
+        _log_load("users", count, start)
+
+        start = time.perf_counter()
+        count = 0
+        for reaction_row in conn.execute(
+            f"SELECT * FROM reactions{where} ORDER BY guild_id", params
+        ):
+            if reaction_row[0] in guilds:
+                guilds[reaction_row[0]].reactions[reaction_row[1]] = EmojiReaction(
+                    points=reaction_row[2]
+                )
+            count += 1
+        _log_load("reactions", count, start)
+
+        start = time.perf_counter()
+        count = 0
+        for limit_row in conn.execute(
+            f"SELECT * FROM limits{where} ORDER BY guild_id", params
+        ):
+            if limit_row[0] in guilds:
+                guilds[limit_row[0]].limits = _limits_from_row(limit_row)
+            count += 1
+        _log_load("limits", count, start)
 
+    return guilds
+
+
+def _log_load(table: str, count: int, start: float) -> None:
+    """Print how long loading a table took."""
+    print(f"Loaded {count} rows from {table} in {time.perf_counter() - start:.2f}s.")
 
-def load_data(db_filename=DB) -> dict[int, Guild]:
-    """Load the guild data from the SQLite database.
+
+def load_guild_ids(db: ConnectionManager) -> set[int]:
+    """Load the IDs of every set up guild.
 
     Parameters
     ----------
-    db_filename: `str`, optional
-        The name of the database file to load the data from. Defaults to "aura_data.db".
+    db: `ConnectionManager`
+        The connection manager to read the data with.
     """
 
-    try:
-        with open(db_filename, "r"):
-            pass
-    except FileNotFoundError:
-        create_db()
-        print(f"Database {db_filename} was not found, so it was created.")
-        return {}
+    with db.reader() as conn:
+        return {row[0] for row in conn.execute("SELECT id FROM guilds")}
 
-    conn = sqlite3.connect(db_filename)
-    cursor = conn.cursor()
 
-    guilds = {}
+def load_guild(conn: sqlite3.Connection, guild_id: int) -> Guild:
+    """Load a single guild with its users, reactions and limits.
 
-    cursor.execute("SELECT * FROM guilds")
-    guild_rows = cursor.fetchall()
+    Parameters
+    ----------
+    conn: `sqlite3.Connection`
+        A read-only connection.
+    guild_id: `int`
+        The ID of the guild.
 
-    for guild_row in guild_rows:
-        guild_id = guild_row[0]
+    Returns
+    -------
+    `Guild`
+        The guild, or `None` if it is not set up.
+    """
 
-        cursor.execute("SELECT * FROM users WHERE guild_id = ?", (guild_id,))
-        user_rows = cursor.fetchall()
+    guild_row = conn.execute("SELECT * FROM guilds WHERE id = ?", (guild_id,)).fetchone()
+    if guild_row is None:
+        return None
 
-        users = {}
-        for user_row in user_rows:
-            users[user_row[1]] = User(
-                aura=user_row[2],
-                aura_contribution=user_row[3],
-                num_pos_given=user_row[4],
-                num_pos_received=user_row[5],
-                num_neg_given=user_row[6],
-                num_neg_received=user_row[7],
-                opted_in=bool(user_row[8]),
-                giving_allowed=bool(user_row[9]),
-                receiving_allowed=bool(user_row[10]),
-            )
+    guild = _guild_from_row(guild_row)
+    for user_row in conn.execute("SELECT * FROM users WHERE guild_id = ?", (guild_id,)):
+        guild.users[user_row[1]] = _user_from_row(user_row)
+    for reaction_row in conn.execute(
+        "SELECT * FROM reactions WHERE guild_id = ?", (guild_id,)
+    ):
+        guild.reactions[reaction_row[1]] = EmojiReaction(points=reaction_row[2])
+    limit_row = conn.execute(
+        "SELECT * FROM limits WHERE guild_id = ?", (guild_id,)
+    ).fetchone()
+    if limit_row is not None:
+        guild.limits = _limits_from_row(limit_row)
 
-        cursor.execute("SELECT * FROM reactions WHERE guild_id = ?", (guild_id,))
-        reaction_rows = cursor.fetchall()
+    return guild
 
-        reactions = {}
-        for reaction_row in reaction_rows:
-            reactions[reaction_row[1]] = EmojiReaction(points=reaction_row[2])
 
-        cursor.execute("SELECT * FROM limits WHERE guild_id = ?", (guild_id,))
-        limit_row = cursor.fetchone()
+def prepare_changes(
+    guilds: dict[int, Guild],
+    user_info: dict[int, GlobalUser],
+    changes: PendingChanges,
+) -> dict[str, list[tuple]]:
+    """Build the parameter rows for every pending change.
 
-        limits = Limits(
-            interval_long=limit_row[1],
-            threshold_long=limit_row[2],
-            interval_short=limit_row[3],
-            threshold_short=limit_row[4],
-            penalty=limit_row[5],
-            adding_cooldown=limit_row[6],
-            removing_cooldown=limit_row[7],
-        )
+    Must run on the event loop so that the rows are a consistent copy of `guilds`. Rows that were marked as changed but no longer exist in `guilds` become deletions.
 
-        guilds[guild_id] = Guild(
-            users=users,
-            reactions=reactions,
-            limits=limits,
-            info_msg_id=guild_row[1],
-            board_msg_id=guild_row[2],
-            msgs_channel_id=guild_row[3],
-            log_channel_id=guild_row[4],
-            last_update=guild_row[5],
+    Parameters
+    ----------
+    guilds: `Dict[int, Guild]`
+        A dictionary of guilds, where the key is the guild ID and the value is a `Guild` object.
+    user_info: `dict[int, GlobalUser]`
+        A dictionary of user information, where the key is the user ID and the value is a `GlobalUser` object.
+    changes: `PendingChanges`
+        The rows that have changed since the last flush.
+
+    Returns
+    -------
+    `dict[str, list[tuple]]`
+        The parameter rows for each statement in `write_changes`.
+    """
+
+    rows = {
+        "deleted_guilds": [(guild_id,) for guild_id in changes.deleted_guilds],
+        "cleared_users": [(guild_id,) for guild_id in changes.cleared_users],
+        "guilds": [],
+        "deleted_users": [],
+        "users": [],
+        "deleted_reactions": [],
+        "reactions": [],
+        "limits": [],
+        "user_info": [],
+    }
+
+    for guild_id in changes.guilds:
+        if guild_id in guilds:
+            guild = guilds[guild_id]
+            rows["guilds"].append(
+                (
+                    guild_id,
+                    guild.info_msg_id,
+                    guild.board_msg_id,
+                    guild.msgs_channel_id,
+                    guild.log_channel_id,
+                    guild.last_update,
+                )
+            )
+
+    for guild_id, user_id in changes.users:
+        if guild_id not in guilds:
+            continue
+        user = guilds[guild_id].users.get(user_id)
+        if user is None:
+            rows["deleted_users"].append((guild_id, user_id))
+            continue
+        rows["users"].append(
+            (
+                guild_id,
+                user_id,
+                user.aura,
+                user.aura_contribution,
+                user.num_pos_given,
+                user.num_pos_received,
+                user.num_neg_given,
+                user.num_neg_received,
+                int(user.opted_in),
+                int(user.giving_allowed),
+                int(user.receiving_allowed),
+            )
         )
 
-    conn.close()
-    return guilds
+    for guild_id, emoji in changes.reactions:
+        if guild_id not in guilds:
+            continue
+        reaction = guilds[guild_id].reactions.get(emoji)
+        if reaction is None:
+            rows["deleted_reactions"].append((guild_id, emoji))
+        else:
+            rows["reactions"].append((guild_id, emoji, reaction.points))
+
+    for guild_id in changes.limits:
+        if guild_id in guilds:
+            limits = guilds[guild_id].limits
+            rows["limits"].append(
+                (
+                    guild_id,
+                    limits.interval_long,
+                    limits.threshold_long,
+                    limits.interval_short,
+                    limits.threshold_short,
+                    limits.penalty,
+                    limits.adding_cooldown,
+                    limits.removing_cooldown,
+                )
+            )
 
+    for user_id in changes.user_info:
+        user = user_info.get(user_id)
+        if user is not None:
+            rows["user_info"].append((user_id, user.avatar_url, int(user.bot)))
 
-def save_data(guilds: dict[int, Guild], db_filename=DB):
-    """Save the guild data to the SQLite database, ensuring deletions are handled."""
+    return rows
 
-    try:
-        with open(db_filename, "r"):
-            pass
-    except FileNotFoundError:
-        create_db()
-        print(f"Database {db_filename} was not found, so it was created.")
 
-    conn = sqlite3.connect(db_filename)
-    cursor = conn.cursor()
+def write_changes(
+    cursor: sqlite3.Cursor, rows: dict[str, list[tuple]], compacted_seq: int
+) -> None:
+    """Write the rows built by `prepare_changes` to the database and fold the aura journal.
 
-    # **1. Remove guilds that no longer exist in the dictionary**
-    cursor.execute("SELECT id FROM guilds")
-    existing_guilds = {row[0] for row in cursor.fetchall()}
-    current_guilds = set(guilds.keys())
+    Parameters
+    ----------
+    cursor: `sqlite3.Cursor`
+        A cursor on the writer connection, inside a transaction.
+    rows: `dict[str, list[tuple]]`
+        The parameter rows returned by `prepare_changes`.
+    compacted_seq: `int`
+        The sequence number of the last journal entry reflected in `rows`. Entries up to it are deleted.
+    """
 
-    deleted_guilds = existing_guilds - current_guilds
-    for guild_id in deleted_guilds:
-        cursor.execute("DELETE FROM guilds WHERE id = ?", (guild_id,))
-        cursor.execute("DELETE FROM users WHERE guild_id = ?", (guild_id,))
-        cursor.execute("DELETE FROM reactions WHERE guild_id = ?", (guild_id,))
-        cursor.execute("DELETE FROM limits WHERE guild_id = ?", (guild_id,))
+    # **1. Remove deleted guilds and cleared users**
+    cursor.executemany("DELETE FROM guilds WHERE id = ?", rows["deleted_guilds"])
+    cursor.executemany("DELETE FROM users WHERE guild_id = ?", rows["deleted_guilds"])
+    cursor.executemany(
+        "DELETE FROM reactions WHERE guild_id = ?", rows["deleted_guilds"]
+    )
+    cursor.executemany("DELETE FROM limits WHERE guild_id = ?", rows["deleted_guilds"])
+    cursor.executemany("DELETE FROM users WHERE guild_id = ?", rows["cleared_users"])
 
     # **2. Insert or update guilds**
-    for guild_id, guild in guilds.items():
-        cursor.execute(
-            """
-            INSERT OR REPLACE INTO guilds (id, info_msg_id, board_msg_id, msgs_channel_id, log_channel_id, last_update)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """,
-            (
-                guild_id,
-                guild.info_msg_id,
-                guild.board_msg_id,
-                guild.msgs_channel_id,
-                guild.log_channel_id,
-                guild.last_update,
-            ),
-        )
+    cursor.executemany(
+        """
+        INSERT OR REPLACE INTO guilds (id, info_msg_id, board_msg_id, msgs_channel_id, log_channel_id, last_update)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """,
+        rows["guilds"],
+    )
+
+    # **3. Handle users**
+    cursor.executemany(
+        "DELETE FROM users WHERE guild_id = ? AND user_id = ?", rows["deleted_users"]
+    )
+    cursor.executemany(
+        """
+        INSERT OR REPLACE INTO users (guild_id, user_id, aura, aura_contribution, num_pos_given, num_pos_received,
+        num_neg_given, num_neg_received, opted_in, giving_allowed, receiving_allowed)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+        rows["users"],
+    )
+
+    # **4. Handle reactions**
+    cursor.executemany(
+        "DELETE FROM reactions WHERE guild_id = ? AND emoji = ?",
+        rows["deleted_reactions"],
+    )
+    cursor.executemany(
+        """
+        INSERT OR REPLACE INTO reactions (guild_id, emoji, points)
+        VALUES (?, ?, ?)
+    """,
+        rows["reactions"],
+    )
+
+    # **5. Update limits**
+    cursor.executemany(
+        """
+        INSERT OR REPLACE INTO limits (guild_id, interval_long, threshold_long, interval_short, threshold_short, penalty,
+        adding_cooldown, removing_cooldown)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+        rows["limits"],
+    )
+
+    # **6. Update user info**
+    save_user_data(cursor, rows["user_info"])
+
+    # **7. Fold the journal**
+    cursor.execute(
+        "UPDATE journal_state SET compacted_seq = ? WHERE id = 0", (compacted_seq,)
+    )
+    cursor.execute("DELETE FROM aura_journal WHERE seq <= ?", (compacted_seq,))
+
+
+def append_journal(cursor: sqlite3.Cursor, entries: list[tuple]) -> None:
+    """Append entries to the aura journal.
 
-        # **3. Handle users**
-        cursor.execute("SELECT user_id FROM users WHERE guild_id = ?", (guild_id,))
-        existing_users = {row[0] for row in cursor.fetchall()}
-        current_users = set(guild.users.keys())
+    Parameters
+    ----------
+    cursor: `sqlite3.Cursor`
+        A cursor on the writer connection, inside a transaction.
+    entries: `list[tuple]`
+        The `(seq, guild_id, user_id, aura, aura_contribution, num_pos_given, num_pos_received, num_neg_given, num_neg_received, created)` entries to append.
+    """
 
-        # Delete removed users
-        for user_id in existing_users - current_users:
-            cursor.execute(
-                "DELETE FROM users WHERE guild_id = ? AND user_id = ?",
-                (guild_id, user_id),
-            )
+    cursor.executemany(
+        """
+        INSERT OR IGNORE INTO aura_journal (seq, guild_id, user_id, aura, aura_contribution, num_pos_given,
+        num_pos_received, num_neg_given, num_neg_received, created)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+        entries,
+    )
 
-        # Insert/update users
-        for user_id, user in guild.users.items():
-            cursor.execute(
-                """
-                INSERT OR REPLACE INTO users (guild_id, user_id, aura, aura_contribution, num_pos_given, num_pos_received,
-                num_neg_given, num_neg_received, opted_in, giving_allowed, receiving_allowed)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-                (
-                    guild_id,
-                    user_id,
-                    user.aura,
-                    user.aura_contribution,
-                    user.num_pos_given,
-                    user.num_pos_received,
-                    user.num_neg_given,
-                    user.num_neg_received,
-                    int(user.opted_in),
-                    int(user.giving_allowed),
-                    int(user.receiving_allowed),
-                ),
-            )
 
-        # **4. Handle reactions**
-        cursor.execute("SELECT emoji FROM reactions WHERE guild_id = ?", (guild_id,))
-        existing_reactions = {row[0] for row in cursor.fetchall()}
-        current_reactions = set(guild.reactions.keys())
+def load_journal(db: ConnectionManager) -> tuple[int, list[tuple]]:
+    """Load the aura journal entries that have not been folded into the users table yet.
 
-        # Delete removed reactions
-        for emoji in existing_reactions - current_reactions:
-            cursor.execute(
-                "DELETE FROM reactions WHERE guild_id = ? AND emoji = ?",
-                (guild_id, emoji),
-            )
+    Parameters
+    ----------
+    db: `ConnectionManager`
+        The connection manager to read the data with.
 
-        # Insert/update reactions
-        for emoji, reaction in guild.reactions.items():
-            cursor.execute(
-                """
-                INSERT OR REPLACE INTO reactions (guild_id, emoji, points)
-                VALUES (?, ?, ?)
-            """,
-                (guild_id, emoji, reaction.points),
-            )
+    Returns
+    -------
+    `tuple[int, list[tuple]]`
+        The sequence number of the last folded entry, and the unfolded entries in sequence order.
+    """
 
-        # **5. Update limits**
-        cursor.execute(
+    with db.reader() as conn:
+        compacted_seq = conn.execute(
+            "SELECT compacted_seq FROM journal_state WHERE id = 0"
+        ).fetchone()[0]
+        entries = conn.execute(
             """
-            INSERT OR REPLACE INTO limits (guild_id, interval_long, threshold_long, interval_short, threshold_short, penalty,
-            adding_cooldown, removing_cooldown)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            SELECT seq, guild_id, user_id, aura, aura_contribution, num_pos_given,
+            num_pos_received, num_neg_given, num_neg_received, created
+            FROM aura_journal
+            WHERE seq > ?
+            ORDER BY seq
         """,
-            (
-                guild_id,
-                guild.limits.interval_long,
-                guild.limits.threshold_long,
-                guild.limits.interval_short,
-                guild.limits.threshold_short,
-                guild.limits.penalty,
-                guild.limits.adding_cooldown,
-                guild.limits.removing_cooldown,
-            ),
-        )
+            (compacted_seq,),
+        ).fetchall()
 
-    conn.commit()
-    conn.close()
+    return compacted_seq, entries
 
 
-def load_user_data(db_filename=DB) -> dict[int, GlobalUser]:
+def load_user_data(db: ConnectionManager) -> dict[int, GlobalUser]:
     """Load the user data from the SQLite database.
 
     Parameters
     ----------
-    db_filename: `str`, optional
-        The name of the database file to load the data from. Defaults to "aura_data.db".
+    db: `ConnectionManager`
+        The connection manager to read the data with.
     """
 
-    try:
-        with open(db_filename, "r"):
-            pass
-    except FileNotFoundError:
-        create_db()
-        print(f"Database {db_filename} was not found, so it was created.")
-        return {}
+    with db.reader() as conn:
+        user_rows = conn.execute("SELECT * FROM user_info").fetchall()
 
-    conn = sqlite3.connect(db_filename)
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT * FROM user_info")
-    user_rows = cursor.fetchall()
     user_info = {}
     for user_row in user_rows:
         user_id = user_row[0]
@@ -255,39 +442,360 @@ def load_user_data(db_filename=DB) -> dict[int, GlobalUser]:
         bot = bool(user_row[2])
         user_info[user_id] = GlobalUser(user_id=user_id, avatar_url=avatar_url, bot=bot)
 
-    conn.close()
     return user_info
 
 
-def save_user_data(user_info: dict[int, GlobalUser], db_filename=DB):
+def save_user_data(cursor: sqlite3.Cursor, rows: list[tuple]):
     """Save the user info data to the SQLite database.
 
     Parameters
     ----------
-    user_info: `Dict[int, GlobalUser]`
-        A dictionary of user info, where the key is the user ID and the value is a `GlobalUser` object.
-    db_filename: `str`, optional
-        The name of the database file to save the data to. Defaults to "aura_data.db".
+    cursor: `sqlite3.Cursor`
+        A cursor on the writer connection, inside a transaction.
+    rows: `list[tuple]`
+        The `(user_id, avatar_url, bot)` rows to save.
+    """
+
+    cursor.executemany(
+        """
+        INSERT OR REPLACE INTO user_info (user_id, avatar_url, bot)
+        VALUES (?, ?, ?)
+    """,
+        rows,
+    )
+
+
+def load_bans(db: ConnectionManager) -> list[tuple[int, int, int]]:
+    """Load the snapshot of temporary bans that had not expired when it was saved.
+
+    Parameters
+    ----------
+    db: `ConnectionManager`
+        The connection manager to read the data with.
+
+    Returns
+    -------
+    `list[tuple[int, int, int]]`
+        The `(guild_id, user_id, expires)` of each ban.
+    """
+
+    with db.reader() as conn:
+        return conn.execute(
+            "SELECT guild_id, user_id, expires FROM temp_bans"
+        ).fetchall()
+
+
+def save_bans(cursor: sqlite3.Cursor, rows: list[tuple[int, int, int]]) -> None:
+    """Replace the snapshot of temporary bans.
+
+    Parameters
+    ----------
+    cursor: `sqlite3.Cursor`
+        A cursor on the writer connection, inside a transaction.
+    rows: `list[tuple[int, int, int]]`
+        The `(guild_id, user_id, expires)` of each active ban.
+    """
+
+    cursor.execute("DELETE FROM temp_bans")
+    cursor.executemany(
+        "INSERT INTO temp_bans (guild_id, user_id, expires) VALUES (?, ?, ?)", rows
+    )
+
+
+def load_message_author(conn: sqlite3.Connection, message_id: int) -> int | None:
+    """Load the saved author of a message.
+
+    Parameters
+    ----------
+    conn: `sqlite3.Connection`
+        A read-only connection.
+    message_id: `int`
+        The ID of the message.
+
+    Returns
+    -------
+    `int | None`
+        The ID of the author of the message, or `None` if it was not saved.
+    """
+
+    row = conn.execute(
+        "SELECT author_id FROM message_authors WHERE message_id = ?", (message_id,)
+    ).fetchone()
+    return row[0] if row is not None else None
+
+
+def save_message_authors(cursor: sqlite3.Cursor, rows: list[tuple[int, int]]) -> None:
+    """Save the authors of messages. A message's author never changes, so messages that are already saved are skipped.
+
+    Parameters
+    ----------
+    cursor: `sqlite3.Cursor`
+        A cursor on the writer connection, inside a transaction.
+    rows: `list[tuple[int, int]]`
+        The `(message_id, author_id)` of each message.
+    """
+
+    cursor.executemany(
+        "INSERT OR IGNORE INTO message_authors (message_id, author_id) VALUES (?, ?)",
+        rows,
+    )
+
+
+def prune_message_authors(
+    cursor: sqlite3.Cursor, oldest_id: int, max_rows: int
+) -> int:
+    """Delete the saved authors of messages older than a snowflake, then of the oldest messages over a row limit.
+
+    Message IDs are snowflakes, so ordering by ID orders by age.
+
+    Parameters
+    ----------
+    cursor: `sqlite3.Cursor`
+        A cursor on the writer connection, inside a transaction.
+    oldest_id: `int`
+        The smallest message ID to keep.
+    max_rows: `int`
+        The most messages to keep.
+
+    Returns
+    -------
+    `int`
+        The number of messages deleted.
+    """
+
+    cursor.execute("DELETE FROM message_authors WHERE message_id < ?", (oldest_id,))
+    deleted = cursor.rowcount
+    cursor.execute(
+        """
+        DELETE FROM message_authors WHERE message_id < (
+            SELECT message_id FROM message_authors
+            ORDER BY message_id DESC LIMIT 1 OFFSET ?
+        )
+    """,
+        (max_rows - 1,),
+    )
+    return deleted + cursor.rowcount
+
+
+def snapshot_resolution(days: float) -> SnapshotResolution:
+    """Get the coarsest snapshot tier that answers a query for a point this many days ago.
+
+    Each tier only holds snapshots older than every finer tier's retention, so finer tiers have nothing at or before that point.
+
+    Parameters
+    ----------
+    days: `float`
+        How many days ago the point in time is.
+
+    Returns
+    -------
+    `SnapshotResolution`
+        The tier the point falls in."""
+    cutoff = 0
+    for resolution, retention in SNAPSHOT_RETENTION.items():
+        cutoff += retention
+        if days <= cutoff:
+            return resolution
+    return SnapshotResolution.MONTHLY
+
+
+def build_baselines(cursor: sqlite3.Cursor, timeframes: dict[str, int]) -> int:
+    """Rebuild every user's baseline aura for each timeframe: their latest snapshot at or before the start of the period.
+
+    Each baseline is found with one index seek per user. Users with no snapshot that old are left out.
+
+    Parameters
+    ----------
+    cursor: `sqlite3.Cursor`
+        A cursor on the writer connection, inside a transaction.
+    timeframes: `dict[str, int]`
+        The number of days covered by each timeframe.
+
+    Returns
+    -------
+    `int`
+        The number of baselines built.
+    """
+
+    built = 0
+    cursor.execute("DELETE FROM period_baselines")
+    for timeframe, days in timeframes.items():
+        cursor.execute(
+            """
+            INSERT INTO period_baselines (guild_id, timeframe, user_id, aura)
+            SELECT guild_id, ?, user_id, aura FROM (
+                SELECT u.guild_id, u.user_id, (
+                    SELECT s.aura FROM user_snapshots s
+                    WHERE s.guild_id = u.guild_id AND s.user_id = u.user_id
+                    AND s.snapshot_time <= DATETIME('now', ?) AND s.resolution >= ?
+                    ORDER BY s.snapshot_time DESC
+                    LIMIT 1
+                ) AS aura
+                FROM users u
+            )
+            WHERE aura IS NOT NULL
+        """,
+            (timeframe, f"-{days} days", snapshot_resolution(days).level),
+        )
+        built += cursor.rowcount
+
+    cursor.execute(
+        "UPDATE baseline_state SET built = ? WHERE id = 0", (int(time.time()),)
+    )
+    return built
+
+
+def load_baselines(
+    conn: sqlite3.Connection, guild_id: int
+) -> dict[str, dict[int, int]]:
+    """Load a guild's baselines for every timeframe.
+
+    Parameters
+    ----------
+    conn: `sqlite3.Connection`
+        A read-only connection.
+    guild_id: `int`
+        The ID of the guild.
+
+    Returns
+    -------
+    `dict[str, dict[int, int]]`
+        Maps each timeframe to each user's baseline aura.
     """
 
-    try:
-        with open(db_filename, "r"):
-            pass
-    except FileNotFoundError:
-        create_db()
-        print(f"Database {db_filename} was not found, so it was created.")
+    baselines = {}
+    for timeframe, user_id, aura in conn.execute(
+        "SELECT timeframe, user_id, aura FROM period_baselines WHERE guild_id = ?",
+        (guild_id,),
+    ):
+        baselines.setdefault(timeframe, {})[user_id] = aura
+    return baselines
+
 
-    conn = sqlite3.connect(db_filename)
-    cursor = conn.cursor()
+def load_baseline_state(db: ConnectionManager) -> int:
+    """Load when the baselines were last built.
+
+    Parameters
+    ----------
+    db: `ConnectionManager`
+        The connection manager to read with.
+
+    Returns
+    -------
+    `int`
+        The timestamp of the last build, or 0 if they never have been.
+    """
+
+    with db.reader() as conn:
+        row = conn.execute("SELECT built FROM baseline_state WHERE id = 0").fetchone()
+    return row[0]
+
+
+def roll_up_snapshots(cursor: sqlite3.Cursor) -> int:
+    """Roll each snapshot tier's expired snapshots up into the next tier, and delete expired snapshots from the last.
+
+    Rolling up keeps only a user's last snapshot in each period of the next tier. As snapshots are only taken on change, that snapshot still gives the user's stats from then until their next one.
+    An existing user's latest snapshot is never deleted.
+
+    Parameters
+    ----------
+    cursor: `sqlite3.Cursor`
+        A cursor on the writer connection, inside a transaction.
 
-    for user_id, user in user_info.items():
+    Returns
+    -------
+    `int`
+        The number of snapshots deleted.
+    """
+    deleted = 0
+    tiers = list(SNAPSHOT_RETENTION.items())
+    age = 0
+
+    # snapshot IDs increase with snapshot_time, so the highest ID in a group is its latest snapshot
+    for (resolution, retention), (coarser, _) in zip(tiers, tiers[1:]):
+        age += retention
+        cutoff = f"-{age} days"
+        cursor.execute(
+            """
+            DELETE FROM user_snapshots
+            WHERE resolution = ? AND snapshot_time < DATETIME('now', ?)
+            AND id NOT IN (
+                SELECT MAX(id) FROM user_snapshots
+                WHERE resolution = ? AND snapshot_time < DATETIME('now', ?)
+                GROUP BY guild_id, user_id, STRFTIME(?, snapshot_time)
+            )
+        """,
+            (resolution.level, cutoff, resolution.level, cutoff, coarser.period),
+        )
+        deleted += cursor.rowcount
         cursor.execute(
             """
-            INSERT OR REPLACE INTO user_info (user_id, avatar_url, bot)
-            VALUES (?, ?, ?)
+            UPDATE user_snapshots SET resolution = ?
+            WHERE resolution = ? AND snapshot_time < DATETIME('now', ?)
         """,
-            (user_id, user.avatar_url, int(user.bot)),
+            (coarser.level, resolution.level, cutoff),
+        )
+
+    # users that no longer exist lose their last snapshot too
+    last, retention = tiers[-1]
+    cutoff = f"-{age + retention} days"
+    cursor.execute(
+        """
+        DELETE FROM user_snapshots
+        WHERE resolution = ? AND snapshot_time < DATETIME('now', ?)
+        AND id NOT IN (
+            SELECT MAX(s.id)
+            FROM user_snapshots s
+            JOIN users u ON u.guild_id = s.guild_id AND u.user_id = s.user_id
+            WHERE s.resolution = ? AND s.snapshot_time < DATETIME('now', ?)
+            GROUP BY s.guild_id, s.user_id
+        )
+    """,
+        (last.level, cutoff, last.level, cutoff),
+    )
+    deleted += cursor.rowcount
+
+    return deleted
+
+
+def take_snapshots(cursor: sqlite3.Cursor) -> tuple[int, int]:
+    """Snapshot the stats of every user that changed since their previous snapshot, then roll up expired snapshots.
+
+    Parameters
+    ----------
+    cursor: `sqlite3.Cursor`
+        A cursor on the writer connection, inside a transaction.
+
+    Returns
+    -------
+    `tuple[int, int]`
+        The number of snapshots taken and the number deleted by the rollup.
+    """
+
+    cursor.execute(
+        """
+        INSERT INTO user_snapshots (
+            guild_id, user_id, aura, aura_contribution, 
+            num_pos_given, num_pos_received, num_neg_given, num_neg_received
         )
+        SELECT 
+            u.guild_id, u.user_id, u.aura, u.aura_contribution, 
+            u.num_pos_given, u.num_pos_received, u.num_neg_given, u.num_neg_received
+        FROM users u
+        LEFT JOIN user_snapshots s ON s.id = (
+            SELECT id FROM user_snapshots
+            WHERE guild_id = u.guild_id AND user_id = u.user_id
+            ORDER BY snapshot_time DESC
+            LIMIT 1
+        )
+        WHERE s.id IS NULL
+        OR s.aura != u.aura
+        OR s.aura_contribution != u.aura_contribution
+        OR s.num_pos_given != u.num_pos_given
+        OR s.num_pos_received != u.num_pos_received
+        OR s.num_neg_given != u.num_neg_given
+        OR s.num_neg_received != u.num_neg_received
+    """
+    )
 
-    conn.commit()
-    conn.close()
+    return cursor.rowcount, roll_up_snapshots(cursor)
@@ -4,19 +4,48 @@ Contains the Functions class, which provides various utility functions for the A
 
 import discord
 import datetime
-import sqlite3
-
-from config import UPDATE_INTERVAL, DB
+import json
+import math
+import time
+
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from config import (
+    BOARD_MAX_DELAY,
+    AVATAR_DEBOUNCE,
+    LEADERBOARD_PAGE_SIZE,
+    EMOJI_PAGE_SIZE,
+    PAGE_CACHE_SIZE,
+)
 from models import *
-from db_functions import save_user_data
+from database import ConnectionManager
+from guild_store import GuildStore
+from persistence import PersistenceManager
+from baselines import BaselineManager
+from single_flight import SingleFlight
+from negative_cache import NegativeCache
+
+# title suffix for each timeframe in `TIMEFRAME_DAYS`
+TIMEFRAMES = {
+    "day": " (Day Change)",
+    "week": " (Week Change)",
+    "month": " (Month Change)",
+    "quarter": " (Quarter Change)",
+    "year": " (Year Change)",
+}
 
 class Functions:
 
     def __init__(
         self,
         client: discord.Client,
-        guilds: dict[int, Guild],
+        db: ConnectionManager,
+        guilds: GuildStore,
         user_info: dict[int, GlobalUser],
+        persistence_manager: PersistenceManager,
+        baseline_manager: BaselineManager,
+        single_flight: SingleFlight,
     ):
         """Initialise the Functions class with the Discord client and guilds.
 
@@ -24,19 +53,100 @@ class Functions:
         ----------
         client: `discord.Client`
             The Discord client instance.
-        guilds: `dict[int, Guild]`
-            A dictionary of guilds, where the key is the guild ID and the value is a `Guild` object.
+        db: `ConnectionManager`
+            The connection manager used for database access.
+        guilds: `GuildStore`
+            The guild store, mapping guild IDs to `Guild` objects.
         user_info: `dict[int, GlobalUser]`
             A dictionary of user information, where the key is the user ID and the value is a `GlobalUser` object.
+        persistence_manager: `PersistenceManager`
+            The persistence manager, used to mark changed user information.
+        baseline_manager: `BaselineManager`
+            The baseline manager, used for timeframe leaderboards.
+        single_flight: `SingleFlight`
+            Coalesces concurrent fetches of the same user.
         """
 
         self.client = client
+        self.db = db
         self.guilds = guilds
         self.user_info = user_info
+        self.persistence_manager = persistence_manager
+        self.baseline_manager = baseline_manager
+        self.single_flight = single_flight
+        # users that could not be fetched
+        self.unresolved = NegativeCache()
+        # monotonic time each user's avatar was last recorded as changed
+        self.avatar_changed: dict[int, float] = {}
+        # fingerprint of the embed each persistent message was last sent or edited with
+        self.rendered: dict[int, int] = {}
+        self.edits_sent = 0
+        self.edits_skipped = 0
+        # (guild ID, list, page) -> (version, rendered page, page count), least recently used first
+        self.pages: OrderedDict[tuple[int, str, int], tuple] = OrderedDict()
+
+    @staticmethod
+    def fingerprint(embed: discord.Embed) -> int:
+        """Get a fingerprint of everything an embed displays.
+
+        Parameters
+        ----------
+        embed: `discord.Embed`
+            The embed.
+
+        Returns
+        -------
+        `int`
+            The fingerprint. Equal embeds have equal fingerprints."""
+        return hash(json.dumps(embed.to_dict(), sort_keys=True))
+
+    def record_render(self, message_id: int, embed: discord.Embed) -> None:
+        """Record the embed a persistent message was sent with, so identical edits to it are skipped.
+
+        Parameters
+        ----------
+        message_id: `int`
+            The ID of the message.
+        embed: `discord.Embed`
+            The embed the message was sent with."""
+        self.rendered[message_id] = self.fingerprint(embed)
+
+    async def edit_if_changed(
+        self, message: discord.PartialMessage, embed: discord.Embed
+    ) -> bool:
+        """Edit a persistent message to show an embed, unless it already shows an identical one.
+
+        Parameters
+        ----------
+        message: `discord.PartialMessage`
+            The message to edit.
+        embed: `discord.Embed`
+            The embed to show.
+
+        Returns
+        -------
+        `bool`
+            Whether the message was edited.
+
+        Raises
+        ------
+        `discord.DiscordException`
+            If the edit fails. The message is then edited on the next call."""
+        fingerprint = self.fingerprint(embed)
+        if self.rendered.get(message.id) == fingerprint:
+            self.edits_skipped += 1
+            return False
+
+        await message.edit(embed=embed)
+        self.rendered[message.id] = fingerprint
+        self.edits_sent += 1
+        return True
 
     def update_user_info(self, user: discord.User) -> None:
         """Update or create the user information for a given user.
 
+        Avatar changes are recorded at most once every `AVATAR_DEBOUNCE` seconds per user. Changed entries are written with the next flush.
+
         Parameters
         ----------
         user: `discord.User`
@@ -45,25 +155,29 @@ class Functions:
         if user is None:
             return
 
+        avatar_url = user.avatar.url if user.avatar else None
+
         if self.user_info.get(user.id) is None:
             self.user_info[user.id] = GlobalUser(
                 user_id=user.id,
-                avatar_url=user.avatar.url if user.avatar else None,
+                avatar_url=avatar_url,
                 bot=user.bot,
             )
-
-            save_user_data(self.user_info)
-        else:
-            prev_avatar = self.user_info[user.id].avatar_url
-            if prev_avatar != user.avatar.url:
-                self.user_info[user.id].avatar_url = (
-                    user.avatar.url if user.avatar else None
-                )
-                save_user_data(self.user_info)
+            self.persistence_manager.mark_user_info(user.id)
+        elif self.user_info[user.id].avatar_url != avatar_url:
+            now = time.monotonic()
+            last_changed = self.avatar_changed.get(user.id)
+            if last_changed is not None and now - last_changed < AVATAR_DEBOUNCE:
+                return
+            self.avatar_changed[user.id] = now
+            self.user_info[user.id].avatar_url = avatar_url
+            self.persistence_manager.mark_user_info(user.id)
 
     async def get_user_info(self, user_id: int) -> GlobalUser:
         """Get the user information for a given user ID.
 
+        Returns `None` for users that could not be fetched, without trying again until they expire from `unresolved`.
+
         Parameters
         ----------
         user_id: `int`
@@ -71,27 +185,35 @@ class Functions:
         """
         if user_id in self.user_info:
             return self.user_info[user_id]
-        else:
-            # fetch from discord
-            print(f"Fetching user {user_id} from API. Reason: User missing in cache.")
-            user = await self.client.fetch_user(user_id)
-            if user is None:
-                return None
-            new_user = GlobalUser(
-                user_id=user.id,
-                avatar_url=user.avatar.url if user.avatar else None,
-                bot=user.bot,
-            )
-            self.user_info[user_id] = new_user
+        if ("user", user_id) in self.unresolved:
+            return None
+        return await self.single_flight.run(
+            "user", user_id, self._fetch_user_info, user_id
+        )
 
-            save_user_data(self.user_info)
-            return new_user
+    async def _fetch_user_info(self, user_id: int) -> GlobalUser:
+        """Fetch a user from Discord and cache their information, or remember that they could not be fetched."""
+        print(f"Fetching user {user_id} from API. Reason: User missing in cache.")
+        try:
+            user = await self.client.fetch_user(user_id)
+        except discord.NotFound:
+            user = None
+        if user is None:
+            self.unresolved.add("user", user_id)
+            return None
+        new_user = GlobalUser(
+            user_id=user.id,
+            avatar_url=user.avatar.url if user.avatar else None,
+            bot=user.bot,
+        )
+        self.user_info[user_id] = new_user
+        self.persistence_manager.mark_user_info(user_id)
+        return new_user
 
-    # need to add pagination/multiple embeds
     async def get_leaderboard(
         self, guild_id: int, timeframe: str, persistent=False
     ) -> discord.Embed:
-        """Get the leaderboard for a guild.
+        """Get the top 99 of the leaderboard for a guild.
 
         Returns an embed with the leaderboard information.
 
@@ -100,7 +222,7 @@ class Functions:
         guild_id: `int`
             The ID of the guild.
         timeframe: `str`
-            The time period for the leaderboard ("all", "week", or "month").
+            The time period for the leaderboard: "all" or one of `TIMEFRAMES`.
         persistent: `bool`, optional
             Whether the leaderboard is persistent and should be edited in the future or not. Defaults to `False`.
 
@@ -108,149 +230,128 @@ class Functions:
         -------
         `discord.Embed`
             The embed containing the leaderboard information."""
+        embed, _ = await self._render_leaderboard(guild_id, timeframe, 0, 99, persistent)
+        return embed
+
+    async def get_leaderboard_page(
+        self, guild_id: int, timeframe: str, page: int
+    ) -> tuple[discord.Embed, int]:
+        """Get one page of the leaderboard for a guild. Rendered pages are cached until the guild's leaderboard changes.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The ID of the guild.
+        timeframe: `str`
+            The time period for the leaderboard: "all" or one of `TIMEFRAMES`.
+        page: `int`
+            The 0-based page.
+
+        Returns
+        -------
+        `tuple[discord.Embed, int]`
+            The embed containing the page, and the number of pages."""
+        # timeframe pages also depend on the baselines
+        version = (
+            self.guilds.versions.get(guild_id, 0),
+            self.baseline_manager.generation,
+        )
+        return await self._cached_page(
+            (guild_id, timeframe, page),
+            version,
+            lambda: self._render_leaderboard(
+                guild_id,
+                timeframe,
+                page * LEADERBOARD_PAGE_SIZE,
+                LEADERBOARD_PAGE_SIZE,
+            ),
+        )
+
+    async def _cached_page(
+        self,
+        key: tuple[int, str, int],
+        version: object,
+        render: Callable[[], Awaitable[tuple[discord.Embed, int]]],
+    ) -> tuple[discord.Embed, int]:
+        """Get a rendered page from the cache, or render and cache it if it is missing or its version has changed."""
+        cached = self.pages.get(key)
+        if cached is not None and cached[0] == version:
+            self.pages.move_to_end(key)
+            return cached[1].copy(), cached[2]
+
+        embed, page_count = await render()
+        self.pages[key] = (version, embed, page_count)
+        self.pages.move_to_end(key)
+        while len(self.pages) > PAGE_CACHE_SIZE:
+            self.pages.popitem(last=False)
+        return embed.copy(), page_count
+
+    async def _render_leaderboard(
+        self,
+        guild_id: int,
+        timeframe: str,
+        start: int,
+        count: int,
+        persistent=False,
+    ) -> tuple[discord.Embed, int]:
+        """Render a range of the leaderboard for a guild, fetching only the entries in the range.
+
+        Returns the embed and the number of pages of `count` entries."""
 
         # half this code was ai generated ngl
 
         embed = discord.Embed(color=0x74327A)
 
         if persistent:
-            mins = UPDATE_INTERVAL // 60
-            secs = UPDATE_INTERVAL % 60
-            if mins > 0:
-                embed.set_footer(
-                    text=f"Updates every {mins}m{' ' if secs > 0 else ''}{secs}{'s' if secs > 0 else ''}."
-                )
-            else:
-                embed.set_footer(text=f"Updates every {secs}s.")
+            embed.set_footer(text=f"Updates within {BOARD_MAX_DELAY}s of a change.")
 
         embed.description = ""
-        # suffix = " (Week Change)" if timeframe == "week" else " (Month Change)" if timeframe == "month" else ""
-        suffix = (
-            " (Day Change)"
-            if timeframe == "day"
-            else (
-                " (Week Change)"
-                if timeframe == "week"
-                else " (Month Change)" if timeframe == "month" else ""
-            )
-        )
+        suffix = TIMEFRAMES.get(timeframe, "")
         embed.set_author(
             name=f"🏆 {self.client.get_guild(guild_id).name} Aura Leaderboard{suffix}"
         )
 
-        now = datetime.datetime.now()
-
-        if timeframe == "all":
-            leaderboard = sorted(
-                self.guilds[guild_id].users.items(),
-                key=lambda item: item[1].aura,
-                reverse=True,
-            )
-            leaderboard = [
-                (user_id, user.aura) for user_id, user in leaderboard if user.opted_in
-            ]
-
-        elif timeframe in ["day", "week", "month"]:
-            conn = sqlite3.connect(DB)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-
-            if timeframe == "week":
-                start_of_period = now - datetime.timedelta(days=7)
-            elif timeframe == "month":
-                start_of_period = now - datetime.timedelta(days=30)
-            else:
-                start_of_period = now - datetime.timedelta(days=1)
-
-            cursor.execute(
-                """
-                SELECT user_id, aura, snapshot_time
-                FROM user_snapshots
-                WHERE guild_id = ? AND snapshot_time <= ?
-                ORDER BY snapshot_time DESC
-            """,
-                (guild_id, start_of_period),
+        leaderboard, total, ranks = [], 0, None
+        if timeframe in TIMEFRAMES:
+            leaderboard, total = await self.baseline_manager.leaderboard(
+                guild_id, timeframe, start, count
             )
 
-            leaderboard_data = cursor.fetchall()
-
-            latest_snapshots = {}
-
-            # Loop through the leaderboard data and keep the latest snapshot per user
-            for row in leaderboard_data:
-                user_id = row["user_id"]
-                snapshot_time = row["snapshot_time"]
-
-                # Check if this user has been added to the dictionary or if this snapshot is later
-                if (
-                    user_id not in latest_snapshots
-                    or snapshot_time > latest_snapshots[user_id]["snapshot_time"]
-                ):
-                    latest_snapshots[user_id] = row
-
-            # Now, latest_snapshots contains only the latest snapshot for each user
-            leaderboard = [
-                (snapshot["user_id"], snapshot["aura"])
-                for snapshot in latest_snapshots.values()
-            ]
-
-            if len(leaderboard_data) == 0:
-                # fall back to current leaderboard
-                leaderboard = sorted(
-                    self.guilds[guild_id].users.items(),
-                    key=lambda item: item[1].aura,
-                    reverse=True,
-                )
-                leaderboard = [
-                    (user_id, user.aura)
-                    for user_id, user in leaderboard
-                    if user.opted_in
-                ]
-            else:
-                # else calculate the diff
-                leaderboard = []
-
-                current_data = {
-                    user_id: user.aura
-                    for user_id, user in self.guilds[guild_id].users.items()
-                }
-
-                for snapshot in leaderboard_data:
-                    user_id = snapshot["user_id"]
-                    past_aura = snapshot["aura"]
-                    current_aura = current_data.get(
-                        user_id, 0
-                    )  # Default to 0 if no current data
-                    gain = current_aura - past_aura
-
-                    if self.guilds[guild_id].users.get(user_id, {}).opted_in:
-                        leaderboard.append((user_id, gain))
+        if timeframe == "all" or total == 0:
+            # timeframes without baselines yet fall back to the current leaderboard
+            ranks = self.guilds.ranking(guild_id)
+            leaderboard, total = ranks.page(start, count), len(ranks)
 
-                leaderboard.sort(key=lambda item: item[1], reverse=True)
-
-        leaderboard = leaderboard[:99]
+        page_count = max(1, math.ceil(total / count))
+        if not persistent and page_count > 1:
+            embed.set_footer(text=f"Page {start // count + 1} of {page_count}")
 
         if len(leaderboard) == 0:
             embed.description = "No leaderboard data available."
         else:
-            iconurl = (
-                (await self.get_user_info(leaderboard[0][0])).avatar_url
-                if len(leaderboard) > 0
-                else None
-            )
-            embed.set_thumbnail(url=iconurl)
+            # the thumbnail is the overall leader, whichever page this is
+            if start == 0:
+                leader_id = leaderboard[0][0]
+            elif ranks is not None:
+                leader_id = ranks.page(0, 1)[0][0]
+            else:
+                leader, _ = await self.baseline_manager.leaderboard(
+                    guild_id, timeframe, 0, 1
+                )
+                leader_id = leader[0][0]
+            top = await self.get_user_info(leader_id)
+            embed.set_thumbnail(url=top.avatar_url if top is not None else None)
 
-            for i, (user_id, gain) in enumerate(leaderboard):
-                line = f"{i+1}. **{gain}** | <@{user_id}>\n"
+            for i, (user_id, gain) in enumerate(leaderboard, start + 1):
+                line = f"{i}. **{gain}** | <@{user_id}>\n"
                 if len(embed.description) + len(line) > 4096:
                     break
                 embed.description += line
 
-        return embed
+        return embed, page_count
 
-    # need to add pagination/multiple embeds
     def get_emoji_list(self, guild_id: int, persistent=False) -> discord.Embed:
-        """Get the emoji list for a guild.
+        """Get the first page of the emoji list for a guild.
 
         Parameters
         ----------
@@ -263,10 +364,41 @@ class Functions:
         -------
         `discord.Embed`
             The embed containing the emoji list information."""
+        embed, _ = self._render_emoji_list(guild_id, 0, persistent)
+        return embed
+
+    async def get_emoji_page(
+        self, guild_id: int, page: int
+    ) -> tuple[discord.Embed, int]:
+        """Get one page of the emoji list for a guild. Rendered pages are cached until the guild's emojis change.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The ID of the guild.
+        page: `int`
+            The 0-based page.
+
+        Returns
+        -------
+        `tuple[discord.Embed, int]`
+            The embed containing the page, and the number of pages."""
+
+        async def render():
+            return self._render_emoji_list(guild_id, page)
+
+        return await self._cached_page(
+            (guild_id, "emoji", page), self.guilds.versions.get(guild_id, 0), render
+        )
+
+    def _render_emoji_list(
+        self, guild_id: int, page: int, persistent=False
+    ) -> tuple[discord.Embed, int]:
+        """Render one page of the emoji list for a guild.
+
+        Returns the embed and the number of pages."""
 
         embed = discord.Embed(color=0x74327A)
-        if persistent:
-            embed.set_footer(text=f"Updates immediately.")
         embed.set_author(name=f"🔧 {self.client.get_guild(guild_id).name} Emoji List")
 
         emojis = sorted(
@@ -274,6 +406,18 @@ class Functions:
             key=lambda item: abs(item[1].points),
             reverse=True,
         )
+        page_count = max(1, math.ceil(len(emojis) / EMOJI_PAGE_SIZE))
+        emojis = emojis[page * EMOJI_PAGE_SIZE : (page + 1) * EMOJI_PAGE_SIZE]
+
+        if persistent:
+            if page_count > 1:
+                embed.set_footer(
+                    text=f"Updates immediately. Showing {len(emojis)} of {len(self.guilds[guild_id].reactions)} emojis; run /emoji list to see all."
+                )
+            else:
+                embed.set_footer(text=f"Updates immediately.")
+        elif page_count > 1:
+            embed.set_footer(text=f"Page {page + 1} of {page_count}")
 
         positive_reactions = [
             f"{emoji} **+{reaction.points}**"
@@ -304,7 +448,7 @@ class Functions:
         )
         embed.set_thumbnail(url=iconurl)
 
-        return embed
+        return embed, page_count
 
     def get_aura_tagline(self, aura: int):
         """Get the aura tagline for a given aura value.
@@ -361,15 +505,24 @@ class Functions:
         if user_id not in self.guilds[guild_id].users:
             return embed
         embed.set_author(name=f"Aura Breakdown")
-        embed.set_thumbnail(url=(await self.get_user_info(user_id)).avatar_url)
+        info = await self.get_user_info(user_id)
+        embed.set_thumbnail(url=info.avatar_url if info is not None else None)
 
         user = self.guilds[guild_id].users[user_id]
 
         tag = self.get_aura_tagline(user.aura)
 
         if user.opted_in:
+            ranks = self.guilds.ranking(guild_id)
+            rank = ranks.rank(user_id)
+
             embed.description = f"<@{user_id}> has **{user.aura}** aura.\n"
             embed.description += f"*{tag}*\n\n"
+            if rank is not None:
+                percentile = max(1, round(100 * rank / len(ranks)))
+                embed.description += (
+                    f"Ranked **#{rank}** of {len(ranks)} (top {percentile}%).\n\n"
+                )
             embed.description += (
                 f"**{user.aura_contribution}** net aura contribution.\n\n"
             )
@@ -403,7 +556,9 @@ class Functions:
             if channel is not None:
                 try:
                     info_msg = channel.get_partial_message(guild.info_msg_id)
-                    await info_msg.edit(embed=self.get_emoji_list(guild_id, True))
+                    await self.edit_if_changed(
+                        info_msg, self.get_emoji_list(guild_id, True)
+                    )
                 except discord.DiscordException:
                     pass
                 except AttributeError:
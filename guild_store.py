@@ -0,0 +1,230 @@
+"""Contains the GuildStore class, which loads guilds from the database on demand and evicts idle ones from memory."""
+
+import asyncio
+import itertools
+import time
+import traceback
+
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Callable, Iterator
+
+from models import Guild
+from database import ConnectionManager
+from rank_index import RankIndex
+from db_functions import load_data, load_guild, load_guild_ids
+from config import GUILD_IDLE_TIMEOUT, GUILD_CACHE_USERS
+
+
+class GuildStore(MutableMapping):
+    """Class that maps guild IDs to `Guild` objects, keeping only recently used guilds in memory.
+
+    Membership checks cover every set up guild. A guild is hydrated from the database the first time it is accessed, and evicted once it has been idle for `GUILD_IDLE_TIMEOUT` seconds or the resident guilds exceed `GUILD_CACHE_USERS` users, least recently used first.
+    Iterating and `len` only cover resident guilds.
+
+    Also keeps a `RankIndex` for each resident guild that has been ranked, built on first use and dropped on eviction, and a version for each guild that changes whenever its leaderboard or emoji list may have. `rank_listeners` are notified whenever a guild's leaderboard may have changed.
+
+    Use `await load(guild_id)` before using a guild from a coroutine, so the hydration query runs off the event loop. Accessing a guild that is not resident still hydrates it, but doing so while the event loop is running blocks it, so each such access is counted in `sync_loads` and logged with its caller.
+
+    Parameters
+    ----------
+    db: `ConnectionManager`
+        The connection manager to read guilds with.
+    """
+
+    def __init__(self, db: ConnectionManager) -> None:
+        """Initialise the GuildStore and preload the guilds active within `GUILD_IDLE_TIMEOUT` seconds."""
+        self.db = db
+        self.known = load_guild_ids(db)
+        self.resident: OrderedDict[int, Guild] = OrderedDict()
+        self.last_access: dict[int, float] = {}
+        # hydrations that ran on the event loop, because the caller skipped `load`
+        self.sync_loads = 0
+        self.ranks: dict[int, RankIndex] = {}
+        # drawn from one counter, so a version is never reused even if the guild is deleted and set up again
+        self.versions: dict[int, int] = {}
+        self._version_counter = itertools.count(1)
+        # called with a guild ID whenever its leaderboard may have changed
+        self.rank_listeners: list[Callable[[int], None]] = []
+
+        for guild_id, guild in load_data(
+            db, active_since=int(time.time()) - GUILD_IDLE_TIMEOUT
+        ).items():
+            self._insert(guild_id, guild)
+
+    def _insert(self, guild_id: int, guild: Guild) -> None:
+        """Make a guild resident as the most recently used."""
+        self.resident[guild_id] = guild
+        self.resident.move_to_end(guild_id)
+        self.last_access[guild_id] = time.monotonic()
+
+    def __contains__(self, guild_id: object) -> bool:
+        return guild_id in self.known
+
+    def __getitem__(self, guild_id: int) -> Guild:
+        guild = self.resident.get(guild_id)
+        if guild is None:
+            if guild_id not in self.known:
+                raise KeyError(guild_id)
+            if self._on_event_loop():
+                self.sync_loads += 1
+                caller = traceback.extract_stack(limit=2)[0]
+                print(
+                    f"Hydrated guild {guild_id} on the event loop from {caller.name} ({caller.filename}:{caller.lineno}). Await GuildStore.load first."
+                )
+            with self.db.reader() as conn:
+                guild = load_guild(conn, guild_id)
+            if guild is None:
+                raise KeyError(guild_id)
+            self._insert(guild_id, guild)
+        else:
+            self.resident.move_to_end(guild_id)
+            self.last_access[guild_id] = time.monotonic()
+        return guild
+
+    def __setitem__(self, guild_id: int, guild: Guild) -> None:
+        self.known.add(guild_id)
+        self.ranks.pop(guild_id, None)
+        self._insert(guild_id, guild)
+        self.touch(guild_id, ranked=True)
+
+    def __delitem__(self, guild_id: int) -> None:
+        if guild_id not in self.known:
+            raise KeyError(guild_id)
+        self.known.discard(guild_id)
+        self.resident.pop(guild_id, None)
+        self.last_access.pop(guild_id, None)
+        self.ranks.pop(guild_id, None)
+        self.touch(guild_id)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(list(self.resident))
+
+    def __len__(self) -> int:
+        return len(self.resident)
+
+    @staticmethod
+    def _on_event_loop() -> bool:
+        """Check if the caller is running on the event loop, rather than at startup or shutdown."""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        return True
+
+    async def load(self, guild_id: int) -> None:
+        """Hydrate a guild on the reader thread pool if it is set up but not resident.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The ID of the guild."""
+        if guild_id in self.resident or guild_id not in self.known:
+            return
+
+        guild = await self.db.run_read(load_guild, guild_id)
+        # another coroutine may have hydrated or deleted it while this one waited
+        if (
+            guild is not None
+            and guild_id in self.known
+            and guild_id not in self.resident
+        ):
+            self._insert(guild_id, guild)
+
+    def ranking(self, guild_id: int) -> RankIndex:
+        """Get a guild's rank index, building it if needed.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The ID of the guild.
+
+        Returns
+        -------
+        `RankIndex`
+            The guild's opted in users ordered by aura."""
+        guild = self[guild_id]
+        ranks = self.ranks.get(guild_id)
+        if ranks is None:
+            ranks = self.ranks[guild_id] = RankIndex(guild.users)
+        return ranks
+
+    def rerank(self, guild_id: int, user_id: int) -> None:
+        """Move a user to their current position in the guild's rank index, if it has been built.
+
+        Call after changing a user's aura or opt in status, or removing them.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The ID of the guild.
+        user_id: `int`
+            The ID of the user."""
+        self.touch(guild_id, ranked=True)
+        ranks = self.ranks.get(guild_id)
+        if ranks is not None and guild_id in self.resident:
+            ranks.update(user_id, self.resident[guild_id].users.get(user_id))
+
+    def drop_ranking(self, guild_id: int) -> None:
+        """Drop a guild's rank index, e.g. after replacing its users. It is rebuilt on next use.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The ID of the guild."""
+        self.ranks.pop(guild_id, None)
+        self.touch(guild_id, ranked=True)
+
+    def touch(self, guild_id: int, ranked=False) -> None:
+        """Give a guild a new version, e.g. after changing its users or reactions.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The ID of the guild.
+        ranked: `bool`, optional
+            Whether the guild's leaderboard may have changed, notifying `rank_listeners`. Defaults to `False`."""
+        self.versions[guild_id] = next(self._version_counter)
+        if ranked:
+            for listener in self.rank_listeners:
+                listener(guild_id)
+
+    def evict(self, dirty: set[int]) -> int:
+        """Evict idle guilds, then least recently used guilds until the resident users fit in `GUILD_CACHE_USERS`.
+
+        Guilds with unflushed changes are never evicted.
+
+        Parameters
+        ----------
+        dirty: `set[int]`
+            The IDs of guilds with changes that have not been written to the database.
+
+        Returns
+        -------
+        `int`
+            The number of guilds evicted."""
+        now = time.monotonic()
+        evicted = 0
+
+        for guild_id in list(self.resident):
+            if (
+                guild_id not in dirty
+                and now - self.last_access[guild_id] >= GUILD_IDLE_TIMEOUT
+            ):
+                del self.resident[guild_id]
+                del self.last_access[guild_id]
+                self.ranks.pop(guild_id, None)
+                evicted += 1
+
+        resident_users = sum(len(guild.users) for guild in self.resident.values())
+        for guild_id in list(self.resident):
+            if resident_users <= GUILD_CACHE_USERS:
+                break
+            if guild_id in dirty:
+                continue
+            resident_users -= len(self.resident.pop(guild_id).users)
+            del self.last_access[guild_id]
+            self.ranks.pop(guild_id, None)
+            evicted += 1
+
+        return evicted
@@ -0,0 +1,376 @@
+"""Contains the IngestionManager class, which queues reaction events and applies them to aura in micro-batches."""
+
+import discord
+import asyncio
+import time
+
+from collections import defaultdict
+from dataclasses import dataclass
+
+from models import *
+from guild_store import GuildStore
+from actors import GuildActors
+from funcs import Functions
+from cooldowns import CooldownManager
+from timelines import TimelinesManager
+from logging_aura import LoggingManager
+from persistence import PersistenceManager
+from config import INGEST_GUILD_BACKLOG, INGEST_BATCH_SIZE
+
+
+@dataclass(slots=True)
+class ReactionRecord:
+    """Class that represents a reaction event waiting to be applied.
+
+    Attributes
+    ----------
+    guild_id: `int`
+        The ID of the guild.
+    channel_id: `int`
+        The ID of the channel the message is in.
+    message_id: `int`
+        The ID of the message that was reacted to.
+    user_id: `int`
+        The ID of the user who added or removed the reaction.
+    author_id: `int`
+        The ID of the message's author, or `None` until it is looked up for removals.
+    emoji: `str`
+        The emoji.
+    event: `ReactionEvent`
+        Whether the reaction was added or removed.
+    member: `discord.Member`
+        The member who added the reaction, or `None` for removals.
+    received: `float`
+        The monotonic time the event was queued."""
+
+    guild_id: int
+    channel_id: int
+    message_id: int
+    user_id: int
+    author_id: int
+    emoji: str
+    event: ReactionEvent
+    member: discord.Member
+    received: float
+
+
+class IngestionManager:
+    """Class that applies reaction events to aura in micro-batches, so bursts of reactions are amortised.
+
+    The gateway handlers only `submit` a `ReactionRecord` to its guild's backlog. Each guild has at most one batch in its actor at a time: a batch takes everything in the guild's backlog, up to `INGEST_BATCH_SIZE` events, and events that arrive while it runs form the next one. A batch is processed in stages: hydrating the guild and looking up message authors and user info concurrently, validating each event and applying cooldowns and rate limits in order, then applying the summed aura deltas with one journal append and queueing the batch's logs.
+    Guilds are processed independently, so a guild that is slow to hydrate or waiting on the API does not hold up the others. Once a guild has `INGEST_GUILD_BACKLOG` events queued or being applied, only its own gateway handlers wait.
+
+    Parameters
+    ----------
+    guilds: `GuildStore`
+        The guild store, mapping guild IDs to `Guild` objects.
+    actors: `GuildActors`
+        The guild actors. Each guild's events are processed in its actor, so they cannot interleave with other changes to the guild.
+    funcs: `Functions`
+        The shared utility functions, used to look up user info.
+    cooldown_manager: `CooldownManager`
+        The cooldown manager.
+    timelines_manager: `TimelinesManager`
+        The timelines manager, used for message authors, rate limits and temporary bans.
+    logging_manager: `LoggingManager`
+        The logging manager, used to queue aura change logs.
+    persistence_manager: `PersistenceManager`
+        The persistence manager, used to apply and journal the aura changes.
+    """
+
+    def __init__(
+        self,
+        guilds: GuildStore,
+        actors: GuildActors,
+        funcs: Functions,
+        cooldown_manager: CooldownManager,
+        timelines_manager: TimelinesManager,
+        logging_manager: LoggingManager,
+        persistence_manager: PersistenceManager,
+    ) -> None:
+        """Initialise the IngestionManager with empty backlogs."""
+        self.guilds = guilds
+        self.actors = actors
+        self.funcs = funcs
+        self.cooldown_manager = cooldown_manager
+        self.timelines_manager = timelines_manager
+        self.logging_manager = logging_manager
+        self.persistence_manager = persistence_manager
+
+        # guild ID -> events waiting for the guild's next batch
+        self.pending: dict[int, list[ReactionRecord]] = {}
+        # guild ID -> the guild's batch being processed
+        self.running: dict[int, asyncio.Task] = {}
+        # guild ID -> number of events pending or being processed
+        self.backlog: dict[int, int] = {}
+        # guild ID -> set once the guild's backlog shrinks, for the handlers waiting on it
+        self.space: dict[int, asyncio.Event] = {}
+
+        self.batches = 0
+        self.events = 0
+        self.max_batch = 0
+        # seconds from queueing to applying, averaged over recent batches
+        self.latency = 0.0
+        self.max_latency = 0.0
+
+    def queued(self) -> int:
+        """Get the number of events waiting for their guild's next batch."""
+        return sum(len(records) for records in self.pending.values())
+
+    async def submit(
+        self, payload: discord.RawReactionActionEvent, event: ReactionEvent
+    ) -> None:
+        """Queue a reaction event, waiting if its guild's backlog is full.
+
+        Parameters
+        ----------
+        payload: `discord.RawReactionActionEvent`
+            The payload of the reaction event. Provided through the `on_raw_reaction_add` or `on_raw_reaction_remove` event.
+        event: `ReactionEvent`
+            The event type that triggered the reaction."""
+        guild_id = payload.guild_id
+        if guild_id not in self.guilds:
+            return
+
+        record = ReactionRecord(
+            guild_id=guild_id,
+            channel_id=payload.channel_id,
+            message_id=payload.message_id,
+            user_id=payload.user_id,
+            author_id=payload.message_author_id if event.is_add else None,
+            emoji=str(payload.emoji),
+            event=event,
+            member=payload.member,
+            received=time.monotonic(),
+        )
+        while self.backlog.get(guild_id, 0) >= INGEST_GUILD_BACKLOG:
+            space = self.space.get(guild_id)
+            if space is None:
+                space = self.space[guild_id] = asyncio.Event()
+            await space.wait()
+
+        self.backlog[guild_id] = self.backlog.get(guild_id, 0) + 1
+        self.pending.setdefault(guild_id, []).append(record)
+        if guild_id not in self.running:
+            self._start_batch(guild_id)
+
+    def _start_batch(self, guild_id: int) -> None:
+        """Hand up to `INGEST_BATCH_SIZE` of a guild's pending events to its actor as one batch, without waiting for it."""
+        pending = self.pending[guild_id]
+        batch = pending[:INGEST_BATCH_SIZE]
+        del pending[:INGEST_BATCH_SIZE]
+        if not pending:
+            del self.pending[guild_id]
+
+        task = asyncio.ensure_future(
+            self.actors.run(guild_id, self.process_guild, guild_id, batch)
+        )
+        self.running[guild_id] = task
+        task.add_done_callback(lambda task: self._finish_batch(guild_id, batch, task))
+
+    def _finish_batch(
+        self, guild_id: int, batch: list[ReactionRecord], task: asyncio.Task
+    ) -> None:
+        """Record a guild's finished batch, free its space in the backlog and start the guild's next batch."""
+        if task.cancelled():
+            print(f"Processing reaction events in guild {guild_id} was cancelled.")
+        elif task.exception() is not None:
+            e = task.exception()
+            print(
+                f"Failed to process reaction events in guild {guild_id}: {type(e).__name__}: {e}"
+            )
+
+        now = time.monotonic()
+        latency = max(now - record.received for record in batch)
+        self.latency = latency if self.batches == 0 else (self.latency + latency) / 2
+        self.max_latency = max(self.max_latency, latency)
+        self.batches += 1
+        self.events += len(batch)
+        self.max_batch = max(self.max_batch, len(batch))
+
+        del self.running[guild_id]
+        self.backlog[guild_id] -= len(batch)
+        if self.backlog[guild_id] == 0:
+            del self.backlog[guild_id]
+        space = self.space.pop(guild_id, None)
+        if space is not None:
+            space.set()
+
+        if guild_id in self.pending:
+            self._start_batch(guild_id)
+
+    async def process_guild(
+        self, guild_id: int, records: list[ReactionRecord]
+    ) -> None:
+        """Validate one guild's reaction events and apply the aura changes of the valid ones. Runs in the guild's actor.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The ID of the guild.
+        records: `list[ReactionRecord]`
+            The guild's events, in the order they were received."""
+        await self.guilds.load(guild_id)
+        if guild_id not in self.guilds:
+            return
+        reactions = self.guilds[guild_id].reactions
+        records = [record for record in records if record.emoji in reactions]
+
+        # look up the authors of removed reactions, once per message
+        unknown = {
+            (record.channel_id, record.message_id)
+            for record in records
+            if record.author_id is None
+        }
+        if unknown:
+            unknown = list(unknown)
+            found = await asyncio.gather(
+                *(
+                    self.timelines_manager.get_message_author_id(*key)
+                    for key in unknown
+                ),
+                return_exceptions=True,
+            )
+            authors = {
+                key: author_id
+                for key, author_id in zip(unknown, found)
+                if isinstance(author_id, int)
+            }
+            for record in records:
+                if record.author_id is None:
+                    record.author_id = authors.get(
+                        (record.channel_id, record.message_id)
+                    )
+
+        for record in records:
+            if record.event.is_add:
+                self.timelines_manager.add_message_author_id(
+                    record.message_id, record.author_id
+                )
+
+        # ignore self reactions and messages whose author could not be found
+        records = [
+            record
+            for record in records
+            if record.author_id is not None and record.user_id != record.author_id
+        ]
+
+        # after we have done the basic checks, record the users' info
+        for record in records:
+            if record.member is not None:
+                self.funcs.update_user_info(record.member)
+        user_ids = {record.user_id for record in records}
+        user_ids.update(record.author_id for record in records)
+        user_ids = [
+            user_id for user_id in user_ids if user_id not in self.funcs.user_info
+        ]
+        if user_ids:
+            await asyncio.gather(
+                *(self.funcs.get_user_info(user_id) for user_id in user_ids),
+                return_exceptions=True,
+            )
+
+        deltas: dict[tuple[int, int], dict[str, int]] = defaultdict(
+            lambda: defaultdict(int)
+        )
+        logs: list[str] = []
+        for record in records:
+            try:
+                await self.validate_and_collect(record, deltas, logs)
+            except Exception as e:
+                print(f"Failed to process reaction event: {type(e).__name__}: {e}")
+
+        self.persistence_manager.apply_changes(deltas)
+        if logs:
+            self.logging_manager.log_batch(guild_id, logs)
+
+    async def validate_and_collect(
+        self,
+        record: ReactionRecord,
+        deltas: dict[tuple[int, int], dict[str, int]],
+        logs: list[str],
+    ) -> None:
+        """Check a reaction event against the guild's rules, update cooldowns and rate limits, and add its aura change to the batch.
+
+        Parameters
+        ----------
+        record: `ReactionRecord`
+            The event, with its author looked up.
+        deltas: `dict[tuple[int, int], dict[str, int]]`
+            The batch's summed changes to each of the guild's users' stats.
+        logs: `list[str]`
+            The batch's log lines for the guild."""
+        guild_id = record.guild_id
+        user_id = record.user_id
+        author_id = record.author_id
+        event = record.event
+        guild = self.guilds.get(guild_id)
+        if guild is None or record.emoji not in guild.reactions:
+            return
+
+        # ignore bots
+        giver = self.funcs.user_info.get(user_id)
+        recipient = self.funcs.user_info.get(author_id)
+        if giver is None or recipient is None or giver.bot or recipient.bot:
+            return
+
+        # new users have the default settings, and are only created once a change is applied to them
+        giver_user = guild.users.get(user_id) or User()
+        recipient_user = guild.users.get(author_id) or User()
+
+        # check if temp banned
+        if self.timelines_manager.ban_manager.is_banned(guild_id, user_id):
+            return
+
+        # check user restrictions
+        if not giver_user.giving_allowed or not recipient_user.receiving_allowed:
+            return
+
+        # check if the user is opted in
+        if not giver_user.opted_in or not recipient_user.opted_in:
+            return
+
+        # add the event to the rolling timeline for ratelimiting
+        await self.timelines_manager.update_rolling_timelines(guild_id, user_id, event)
+
+        # check if the user is on cooldown
+        if not self.cooldown_manager.is_cooldown_complete(
+            guild_id, user_id, author_id, event
+        ):
+            return
+
+        opposite_event = ReactionEvent.REMOVE if event.is_add else ReactionEvent.ADD
+        # reset cooldowns and get vals for next step
+        self.cooldown_manager.start_cooldown(guild_id, user_id, author_id, event)
+        self.cooldown_manager.end_cooldown(guild_id, user_id, author_id, opposite_event)
+
+        reaction_points = guild.reactions[record.emoji].points
+        if event.is_add:
+            points = reaction_points
+            one = 1
+        else:
+            points = -reaction_points
+            one = -1
+
+        recipient_deltas = deltas[(guild_id, author_id)]
+        giver_deltas = deltas[(guild_id, user_id)]
+        recipient_deltas["aura"] += points
+        giver_deltas["aura_contribution"] += points
+        if reaction_points > 0:
+            recipient_deltas["num_pos_received"] += one
+            giver_deltas["num_pos_given"] += one
+        else:
+            recipient_deltas["num_neg_received"] += one
+            giver_deltas["num_neg_given"] += one
+
+        if guild.log_channel_id is not None:
+            logs.append(
+                self.logging_manager.format_aura_change(
+                    author_id,
+                    user_id,
+                    event,
+                    record.emoji,
+                    points,
+                    f"https://discord.com/channels/{guild_id}/{record.channel_id}/{record.message_id}",
+                )
+            )
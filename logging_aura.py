@@ -44,6 +44,33 @@ class LoggingManager:
             The number of aura points given or taken away.
         url: `str`
             The URL of the message where the reaction was added or removed."""
+        self.log_cache[guild_id].append(
+            self.format_aura_change(recipient_id, user_id, event, emoji, points, url)
+        )
+
+    def log_batch(self, guild_id: int, log_messages: list[str]) -> None:
+        """Queue a batch of formatted log messages for the guild's log channel.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The ID of the guild.
+        log_messages: `list[str]`
+            The log messages, e.g. from `format_aura_change`."""
+        self.log_cache[guild_id].extend(log_messages)
+
+    @staticmethod
+    def format_aura_change(
+        recipient_id: int,
+        user_id: int,
+        event: ReactionEvent,
+        emoji: str,
+        points: int,
+        url: str,
+    ) -> str:
+        """Format an aura change event as a log message.
+
+        Takes the same parameters as `log_aura_change`, without the guild ID."""
         sign = ""
         if points > 0:
             sign = "+"
@@ -51,9 +78,7 @@ class LoggingManager:
             sign = "-"
 
         connective = "to" if event.is_add else "from"
-        log_message = f"<@{user_id}> [{event.past}]({url}) {emoji} {connective} <@{recipient_id}> ({sign}{abs(points)} points)"
-
-        self.log_cache[guild_id].append(log_message)
+        return f"<@{user_id}> [{event.past}]({url}) {emoji} {connective} <@{recipient_id}> ({sign}{abs(points)} points)"
 
     def log_event(
         self,
@@ -102,9 +127,10 @@ class LoggingManager:
     async def send_batched_logs(self):
         """Send all batched logs to the respective guild's log channel.
 
-        Runs every `LOGGING_INTERVAL` seconds."""
-        for guild_id, logs in list(self.log_cache.items()):
-            if logs:
+        Runs every `LOGGING_INTERVAL` seconds. Only guilds with queued logs are visited."""
+        for guild_id in list(self.log_cache):
+            logs = self.log_cache.pop(guild_id)
+            if logs and guild_id in self.guilds:
                 channel_id = self.guilds[guild_id].log_channel_id
                 if channel_id is not None:
                     channel = self.client.get_channel(channel_id)
@@ -120,5 +146,3 @@ class LoggingManager:
                             )
                         except discord.HTTPException as e:
                             print(f"Failed to send logs: HTTPException: {e}")
-
-                self.log_cache[guild_id].clear()
@@ -2,6 +2,7 @@ import discord
 import json
 import time
 import os
+import asyncio
 
 from discord import app_commands
 from typing import Literal
@@ -10,23 +11,29 @@ from emoji import is_emoji
 
 from models import ReactionEvent, LogEvent, User, Guild, EmojiReaction, Limits
 
-from db_functions import update_time_and_save, load_data, load_user_data
+from db_functions import load_user_data
 from cooldowns import CooldownManager
 from funcs import Functions
 from tasks import TasksManager
 from logging_aura import LoggingManager
 from timelines import TimelinesManager
+from bans import BanManager
+from persistence import PersistenceManager
+from database import ConnectionManager
+from guild_store import GuildStore
+from actors import GuildActors
+from baselines import BaselineManager
+from board_scheduler import LeaderboardScheduler
+from ingestion import IngestionManager
+from single_flight import SingleFlight
 from config import HELP_TEXT, OWNER_ID, LOG_CHANNEL_ID
-from views import ConfirmView
-
-# TODO: reuse db connection but create new cursors across bot
+from views import ConfirmView, PageView
 
 # TODO: custom bot subclass, has guilds, user_info and conn attrs
 # TODO: dynamic cooldowns depending on num of messages in channel
 
 # TODO: penalise and forgive: if penalised, gain half and lose double
 
-# TODO: add pagination to leaderboard and emoji list
 # TODO: aura based role rewards
 # TODO: emoji usage stats
 # TODO: multi lang support
@@ -38,7 +45,16 @@ intents = discord.Intents.default()
 
 client = discord.Client(intents=intents)
 
-tree = app_commands.CommandTree(client)
+
+class AuraCommandTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        """Hydrate the guild off the event loop before any command runs."""
+        if interaction.guild is not None:
+            await guilds.load(interaction.guild.id)
+        return True
+
+
+tree = AuraCommandTree(client)
 emoji_group = app_commands.Group(
     name="emoji", description="Commands for managing emojis.", guild_only=True
 )
@@ -58,18 +74,56 @@ tree.add_command(opt_group)
 tree.add_command(config_group)
 tree.add_command(clear_group)
 
-guilds = load_data()
+connection_manager = ConnectionManager()
+
+guilds = GuildStore(connection_manager)
 
-user_info = load_user_data()
+user_info = load_user_data(connection_manager)
 
 _background_tasks: set = set()
 
-funcs = Functions(client, guilds, user_info)
+persistence_manager = PersistenceManager(connection_manager, guilds, user_info)
+persistence_manager.replay_journal()
+
+baseline_manager = BaselineManager(connection_manager, guilds)
 
+single_flight = SingleFlight()
+funcs = Functions(
+    client,
+    connection_manager,
+    guilds,
+    user_info,
+    persistence_manager,
+    baseline_manager,
+    single_flight,
+)
+
+board_scheduler = LeaderboardScheduler(client, guilds, funcs)
 cooldown_manager = CooldownManager(guilds)
 logging_manager = LoggingManager(client, guilds)
-tasks_manager = TasksManager(client, guilds, funcs)
-timelines_manager = TimelinesManager(client, guilds, logging_manager)
+tasks_manager = TasksManager(
+    client,
+    connection_manager,
+    guilds,
+    funcs,
+    persistence_manager,
+    baseline_manager,
+    board_scheduler,
+)
+ban_manager = BanManager(client, connection_manager, guilds, logging_manager)
+timelines_manager = TimelinesManager(
+    client, connection_manager, guilds, ban_manager, single_flight
+)
+guild_actors = GuildActors()
+ingestion_manager = IngestionManager(
+    guilds,
+    guild_actors,
+    funcs,
+    cooldown_manager,
+    timelines_manager,
+    logging_manager,
+    persistence_manager,
+)
 
 
 @client.event
@@ -84,6 +138,10 @@ async def on_ready():
         ),
     )
 
+    if baseline_manager.stale:
+        # snapshots were taken while the bot was offline
+        await baseline_manager.rebuild()
+
     if not tasks_manager.take_snapshots_and_cleanup.is_running():
         print("Starting daily snapshot and cleanup loop...")
         _t = tasks_manager.take_snapshots_and_cleanup.start()
@@ -91,10 +149,64 @@ async def on_ready():
             _background_tasks.add(_t)
             _t.add_done_callback(_background_tasks.discard)
 
-    if not tasks_manager.update_leaderboards.is_running():
-        print("Starting leaderboard update loop...")
-        await tasks_manager.update_leaderboards(skip=True)
-        _t = tasks_manager.update_leaderboards.start()
+    if not board_scheduler.dispatch.is_running():
+        print("Starting leaderboard scheduler...")
+        # refreshed through the worker pool rather than awaited here
+        board_scheduler.refresh_all()
+        _t = board_scheduler.dispatch.start()
+        if _t is not None:
+            _background_tasks.add(_t)
+            _t.add_done_callback(_background_tasks.discard)
+
+    if not tasks_manager.measure_loop_lag.is_running():
+        _t = tasks_manager.measure_loop_lag.start()
+        if _t is not None:
+            _background_tasks.add(_t)
+            _t.add_done_callback(_background_tasks.discard)
+
+    if not tasks_manager.evict_idle_guilds.is_running():
+        _t = tasks_manager.evict_idle_guilds.start()
+        if _t is not None:
+            _background_tasks.add(_t)
+            _t.add_done_callback(_background_tasks.discard)
+
+    if not ban_manager.expire_bans.is_running():
+        print("Starting temp ban loops...")
+        for loop in (
+            ban_manager.expire_bans,
+            ban_manager.snapshot_bans,
+            ban_manager.send_dms,
+        ):
+            _t = loop.start()
+            if _t is not None:
+                _background_tasks.add(_t)
+                _t.add_done_callback(_background_tasks.discard)
+
+    if not cooldown_manager.sweep.is_running():
+        _t = cooldown_manager.sweep.start()
+        if _t is not None:
+            _background_tasks.add(_t)
+            _t.add_done_callback(_background_tasks.discard)
+
+    if not timelines_manager.rate_limiter.sweep.is_running():
+        _t = timelines_manager.rate_limiter.sweep.start()
+        if _t is not None:
+            _background_tasks.add(_t)
+            _t.add_done_callback(_background_tasks.discard)
+
+    if not timelines_manager.flush_authors.is_running():
+        for loop in (
+            timelines_manager.flush_authors,
+            timelines_manager.prune_authors,
+        ):
+            _t = loop.start()
+            if _t is not None:
+                _background_tasks.add(_t)
+                _t.add_done_callback(_background_tasks.discard)
+
+    if not persistence_manager.flush_changes.is_running():
+        print("Starting write-behind flush loop...")
+        _t = persistence_manager.flush_changes.start()
         if _t is not None:
             _background_tasks.add(_t)
             _t.add_done_callback(_background_tasks.discard)
@@ -161,126 +273,32 @@ async def on_guild_remove(guild: discord.Guild):
 @client.event
 async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
     """Event that is called when a reaction is added to a message."""
-    await parse_payload(payload, ReactionEvent.ADD)
+    await ingestion_manager.submit(payload, ReactionEvent.ADD)
 
 
 @client.event
 async def on_raw_reaction_remove(payload: discord.RawReactionActionEvent):
     """Event that is called when a reaction is removed from a message."""
-    await parse_payload(payload, ReactionEvent.REMOVE)
-
-
-async def parse_payload(
-    payload: discord.RawReactionActionEvent, event: ReactionEvent
-) -> None:
-    """Parse the payload and update the user's aura based on the reaction.
+    await ingestion_manager.submit(payload, ReactionEvent.REMOVE)
 
-    Completes a number of validation checks and updates cooldowns.
 
-    Queues the event to be logged if the log channel is set.
-
-    Parameters
-    ----------
-    payload: `discord.RawReactionActionEvent`
-        The payload of the reaction event. Provided through the `on_raw_reaction_add` or `on_raw_reaction_remove` event.
-    event: `ReactionEvent`
-        The event type that triggered the reaction."""
-    if payload.guild_id in guilds:
-        emoji = str(payload.emoji)
-        guild_id = payload.guild_id
-
-        if emoji in guilds[guild_id].reactions:
-            if event == ReactionEvent.REMOVE:
-                author_id = await timelines_manager.get_message_author_id(
-                    payload.channel_id, payload.message_id
-                )
-            else:
-                author_id = payload.message_author_id
-                timelines_manager.add_message_author_id(payload.message_id, author_id)
-
-            user_id = payload.user_id
-
-            # ignore self reactions
-            if user_id == author_id:
-                return
-
-            # after we have done the basic checks, record the user's info
-            funcs.update_user_info(payload.member)
-
-            # ignore bots
-            if (await funcs.get_user_info(user_id)).bot or (
-                await funcs.get_user_info(author_id)
-            ).bot:
-                return
-
-            if author_id not in guilds[guild_id].users:
-                # recipient must be created
-                guilds[guild_id].users[author_id] = User()
-            if user_id not in guilds[guild_id].users:
-                # giver must be created
-                guilds[guild_id].users[payload.user_id] = User()
-
-            # check if temp banned
-            if user_id in timelines_manager.temp_banned_users[guild_id]:
-                return
-
-            # check user restrictions
-            if (
-                not guilds[guild_id].users[user_id].giving_allowed
-                or not guilds[guild_id].users[author_id].receiving_allowed
-            ):
-                return
-
-            # check if the user is opted in
-            if (
-                not guilds[guild_id].users[user_id].opted_in
-                or not guilds[guild_id].users[author_id].opted_in
-            ):
-                return
-
-            # add the event to the rolling timeline for ratelimiting
-            await timelines_manager.update_rolling_timelines(guild_id, user_id, event)
-
-            # check if the user is on cooldown
-            if not cooldown_manager.is_cooldown_complete(
-                guild_id, user_id, author_id, event
-            ):
-                return
-
-            opposite_event = ReactionEvent.REMOVE if event.is_add else ReactionEvent.ADD
-            # reset cooldowns and get vals for next step
-            cooldown_manager.start_cooldown(guild_id, user_id, author_id, event)
-            cooldown_manager.end_cooldown(guild_id, user_id, author_id, opposite_event)
-
-            if event.is_add:
-                points = guilds[guild_id].reactions[emoji].points
-                one = 1
-            else:
-                points = -guilds[guild_id].reactions[emoji].points
-                one = -1
+@client.event
+async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent):
+    """Event that is called when a message is deleted. Its author is no longer needed or fetchable."""
+    timelines_manager.unresolved.add("message", payload.message_id)
 
-            guilds[guild_id].users[author_id].aura += points
-            guilds[guild_id].users[user_id].aura_contribution += points
 
-            if guilds[guild_id].reactions[emoji].points > 0:
-                guilds[guild_id].users[user_id].num_pos_given += one
-                guilds[guild_id].users[author_id].num_pos_received += one
-            else:
-                guilds[guild_id].users[user_id].num_neg_given += one
-                guilds[guild_id].users[author_id].num_neg_received += one
+@client.event
+async def on_raw_bulk_message_delete(payload: discord.RawBulkMessageDeleteEvent):
+    """Event that is called when messages are bulk deleted."""
+    for message_id in payload.message_ids:
+        timelines_manager.unresolved.add("message", message_id)
 
-            if guilds[guild_id].log_channel_id is not None:
-                logging_manager.log_aura_change(
-                    guild_id,
-                    author_id,
-                    user_id,
-                    event,
-                    emoji,
-                    points,
-                    f"https://discord.com/channels/{guild_id}/{payload.channel_id}/{payload.message_id}",
-                )
 
-            update_time_and_save(guild_id, guilds)
+@client.event
+async def on_guild_channel_delete(channel: discord.abc.GuildChannel):
+    """Event that is called when a channel is deleted."""
+    timelines_manager.unresolved.add("channel", channel.id)
 
 
 @tree.command(name="help", description="Display the help text.")
@@ -295,6 +313,43 @@ async def help_command(interaction: discord.Interaction):
     await interaction.followup.send(embed=embed2, ephemeral=True)
 
 
+@tree.command(name="status", description="Show internal bot stats. Owner only.")
+async def status(interaction: discord.Interaction):
+    if interaction.user.id != OWNER_ID:
+        await interaction.response.send_message(
+            "You are not authorised to use this command.", ephemeral=True
+        )
+        return
+
+    embed = discord.Embed(color=0x453F5E)
+    embed.set_author(name="Aura Status", icon_url=client.user.avatar.url)
+    embed.description = f"__Event loop lag:__ {tasks_manager.loop_lag * 1000:.1f}ms (peak {tasks_manager.max_loop_lag * 1000:.1f}ms)\n"
+    embed.description += f"__Guilds:__ {len(guilds.known)} set up, {len(guilds)} in memory, {guilds.sync_loads} loaded on the event loop, {len(client.guilds)} joined\n"
+    embed.description += f"__Pending writes:__ {len(persistence_manager.pending)} rows, {len(persistence_manager.deferred)} journaled rows\n"
+    embed.description += f"__Reaction ingestion:__ {ingestion_manager.queued()} queued, {len(ingestion_manager.running)} guilds processing, {ingestion_manager.events} events in {ingestion_manager.batches} batches (max {ingestion_manager.max_batch}), latency {ingestion_manager.latency * 1000:.1f}ms (peak {ingestion_manager.max_latency * 1000:.1f}ms)\n"
+    authors = timelines_manager.authors
+    embed.description += f"__Message authors:__ {len(authors)} cached, {authors.memory() // 1024} KiB, {authors.hits} hits, {authors.misses} misses, {len(timelines_manager.unsaved_authors)} unsaved, {timelines_manager.author_reads} database reads, {timelines_manager.author_fetches} API fetches\n"
+    fetches = ", ".join(
+        f"{kind}s {single_flight.calls[kind]} made, {single_flight.coalesced[kind]} coalesced"
+        for kind in ("user", "message")
+    )
+    embed.description += f"__API fetches:__ {len(single_flight)} in flight, {fetches}\n"
+    embed.description += f"__Unresolvable:__ {len(timelines_manager.unresolved)} messages and channels ({timelines_manager.unresolved.hits} hits), {len(funcs.unresolved)} users ({funcs.unresolved.hits} hits)\n"
+    embed.description += f"__Cooldowns:__ {len(cooldown_manager)} active, {cooldown_manager.memory() // 1024} KiB\n"
+    rate_memory = timelines_manager.rate_limiter.memory()
+    largest = max(rate_memory, key=rate_memory.get, default=None)
+    embed.description += f"__Rate limiter:__ {len(timelines_manager.rate_limiter)} windows in {len(rate_memory)} guilds, {sum(rate_memory.values()) // 1024} KiB"
+    if largest is not None:
+        embed.description += f" (largest {largest}: {rate_memory[largest] // 1024} KiB)"
+    embed.description += "\n"
+    embed.description += f"__Temp bans:__ {len(ban_manager)} active, {ban_manager.dm_queue.qsize()} DMs queued, {ban_manager.dms_dropped} dropped\n"
+    embed.description += f"__Guild actors:__ {len(guild_actors)} running, {guild_actors.queued()} jobs queued, {guild_actors.jobs} jobs run\n"
+    embed.description += f"__Leaderboard refreshes:__ {board_scheduler.refreshes} done, {len(board_scheduler.due)} scheduled, {len(board_scheduler.running)} running\n"
+    embed.description += f"__Message edits:__ {funcs.edits_sent} sent, {funcs.edits_skipped} skipped as unchanged\n"
+    embed.description += f"__Aura journal:__ {persistence_manager.last_seq - persistence_manager.compacted_seq} unfolded entries, {len(persistence_manager.journal)} unwritten\n"
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
 @tree.command(name="setup", description="Setup the bot.")
 @app_commands.guild_only()
 @app_commands.describe(
@@ -323,22 +378,20 @@ async def setup(interaction: discord.Interaction, channel: discord.TextChannel =
 
         if channel is not None:
             guilds[guild_id].msgs_channel_id = channel.id
-            guilds[guild_id].info_msg_id = (
-                await channel.send(embed=funcs.get_emoji_list(guild_id, True))
-            ).id
-            guilds[guild_id].board_msg_id = (
-                await channel.send(
-                    embed=await funcs.get_leaderboard(guild_id, "all", True)
-                )
-            ).id
-
-            update_time_and_save(guild_id, guilds)
+            info_embed = funcs.get_emoji_list(guild_id, True)
+            guilds[guild_id].info_msg_id = (await channel.send(embed=info_embed)).id
+            funcs.record_render(guilds[guild_id].info_msg_id, info_embed)
+            board_embed = await funcs.get_leaderboard(guild_id, "all", True)
+            guilds[guild_id].board_msg_id = (await channel.send(embed=board_embed)).id
+            funcs.record_render(guilds[guild_id].board_msg_id, board_embed)
+
+            persistence_manager.mark_guild_created(guild_id)
             await interaction.response.send_message(
                 f"Setup complete. Leaderboard will be displayed in {channel.mention} or run </leaderboard:1356179831288758387>. Next, add emojis to track using </emoji add:1356180634602700863> or remove the default emojis with </emoji remove:1356180634602700863>."
             )
             return
         else:
-            update_time_and_save(guild_id, guilds)
+            persistence_manager.mark_guild_created(guild_id)
             await interaction.response.send_message(
                 f"Setup complete. Run </leaderboard:1356179831288758387> to display leaderboard and </emoji list:1356180634602700863> to see tracked emojis. Next, add emojis to track using </emoji add:1356180634602700863>."
             )
@@ -370,20 +423,22 @@ async def update_channel(
         return
 
     guilds[guild_id].msgs_channel_id = channel.id
+    funcs.rendered.pop(guilds[guild_id].info_msg_id, None)
+    funcs.rendered.pop(guilds[guild_id].board_msg_id, None)
     try:
-        guilds[guild_id].info_msg_id = (
-            await channel.send(embed=funcs.get_emoji_list(guild_id, True))
-        ).id
-        guilds[guild_id].board_msg_id = (
-            await channel.send(embed=await funcs.get_leaderboard(guild_id, "all", True))
-        ).id
+        info_embed = funcs.get_emoji_list(guild_id, True)
+        guilds[guild_id].info_msg_id = (await channel.send(embed=info_embed)).id
+        funcs.record_render(guilds[guild_id].info_msg_id, info_embed)
+        board_embed = await funcs.get_leaderboard(guild_id, "all", True)
+        guilds[guild_id].board_msg_id = (await channel.send(embed=board_embed)).id
+        funcs.record_render(guilds[guild_id].board_msg_id, board_embed)
     except discord.Forbidden:
         await interaction.response.send_message(
             "I don't have permission to send messages in that channel. Please choose a different channel or update my permissions."
         )
         return
 
-    update_time_and_save(guild_id, guilds)
+    persistence_manager.update_time(guild_id)
     await interaction.response.send_message(
         f"Channel updated. Leaderboard will be displayed in {channel.mention}."
     )
@@ -428,8 +483,11 @@ async def delete(interaction: discord.Interaction):
     )
 
     await funcs.update_info(guild_id)
-    del guilds[guild_id]
-    update_time_and_save(guild_id, guilds)
+    async with guild_actors.turn(guild_id):
+        funcs.rendered.pop(guilds[guild_id].info_msg_id, None)
+        funcs.rendered.pop(guilds[guild_id].board_msg_id, None)
+        del guilds[guild_id]
+        persistence_manager.mark_guild_deleted(guild_id)
 
     os.remove("deleted_data.json")
 
@@ -440,7 +498,8 @@ async def delete(interaction: discord.Interaction):
     timeframe="Optional. The timeframe to show the leaderboard for. Defaults to all time."
 )
 async def leaderboard(
-    interaction: discord.Interaction, timeframe: Literal["all", "week", "month"] = "all"
+    interaction: discord.Interaction,
+    timeframe: Literal["all", "day", "week", "month", "quarter", "year"] = "all",
 ):
     guild_id = interaction.guild.id
     if guild_id not in guilds:
@@ -451,15 +510,24 @@ async def leaderboard(
 
     timeframe = timeframe.lower()
 
-    if timeframe not in ["all", "week", "month"]:
+    if timeframe not in ["all", "day", "week", "month", "quarter", "year"]:
         await interaction.response.send_message(
-            "Invalid timeframe. Must be one of: `all`, `day`, `week`, `month`."
+            "Invalid timeframe. Must be one of: `all`, `day`, `week`, `month`, `quarter`, `year`."
         )
         return
 
-    await interaction.response.send_message(
-        embed=await funcs.get_leaderboard(guild_id, timeframe)
+    embed, page_count = await funcs.get_leaderboard_page(guild_id, timeframe, 0)
+    if page_count == 1:
+        await interaction.response.send_message(embed=embed)
+        return
+
+    view = PageView(
+        interaction.user.id,
+        lambda page: funcs.get_leaderboard_page(guild_id, timeframe, page),
+        page_count,
     )
+    await interaction.response.send_message(embed=embed, view=view)
+    view.message = await interaction.original_response()
 
 
 @tree.command(name="logging", description="Enable or disable logging of aura changes.")
@@ -502,7 +570,7 @@ async def logging(
             return
         guilds[guild_id].log_channel_id = None
         await interaction.response.send_message("Logging disabled.")
-    update_time_and_save(guild_id, guilds)
+    persistence_manager.update_time(guild_id)
 
 
 @tree.command(name="aura", description="Check your or another person's aura.")
@@ -551,19 +619,19 @@ async def change_aura(
         )
         return
 
-    if user.id not in guilds[guild_id].users:
-        await interaction.response.send_message(
-            "This user has had no interactions yet."
-        )
-        return
+    async with guild_actors.turn(guild_id):
+        if user.id not in guilds[guild_id].users:
+            await interaction.response.send_message(
+                "This user has had no interactions yet."
+            )
+            return
 
-    guilds[guild_id].users[user.id].aura += amount
+        persistence_manager.apply_change(guild_id, user.id, aura=amount)
     # add to log
     if guilds[guild_id].log_channel_id is not None:
         logging_manager.log_event(
             guild_id, user.id, interaction.user.id, LogEvent.MANUAL, amount
         )
-    update_time_and_save(guild_id, guilds)
     await interaction.response.send_message(f"Changed <@{user.id}>'s aura by {amount}.")
 
 
@@ -587,47 +655,49 @@ async def deny(
         )
         return
 
-    if user.id not in guilds[guild_id].users:
-        await interaction.response.send_message(
-            "This user has had no interactions yet."
-        )
-        return
-
-    action = action.lower()
-    if action not in ["give", "receive", "both"]:
-        await interaction.response.send_message(
-            "Invalid action. Must be one of: `give`, `receive`, `both`."
-        )
-        return
+    async with guild_actors.turn(guild_id):
+        if user.id not in guilds[guild_id].users:
+            await interaction.response.send_message(
+                "This user has had no interactions yet."
+            )
+            return
 
-    match action:
-        case "give":
-            if not guilds[guild_id].users[user.id].giving_allowed:
-                await interaction.response.send_message(
-                    "This user is already denied from giving aura."
-                )
-                return
-            guilds[guild_id].users[user.id].giving_allowed = False
-        case "receive":
-            if not guilds[guild_id].users[user.id].receiving_allowed:
-                await interaction.response.send_message(
-                    "This user is already denied from receiving aura."
-                )
-                return
-            guilds[guild_id].users[user.id].receiving_allowed = False
-        case "both":
-            if (
-                not guilds[guild_id].users[user.id].giving_allowed
-                and not guilds[guild_id].users[user.id].receiving_allowed
-            ):
-                await interaction.response.send_message(
-                    "This user is already denied from giving and receiving aura."
-                )
-                return
-            guilds[guild_id].users[user.id].giving_allowed = False
-            guilds[guild_id].users[user.id].receiving_allowed = False
+        action = action.lower()
+        if action not in ["give", "receive", "both"]:
+            await interaction.response.send_message(
+                "Invalid action. Must be one of: `give`, `receive`, `both`."
+            )
+            return
 
-    update_time_and_save(guild_id, guilds)
+        match action:
+            case "give":
+                if not guilds[guild_id].users[user.id].giving_allowed:
+                    await interaction.response.send_message(
+                        "This user is already denied from giving aura."
+                    )
+                    return
+                guilds[guild_id].users[user.id].giving_allowed = False
+            case "receive":
+                if not guilds[guild_id].users[user.id].receiving_allowed:
+                    await interaction.response.send_message(
+                        "This user is already denied from receiving aura."
+                    )
+                    return
+                guilds[guild_id].users[user.id].receiving_allowed = False
+            case "both":
+                if (
+                    not guilds[guild_id].users[user.id].giving_allowed
+                    and not guilds[guild_id].users[user.id].receiving_allowed
+                ):
+                    await interaction.response.send_message(
+                        "This user is already denied from giving and receiving aura."
+                    )
+                    return
+                guilds[guild_id].users[user.id].giving_allowed = False
+                guilds[guild_id].users[user.id].receiving_allowed = False
+
+        persistence_manager.mark_user(guild_id, user.id)
+        persistence_manager.update_time(guild_id)
 
     event = (
         LogEvent.DENY_GIVING
@@ -660,47 +730,49 @@ async def allow(
         )
         return
 
-    if user.id not in guilds[guild_id].users:
-        await interaction.response.send_message(
-            "This user has had no interactions yet."
-        )
-        return
-
-    action = action.lower()
-    if action not in ["give", "receive", "both"]:
-        await interaction.response.send_message(
-            "Invalid action. Must be one of: `give`, `receive`, `both`."
-        )
-        return
+    async with guild_actors.turn(guild_id):
+        if user.id not in guilds[guild_id].users:
+            await interaction.response.send_message(
+                "This user has had no interactions yet."
+            )
+            return
 
-    match action:
-        case "give":
-            if guilds[guild_id].users[user.id].giving_allowed:
-                await interaction.response.send_message(
-                    "This user is already allowed to give aura."
-                )
-                return
-            guilds[guild_id].users[user.id].giving_allowed = True
-        case "receive":
-            if guilds[guild_id].users[user.id].receiving_allowed:
-                await interaction.response.send_message(
-                    "This user is already allowed to receive aura."
-                )
-                return
-            guilds[guild_id].users[user.id].receiving_allowed = True
-        case "both":
-            if (
-                guilds[guild_id].users[user.id].giving_allowed
-                and guilds[guild_id].users[user.id].receiving_allowed
-            ):
-                await interaction.response.send_message(
-                    "This user is already allowed to give and receive aura."
-                )
-                return
-            guilds[guild_id].users[user.id].giving_allowed = True
-            guilds[guild_id].users[user.id].receiving_allowed = True
+        action = action.lower()
+        if action not in ["give", "receive", "both"]:
+            await interaction.response.send_message(
+                "Invalid action. Must be one of: `give`, `receive`, `both`."
+            )
+            return
 
-    update_time_and_save(guild_id, guilds)
+        match action:
+            case "give":
+                if guilds[guild_id].users[user.id].giving_allowed:
+                    await interaction.response.send_message(
+                        "This user is already allowed to give aura."
+                    )
+                    return
+                guilds[guild_id].users[user.id].giving_allowed = True
+            case "receive":
+                if guilds[guild_id].users[user.id].receiving_allowed:
+                    await interaction.response.send_message(
+                        "This user is already allowed to receive aura."
+                    )
+                    return
+                guilds[guild_id].users[user.id].receiving_allowed = True
+            case "both":
+                if (
+                    guilds[guild_id].users[user.id].giving_allowed
+                    and guilds[guild_id].users[user.id].receiving_allowed
+                ):
+                    await interaction.response.send_message(
+                        "This user is already allowed to give and receive aura."
+                    )
+                    return
+                guilds[guild_id].users[user.id].giving_allowed = True
+                guilds[guild_id].users[user.id].receiving_allowed = True
+
+        persistence_manager.mark_user(guild_id, user.id)
+        persistence_manager.update_time(guild_id)
 
     event = (
         LogEvent.ALLOW_GIVING
@@ -723,15 +795,17 @@ async def opt_in(interaction: discord.Interaction):
         )
         return
 
-    if interaction.user.id not in guilds[guild_id].users:
-        guilds[guild_id].users[interaction.user.id] = User()
+    async with guild_actors.turn(guild_id):
+        if interaction.user.id not in guilds[guild_id].users:
+            guilds[guild_id].users[interaction.user.id] = User()
 
-    if guilds[guild_id].users[interaction.user.id].opted_in:
-        await interaction.response.send_message("You are already opted in.")
-        return
+        if guilds[guild_id].users[interaction.user.id].opted_in:
+            await interaction.response.send_message("You are already opted in.")
+            return
 
-    guilds[guild_id].users[interaction.user.id].opted_in = True
-    update_time_and_save(guild_id, guilds)
+        guilds[guild_id].users[interaction.user.id].opted_in = True
+        persistence_manager.mark_user(guild_id, interaction.user.id)
+        persistence_manager.update_time(guild_id)
     await interaction.response.send_message("You are now opted in.")
 
 
@@ -745,15 +819,17 @@ async def opt_out(interaction: discord.Interaction):
         )
         return
 
-    if interaction.user.id not in guilds[guild_id].users:
-        guilds[guild_id].users[interaction.user.id] = User()
+    async with guild_actors.turn(guild_id):
+        if interaction.user.id not in guilds[guild_id].users:
+            guilds[guild_id].users[interaction.user.id] = User()
 
-    if not guilds[guild_id].users[interaction.user.id].opted_in:
-        await interaction.response.send_message("You are already opted out.")
-        return
+        if not guilds[guild_id].users[interaction.user.id].opted_in:
+            await interaction.response.send_message("You are already opted out.")
+            return
 
-    guilds[guild_id].users[interaction.user.id].opted_in = False
-    update_time_and_save(guild_id, guilds)
+        guilds[guild_id].users[interaction.user.id].opted_in = False
+        persistence_manager.mark_user(guild_id, interaction.user.id)
+        persistence_manager.update_time(guild_id)
     await interaction.response.send_message("You are now opted out.")
 
 
@@ -774,36 +850,40 @@ async def add_emoji(interaction: discord.Interaction, emoji: str, points: int):
         )
         return
 
-    if emoji in guilds[guild_id].reactions:
-        await interaction.response.send_message(
-            "This emoji is already being tracked. Use </emoji update:1356180634602700863> to update its points or </emoji remove:1356180634602700863> to remove it."
-        )
-        return
-
-    if points == 0:
-        await interaction.response.send_message(
-            "Points cannot be 0. Please use a positive or negative number."
-        )
-        return
+    async with guild_actors.turn(guild_id):
+        if emoji in guilds[guild_id].reactions:
+            await interaction.response.send_message(
+                "This emoji is already being tracked. Use </emoji update:1356180634602700863> to update its points or </emoji remove:1356180634602700863> to remove it."
+            )
+            return
 
-    try:
-        if is_emoji(emoji) or discord.utils.get(
-            interaction.guild.emojis, id=int(emoji.split(":")[2][:-1])
-        ):
-            guilds[guild_id].reactions[emoji] = EmojiReaction(points=points)
-            update_time_and_save(guild_id, guilds)
-            await funcs.update_info(guild_id)
+        if points == 0:
             await interaction.response.send_message(
-                f"Emoji {emoji} added: worth {'+' if points > 0 else ''}{points} points."
+                "Points cannot be 0. Please use a positive or negative number."
             )
-        else:
+            return
+
+        try:
+            valid = is_emoji(emoji) or discord.utils.get(
+                interaction.guild.emojis, id=int(emoji.split(":")[2][:-1])
+            )
+        except IndexError:
+            await interaction.response.send_message("This is not a valid emoji.")
+            return
+
+        if not valid:
             await interaction.response.send_message(
                 "This emoji is not from this server, or is not a valid emoji."
             )
             return
-    except IndexError:
-        await interaction.response.send_message("This is not a valid emoji.")
-        return
+
+        guilds[guild_id].reactions[emoji] = EmojiReaction(points=points)
+        persistence_manager.mark_reaction(guild_id, emoji)
+        persistence_manager.update_time(guild_id)
+    await funcs.update_info(guild_id)
+    await interaction.response.send_message(
+        f"Emoji {emoji} added: worth {'+' if points > 0 else ''}{points} points."
+    )
 
 
 @emoji_group.command(name="remove", description="Remove an emoji from tracking.")
@@ -820,14 +900,16 @@ async def remove_emoji(interaction: discord.Interaction, emoji: str):
         )
         return
 
-    if emoji not in guilds[guild_id].reactions:
-        await interaction.response.send_message(
-            "This emoji is already not being tracked."
-        )
-        return
+    async with guild_actors.turn(guild_id):
+        if emoji not in guilds[guild_id].reactions:
+            await interaction.response.send_message(
+                "This emoji is already not being tracked."
+            )
+            return
 
-    del guilds[guild_id].reactions[emoji]
-    update_time_and_save(guild_id, guilds)
+        del guilds[guild_id].reactions[emoji]
+        persistence_manager.mark_reaction(guild_id, emoji)
+        persistence_manager.update_time(guild_id)
     await funcs.update_info(guild_id)
     await interaction.response.send_message(f"Emoji {emoji} removed from tracking.")
 
@@ -849,20 +931,22 @@ async def update_emoji(interaction: discord.Interaction, emoji: str, points: int
         )
         return
 
-    if emoji not in guilds[guild_id].reactions:
-        await interaction.response.send_message(
-            "This emoji is not being tracked yet. Use </emoji add:1356180634602700863> to add it."
-        )
-        return
+    async with guild_actors.turn(guild_id):
+        if emoji not in guilds[guild_id].reactions:
+            await interaction.response.send_message(
+                "This emoji is not being tracked yet. Use </emoji add:1356180634602700863> to add it."
+            )
+            return
 
-    if points == 0:
-        await interaction.response.send_message(
-            "Points cannot be 0. Please use a positive or negative number."
-        )
-        return
+        if points == 0:
+            await interaction.response.send_message(
+                "Points cannot be 0. Please use a positive or negative number."
+            )
+            return
 
-    guilds[guild_id].reactions[emoji].points = points
-    update_time_and_save(guild_id, guilds)
+        guilds[guild_id].reactions[emoji].points = points
+        persistence_manager.mark_reaction(guild_id, emoji)
+        persistence_manager.update_time(guild_id)
     await funcs.update_info(guild_id)
     await interaction.response.send_message(
         f"Emoji {emoji} updated: worth {points} points."
@@ -882,7 +966,18 @@ async def list_emoji(interaction: discord.Interaction):
         )
         return
 
-    await interaction.response.send_message(embed=funcs.get_emoji_list(guild_id))
+    embed, page_count = await funcs.get_emoji_page(guild_id, 0)
+    if page_count == 1:
+        await interaction.response.send_message(embed=embed)
+        return
+
+    view = PageView(
+        interaction.user.id,
+        lambda page: funcs.get_emoji_page(guild_id, page),
+        page_count,
+    )
+    await interaction.response.send_message(embed=embed, view=view)
+    view.message = await interaction.original_response()
 
 
 @config_group.command(name="view", description="View the bot's configuration.")
@@ -981,7 +1076,8 @@ async def config_edit(
         case _:
             await interaction.response.send_message("Invalid key.")
             return
-    update_time_and_save(guild_id, guilds)
+    persistence_manager.mark_limits(guild_id)
+    persistence_manager.update_time(guild_id)
     await interaction.response.send_message(f"Updated {key} to {value}.")
 
 
@@ -1002,7 +1098,8 @@ async def config_reset(interaction: discord.Interaction):
         return
 
     guilds[guild_id].limits = Limits()
-    update_time_and_save(guild_id, guilds)
+    persistence_manager.mark_limits(guild_id)
+    persistence_manager.update_time(guild_id)
     await interaction.response.send_message("Configuration reset to default.")
 
 
@@ -1041,9 +1138,12 @@ async def clear_emojis(interaction: discord.Interaction):
         f"Cleared all emojis. If this was a mistake, join the support server to restore data. Final data is attached.",
         file=discord.File("emojis_data.json"),
     )
-    guilds[guild_id].reactions = {}
+    async with guild_actors.turn(guild_id):
+        for emoji in guilds[guild_id].reactions:
+            persistence_manager.mark_reaction(guild_id, emoji)
+        guilds[guild_id].reactions = {}
 
-    update_time_and_save(guild_id, guilds)
+        persistence_manager.update_time(guild_id)
     await funcs.update_info(guild_id)
 
     os.remove("emojis_data.json")
@@ -1082,12 +1182,19 @@ async def clear_leaderboard(interaction: discord.Interaction):
         f"Cleared all user and aura data. If this was a mistake, join the support server to restore data. Final data is attached.",
         file=discord.File("user_data.json"),
     )
-    guilds[guild_id].users = {}
+    async with guild_actors.turn(guild_id):
+        guilds[guild_id].users = {}
 
-    update_time_and_save(guild_id, guilds)
+        persistence_manager.mark_users_cleared(guild_id)
+        persistence_manager.update_time(guild_id)
     await funcs.update_info(guild_id)
-    await tasks_manager.update_leaderboards(True)
 
     os.remove("user_data.json")
 
 client.run(TOKEN)
+
+# flush anything still pending once the client has shut down
+asyncio.run(persistence_manager.flush())
+asyncio.run(ban_manager.save())
+asyncio.run(timelines_manager.save_authors())
+connection_manager.close()
@@ -0,0 +1,377 @@
+"""Versioned schema migrations for the Aura database, tracked with `PRAGMA user_version`."""
+
+import sqlite3
+
+# STRICT tables need SQLite 3.37+
+STRICT = ", STRICT" if sqlite3.sqlite_version_info >= (3, 37, 0) else ""
+
+
+def _create_tables(cursor: sqlite3.Cursor) -> None:
+    """Create the original tables and the aura journal."""
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS guilds (
+            id INTEGER PRIMARY KEY,
+            info_msg_id INTEGER,
+            board_msg_id INTEGER,
+            msgs_channel_id INTEGER,
+            log_channel_id INTEGER,
+            last_update INTEGER
+        )
+    """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            guild_id INTEGER,
+            user_id INTEGER,
+            aura INTEGER,
+            aura_contribution INTEGER,
+            num_pos_given INTEGER,
+            num_pos_received INTEGER,
+            num_neg_given INTEGER,
+            num_neg_received INTEGER,
+            opted_in INTEGER,
+            giving_allowed INTEGER,
+            receiving_allowed INTEGER,
+            PRIMARY KEY (guild_id, user_id),
+            FOREIGN KEY (guild_id) REFERENCES guilds(id)
+        )
+    """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS reactions (
+            guild_id INTEGER,
+            emoji TEXT,
+            points INTEGER,
+            PRIMARY KEY (guild_id, emoji),
+            FOREIGN KEY (guild_id) REFERENCES guilds(id)
+        )
+    """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS limits (
+            guild_id INTEGER PRIMARY KEY,
+            interval_long INTEGER,
+            threshold_long INTEGER,
+            interval_short INTEGER,
+            threshold_short INTEGER,
+            penalty INTEGER,
+            adding_cooldown INTEGER,
+            removing_cooldown INTEGER,
+            FOREIGN KEY (guild_id) REFERENCES guilds(id)
+        )
+    """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS user_snapshots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            aura INTEGER NOT NULL,
+            aura_contribution INTEGER NOT NULL,
+            num_pos_given INTEGER NOT NULL,
+            num_pos_received INTEGER NOT NULL,
+            num_neg_given INTEGER NOT NULL,
+            num_neg_received INTEGER NOT NULL,
+            snapshot_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (guild_id) REFERENCES guilds (id),
+            FOREIGN KEY (guild_id, user_id) REFERENCES users (guild_id, user_id)
+        )
+    """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS user_info (
+            user_id INTEGER PRIMARY KEY,
+            avatar_url TEXT,
+            bot INTEGER
+        )
+    """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS aura_journal (
+            seq INTEGER PRIMARY KEY,
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            aura INTEGER NOT NULL,
+            aura_contribution INTEGER NOT NULL,
+            num_pos_given INTEGER NOT NULL,
+            num_pos_received INTEGER NOT NULL,
+            num_neg_given INTEGER NOT NULL,
+            num_neg_received INTEGER NOT NULL,
+            created INTEGER NOT NULL
+        )
+    """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS journal_state (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            compacted_seq INTEGER NOT NULL
+        )
+    """
+    )
+
+    cursor.execute(
+        "INSERT OR IGNORE INTO journal_state (id, compacted_seq) VALUES (0, 0)"
+    )
+
+
+def _index_snapshots(cursor: sqlite3.Cursor) -> None:
+    """Index user_snapshots for per-guild timeframe lookups and the retention cleanup."""
+    # covers the timeframe leaderboard query without touching the table
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_user_snapshots_guild_time
+        ON user_snapshots (guild_id, snapshot_time, user_id, aura)
+    """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_user_snapshots_time
+        ON user_snapshots (snapshot_time)
+    """
+    )
+
+
+def _rebuild_hot_tables(cursor: sqlite3.Cursor) -> None:
+    """Rebuild users and reactions as WITHOUT ROWID (and STRICT where supported).
+
+    Both are keyed on a composite primary key, so without a rowid each row is stored once, clustered by guild, instead of in a table plus a separate key index."""
+    cursor.execute(
+        f"""
+        CREATE TABLE users_new (
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            aura INTEGER NOT NULL DEFAULT 0,
+            aura_contribution INTEGER NOT NULL DEFAULT 0,
+            num_pos_given INTEGER NOT NULL DEFAULT 0,
+            num_pos_received INTEGER NOT NULL DEFAULT 0,
+            num_neg_given INTEGER NOT NULL DEFAULT 0,
+            num_neg_received INTEGER NOT NULL DEFAULT 0,
+            opted_in INTEGER NOT NULL DEFAULT 1,
+            giving_allowed INTEGER NOT NULL DEFAULT 1,
+            receiving_allowed INTEGER NOT NULL DEFAULT 1,
+            PRIMARY KEY (guild_id, user_id),
+            FOREIGN KEY (guild_id) REFERENCES guilds(id)
+        ) WITHOUT ROWID{STRICT}
+    """
+    )
+    cursor.execute("INSERT INTO users_new SELECT * FROM users")
+    cursor.execute("DROP TABLE users")
+    cursor.execute("ALTER TABLE users_new RENAME TO users")
+
+    cursor.execute(
+        f"""
+        CREATE TABLE reactions_new (
+            guild_id INTEGER NOT NULL,
+            emoji TEXT NOT NULL,
+            points INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, emoji),
+            FOREIGN KEY (guild_id) REFERENCES guilds(id)
+        ) WITHOUT ROWID{STRICT}
+    """
+    )
+    cursor.execute("INSERT INTO reactions_new SELECT * FROM reactions")
+    cursor.execute("DROP TABLE reactions")
+    cursor.execute("ALTER TABLE reactions_new RENAME TO reactions")
+
+
+def _delta_snapshots(cursor: sqlite3.Cursor) -> None:
+    """Index user_snapshots by user and delete every snapshot identical to the same user's previous one.
+
+    Snapshots are now only taken of users whose stats changed, so the value at any time is the user's latest snapshot at or before it, which this keeps intact."""
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_user_snapshots_user
+        ON user_snapshots (guild_id, user_id)
+    """
+    )
+    cursor.execute(
+        """
+        DELETE FROM user_snapshots
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT
+                    id, aura, aura_contribution,
+                    num_pos_given, num_pos_received, num_neg_given, num_neg_received,
+                    LAG(aura) OVER w AS prev_aura,
+                    LAG(aura_contribution) OVER w AS prev_aura_contribution,
+                    LAG(num_pos_given) OVER w AS prev_num_pos_given,
+                    LAG(num_pos_received) OVER w AS prev_num_pos_received,
+                    LAG(num_neg_given) OVER w AS prev_num_neg_given,
+                    LAG(num_neg_received) OVER w AS prev_num_neg_received
+                FROM user_snapshots
+                WINDOW w AS (PARTITION BY guild_id, user_id ORDER BY id)
+            )
+            WHERE aura IS prev_aura
+            AND aura_contribution IS prev_aura_contribution
+            AND num_pos_given IS prev_num_pos_given
+            AND num_pos_received IS prev_num_pos_received
+            AND num_neg_given IS prev_num_neg_given
+            AND num_neg_received IS prev_num_neg_received
+        )
+    """
+    )
+    print(f"Removed {cursor.rowcount} unchanged snapshots.")
+
+
+def _snapshot_resolution(cursor: sqlite3.Cursor) -> None:
+    """Add the resolution tier to user_snapshots and include it in the indexes."""
+    cursor.execute(
+        "ALTER TABLE user_snapshots ADD COLUMN resolution INTEGER NOT NULL DEFAULT 0"
+    )
+    cursor.execute("DROP INDEX IF EXISTS idx_user_snapshots_guild_time")
+    cursor.execute("DROP INDEX IF EXISTS idx_user_snapshots_time")
+    cursor.execute(
+        """
+        CREATE INDEX idx_user_snapshots_guild_time
+        ON user_snapshots (guild_id, snapshot_time, resolution, user_id, aura)
+    """
+    )
+    # rollups select one tier's snapshots older than its retention
+    cursor.execute(
+        """
+        CREATE INDEX idx_user_snapshots_resolution_time
+        ON user_snapshots (resolution, snapshot_time)
+    """
+    )
+
+
+def _index_snapshot_baselines(cursor: sqlite3.Cursor) -> None:
+    """Index user_snapshots by user and time, so a user's baseline at any time is a single index seek.
+
+    Replaces the per-guild time index, which timeframe leaderboards no longer scan, and the plain per-user index."""
+    cursor.execute("DROP INDEX IF EXISTS idx_user_snapshots_guild_time")
+    cursor.execute("DROP INDEX IF EXISTS idx_user_snapshots_user")
+    cursor.execute(
+        """
+        CREATE INDEX idx_user_snapshots_user_time
+        ON user_snapshots (guild_id, user_id, snapshot_time, resolution, aura)
+    """
+    )
+
+
+def _period_baselines(cursor: sqlite3.Cursor) -> None:
+    """Create the tables holding each user's baseline aura for the timeframe leaderboards."""
+    cursor.execute(
+        f"""
+        CREATE TABLE period_baselines (
+            guild_id INTEGER NOT NULL,
+            timeframe TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            aura INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, timeframe, user_id)
+        ) WITHOUT ROWID{STRICT}
+    """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE baseline_state (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            built INTEGER NOT NULL
+        )
+    """
+    )
+    cursor.execute("INSERT INTO baseline_state (id, built) VALUES (0, 0)")
+
+
+def _temp_bans(cursor: sqlite3.Cursor) -> None:
+    """Create the table holding the snapshot of active temporary bans."""
+    cursor.execute(
+        f"""
+        CREATE TABLE temp_bans (
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            expires INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, user_id)
+        ) WITHOUT ROWID{STRICT}
+    """
+    )
+
+
+def _message_authors(cursor: sqlite3.Cursor) -> None:
+    """Create the table holding the authors of reacted to messages."""
+    cursor.execute(
+        f"""
+        CREATE TABLE message_authors (
+            message_id INTEGER NOT NULL PRIMARY KEY,
+            author_id INTEGER NOT NULL
+        ) WITHOUT ROWID{STRICT}
+    """
+    )
+
+
+# (version, description, migration). Append new migrations to the end; never edit or reorder applied ones.
+MIGRATIONS = [
+    (1, "create tables", _create_tables),
+    (2, "index user_snapshots", _index_snapshots),
+    (3, "rebuild users and reactions without rowid", _rebuild_hot_tables),
+    (4, "delta-only snapshots", _delta_snapshots),
+    (5, "snapshot resolution tiers", _snapshot_resolution),
+    (6, "index snapshot baselines", _index_snapshot_baselines),
+    (7, "period baselines", _period_baselines),
+    (8, "temporary ban snapshot", _temp_bans),
+    (9, "message authors", _message_authors),
+]
+
+
+def _used_bytes(conn: sqlite3.Connection) -> int:
+    """Get the number of bytes in use by the database, excluding free pages."""
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    freelist_count = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return (page_count - freelist_count) * page_size
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Apply every migration newer than the database's `user_version`, each in its own transaction.
+
+    Parameters
+    ----------
+    conn: `sqlite3.Connection`
+        A writable connection with no open transaction.
+
+    Returns
+    -------
+    `int`
+        The schema version after migrating.
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+
+    for target, description, migration in MIGRATIONS:
+        if target <= version:
+            continue
+
+        before = _used_bytes(conn)
+        cursor = conn.cursor()
+        conn.execute("BEGIN")
+        try:
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        after = _used_bytes(conn)
+
+        print(
+            f"Migrated database to version {target} ({description}): {before / 1024:.0f} KiB -> {after / 1024:.0f} KiB in use."
+        )
+        version = target
+
+    return version
@@ -67,6 +67,38 @@ class LogEvent(Enum):
         return self.value
 
 
+class SnapshotResolution(Enum):
+    """Enumeration that represents the resolution tier of a user snapshot, from finest to coarsest.
+
+    Members
+    --------
+    RAW: `SnapshotResolution`
+        Represents a snapshot as taken, twice a day.
+    DAILY: `SnapshotResolution`
+        Represents the last snapshot of a day.
+    WEEKLY: `SnapshotResolution`
+        Represents the last snapshot of a week.
+    MONTHLY: `SnapshotResolution`
+        Represents the last snapshot of a month.
+
+    Attributes
+    ----------
+    level: `int`
+        The value stored in the `resolution` column. Higher is coarser.
+    period: `str | None`
+        The `strftime` format naming the period each snapshot of this tier covers.
+    """
+
+    RAW = (0, None)
+    DAILY = (1, "%Y-%m-%d")
+    WEEKLY = (2, "%Y-%W")
+    MONTHLY = (3, "%Y-%m")
+
+    def __init__(self, level: int, period: str | None):
+        self.level = level
+        self.period = period
+
+
 @dataclass
 class GlobalUser:
     """Class that represents a user's global information.
@@ -121,21 +153,6 @@ class User:
     receiving_allowed: bool = True
 
 
-@dataclass
-class UserCooldowns:
-    """Class that represents the cooldowns for a user in a guild.
-
-    Attributes
-    ----------
-    add_cooldown_began: `int`
-        The timestamp when the add cooldown began.
-    remove_cooldown_began: `int`
-        The timestamp when the remove cooldown began."""
-
-    add_cooldown_began: int = 0
-    remove_cooldown_began: int = 0
-
-
 @dataclass
 class EmojiReaction:
     """Class that represents an emoji reaction in a guild.
@@ -218,3 +235,68 @@ class Guild:
     log_channel_id: int = None
     last_update: int = None
     limits: Limits = field(default_factory=Limits)
+
+
+@dataclass
+class PendingChanges:
+    """Class that represents the rows that have changed since the last flush to the database.
+
+    A key that is marked but no longer exists in memory is deleted from the database when flushed.
+
+    Attributes
+    ----------
+    guilds: `set[int]`
+        The IDs of guilds whose `guilds` row has changed.
+    deleted_guilds: `set[int]`
+        The IDs of guilds whose data should be deleted entirely.
+    cleared_users: `set[int]`
+        The IDs of guilds whose users should all be deleted before any changed users are written.
+    users: `set[tuple[int, int]]`
+        The guild-user pairs whose `users` row has changed.
+    reactions: `set[tuple[int, str]]`
+        The guild-emoji pairs whose `reactions` row has changed.
+    limits: `set[int]`
+        The IDs of guilds whose `limits` row has changed.
+    user_info: `set[int]`
+        The IDs of users whose `user_info` row has changed.
+    first_change: `float`
+        The monotonic time of the oldest unflushed change, or `None` if nothing is pending."""
+
+    guilds: set[int] = field(default_factory=set)
+    deleted_guilds: set[int] = field(default_factory=set)
+    cleared_users: set[int] = field(default_factory=set)
+    users: set[tuple[int, int]] = field(default_factory=set)
+    reactions: set[tuple[int, str]] = field(default_factory=set)
+    limits: set[int] = field(default_factory=set)
+    user_info: set[int] = field(default_factory=set)
+    first_change: float = None
+
+    def __len__(self) -> int:
+        return (
+            len(self.guilds)
+            + len(self.deleted_guilds)
+            + len(self.cleared_users)
+            + len(self.users)
+            + len(self.reactions)
+            + len(self.limits)
+            + len(self.user_info)
+        )
+
+    def merge(self, other: "PendingChanges") -> None:
+        """Merge another set of pending changes into this one, e.g. after a failed flush.
+
+        Parameters
+        ----------
+        other: `PendingChanges`
+            The changes to merge in."""
+        self.guilds |= other.guilds
+        self.deleted_guilds |= other.deleted_guilds
+        self.cleared_users |= other.cleared_users
+        self.users |= other.users
+        self.reactions |= other.reactions
+        self.limits |= other.limits
+        self.user_info |= other.user_info
+        if other.first_change is not None and (
+            self.first_change is None or other.first_change < self.first_change
+        ):
+            self.first_change = other.first_change
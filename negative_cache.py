@@ -0,0 +1,52 @@
+"""Contains the NegativeCache class, which remembers the messages, channels and users that could not be resolved."""
+
+import time
+
+from collections import OrderedDict
+from collections.abc import Hashable
+
+from config import NEGATIVE_CACHE_TTL, NEGATIVE_CACHE_SIZE
+
+
+class NegativeCache:
+    """Class that remembers what could not be resolved, such as deleted messages, hidden channels and unknown users, so it is not fetched again.
+
+    Keys are `(kind, id)`, such as `("message", message_id)`. Entries expire `NEGATIVE_CACHE_TTL` seconds after they were added, and at most `NEGATIVE_CACHE_SIZE` are kept, oldest first out.
+    Every entry lives for the same time, so the entries are kept in the order they expire and dropped from the front as new ones are added.
+    """
+
+    def __init__(self) -> None:
+        """Initialise the NegativeCache with no entries."""
+        # (kind, ID) -> expiry, soonest first
+        self.entries: OrderedDict[tuple[str, Hashable], float] = OrderedDict()
+        self.hits = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: tuple[str, Hashable]) -> bool:
+        expires = self.entries.get(key)
+        if expires is None or expires <= time.monotonic():
+            return False
+        self.hits += 1
+        return True
+
+    def add(self, kind: str, id: Hashable) -> None:
+        """Remember that something could not be resolved for `NEGATIVE_CACHE_TTL` seconds, dropping expired entries and the oldest ones over `NEGATIVE_CACHE_SIZE`.
+
+        Parameters
+        ----------
+        kind: `str`
+            The kind of thing, such as `"message"`, `"channel"` or `"user"`.
+        id: `Hashable`
+            Its ID."""
+        now = time.monotonic()
+        key = (kind, id)
+        self.entries[key] = now + NEGATIVE_CACHE_TTL
+        self.entries.move_to_end(key)
+
+        while self.entries and (
+            len(self.entries) > NEGATIVE_CACHE_SIZE
+            or next(iter(self.entries.values())) <= now
+        ):
+            self.entries.popitem(last=False)
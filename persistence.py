@@ -0,0 +1,348 @@
+"""Contains the PersistenceManager class, which journals aura changes and writes changed rows to the database in batches."""
+
+import asyncio
+import sqlite3
+import time
+
+from discord.ext import tasks
+
+from models import *
+from database import ConnectionManager
+from guild_store import GuildStore
+from db_functions import (
+    prepare_changes,
+    write_changes,
+    append_journal,
+    load_journal,
+)
+from config import (
+    FLUSH_INTERVAL,
+    FLUSH_MAX_CHANGES,
+    FLUSH_MAX_LAG,
+    JOURNAL_COMPACT_INTERVAL,
+    JOURNAL_COMPACT_SIZE,
+)
+
+JOURNAL_FIELDS = (
+    "aura",
+    "aura_contribution",
+    "num_pos_given",
+    "num_pos_received",
+    "num_neg_given",
+    "num_neg_received",
+)
+
+
+class PersistenceManager:
+    """Class that persists guild data using an append-only aura journal and write-behind batching.
+
+    Aura changes are applied in memory and appended to the `aura_journal` table in batches every `FLUSH_INTERVAL` ms. Other mutations mark the specific rows they touch as dirty.
+    A flush writes only the dirty rows, plus every user the journal has touched, in one transaction, and truncates the journal up to the last entry it covers.
+    On startup, `replay_journal` applies the entries that were never folded on top of the loaded users.
+
+    Parameters
+    ----------
+    db: `ConnectionManager`
+        The connection manager to write the data with.
+    guilds: `GuildStore`
+        The guild store, mapping guild IDs to `Guild` objects.
+    user_info: `dict[int, GlobalUser]`
+        A dictionary of user information, where the key is the user ID and the value is a `GlobalUser` object.
+    """
+
+    def __init__(
+        self,
+        db: ConnectionManager,
+        guilds: GuildStore,
+        user_info: dict[int, GlobalUser],
+    ) -> None:
+        """Initialise the PersistenceManager with the guilds and user information to persist."""
+        self.db = db
+        self.guilds = guilds
+        self.user_info = user_info
+        self.pending = PendingChanges()
+        # rows already made durable by the journal, or cheap to lose: written at the next flush but never trigger one
+        self.deferred = PendingChanges()
+        # changes being written by a flush that has not committed yet
+        self.in_flight: list[PendingChanges] = []
+        self.flush_lock = asyncio.Lock()
+        self.journal: list[tuple] = []
+        self.last_seq = 0
+        self.compacted_seq = 0
+        self.last_compaction = time.monotonic()
+
+    def _changed(self) -> None:
+        """Record the time of the first change since the last flush."""
+        if self.pending.first_change is None:
+            self.pending.first_change = time.monotonic()
+
+    def _apply(self, guild_id: int, user_id: int, deltas: tuple[int, ...]) -> None:
+        """Add journal deltas to a user's stats in memory, creating the user if needed."""
+        if user_id not in self.guilds[guild_id].users:
+            self.guilds[guild_id].users[user_id] = User()
+        user = self.guilds[guild_id].users[user_id]
+        for name, delta in zip(JOURNAL_FIELDS, deltas):
+            if delta:
+                setattr(user, name, getattr(user, name) + delta)
+        self.guilds.rerank(guild_id, user_id)
+        self.deferred.users.add((guild_id, user_id))
+
+    def apply_change(self, guild_id: int, user_id: int, **deltas: int) -> None:
+        """Apply an aura change to a user and append it to the journal.
+
+        Also updates the guild's last update time.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The ID of the guild.
+        user_id: `int`
+            The ID of the user.
+        **deltas: `int`
+            The amount to add to each changed stat, e.g. `aura=1, num_pos_received=1`. Any of `JOURNAL_FIELDS`."""
+        values = tuple(deltas.pop(name, 0) for name in JOURNAL_FIELDS)
+        if deltas:
+            raise ValueError(f"Unknown journal fields: {', '.join(deltas)}")
+
+        self._apply(guild_id, user_id, values)
+        self.last_seq += 1
+        self.journal.append(
+            (self.last_seq, guild_id, user_id, *values, int(time.time()))
+        )
+
+        self.guilds[guild_id].last_update = int(time.time())
+        self.deferred.guilds.add(guild_id)
+
+    def apply_changes(self, changes: dict[tuple[int, int], dict[str, int]]) -> None:
+        """Apply a batch of aura changes, appending one journal entry per user.
+
+        Users whose changes cancel out are skipped. Also updates the last update time of each guild once.
+
+        Parameters
+        ----------
+        changes: `dict[tuple[int, int], dict[str, int]]`
+            The amount to add to each changed stat of each guild-user pair. Any of `JOURNAL_FIELDS`."""
+        now = int(time.time())
+        changed_guilds = set()
+        for (guild_id, user_id), deltas in changes.items():
+            values = tuple(deltas.get(name, 0) for name in JOURNAL_FIELDS)
+            if not any(values) or guild_id not in self.guilds:
+                continue
+
+            self._apply(guild_id, user_id, values)
+            self.last_seq += 1
+            self.journal.append((self.last_seq, guild_id, user_id, *values, now))
+            changed_guilds.add(guild_id)
+
+        for guild_id in changed_guilds:
+            self.guilds[guild_id].last_update = now
+            self.deferred.guilds.add(guild_id)
+
+    def replay_journal(self) -> None:
+        """Apply the journal entries that were not folded into the users table before the last shutdown.
+
+        Must be called once at startup, after the guilds have been loaded."""
+        self.compacted_seq, entries = load_journal(self.db)
+        self.last_seq = self.compacted_seq
+
+        for seq, guild_id, user_id, *values, _ in entries:
+            self.last_seq = max(self.last_seq, seq)
+            if guild_id in self.guilds:
+                self._apply(guild_id, user_id, tuple(values))
+
+        if entries:
+            print(f"Replayed {len(entries)} aura journal entries.")
+
+    def update_time(self, guild_id: int) -> None:
+        """Update the last update time for a guild and mark its row as changed.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The ID of the guild to update."""
+        if guild_id in self.guilds:
+            self.guilds[guild_id].last_update = int(time.time())
+        self.mark_guild(guild_id)
+
+    def mark_guild(self, guild_id: int) -> None:
+        """Mark a guild's row (message IDs, channels and last update) as changed.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The ID of the guild."""
+        self.pending.guilds.add(guild_id)
+        self._changed()
+
+    def mark_guild_created(self, guild_id: int) -> None:
+        """Mark every row belonging to a newly set up guild as changed.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The ID of the guild."""
+        guild = self.guilds[guild_id]
+        self.pending.guilds.add(guild_id)
+        self.pending.limits.add(guild_id)
+        self.pending.reactions.update((guild_id, emoji) for emoji in guild.reactions)
+        self.pending.users.update((guild_id, user_id) for user_id in guild.users)
+        self._changed()
+
+    def mark_guild_deleted(self, guild_id: int) -> None:
+        """Mark all of a guild's data for deletion. Call after removing it from `guilds`.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The ID of the guild."""
+        self.pending.deleted_guilds.add(guild_id)
+        self._changed()
+
+    def mark_user(self, guild_id: int, user_id: int) -> None:
+        """Mark a user's row in a guild as changed. If the user no longer exists it is deleted on flush.
+
+        Also moves the user to their current position in the guild's rank index.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The ID of the guild.
+        user_id: `int`
+            The ID of the user."""
+        self.guilds.rerank(guild_id, user_id)
+        self.pending.users.add((guild_id, user_id))
+        self._changed()
+
+    def mark_users_cleared(self, guild_id: int) -> None:
+        """Mark all of a guild's users for deletion. Call after clearing `users`.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The ID of the guild."""
+        self.guilds.drop_ranking(guild_id)
+        self.pending.cleared_users.add(guild_id)
+        self.pending.users = {key for key in self.pending.users if key[0] != guild_id}
+        self.deferred.users = {
+            key for key in self.deferred.users if key[0] != guild_id
+        }
+        self._changed()
+
+    def mark_reaction(self, guild_id: int, emoji: str) -> None:
+        """Mark an emoji reaction in a guild as changed. If the emoji is no longer tracked it is deleted on flush.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The ID of the guild.
+        emoji: `str`
+            The emoji."""
+        self.guilds.touch(guild_id)
+        self.pending.reactions.add((guild_id, emoji))
+        self._changed()
+
+    def mark_limits(self, guild_id: int) -> None:
+        """Mark a guild's limits as changed.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The ID of the guild."""
+        self.pending.limits.add(guild_id)
+        self._changed()
+
+    def mark_user_info(self, user_id: int) -> None:
+        """Mark a user's global information as changed.
+
+        User information can be refetched from Discord, so it is written with the next flush rather than triggering one.
+
+        Parameters
+        ----------
+        user_id: `int`
+            The ID of the user."""
+        self.deferred.user_info.add(user_id)
+
+    def dirty_guilds(self) -> set[int]:
+        """Get the IDs of guilds with changes that have not been written to the database.
+
+        Returns
+        -------
+        `set[int]`
+            The IDs of the dirty guilds."""
+        dirty = set()
+        for changes in (self.pending, self.deferred, *self.in_flight):
+            dirty |= changes.guilds | changes.cleared_users | changes.limits
+            dirty.update(guild_id for guild_id, _ in changes.users)
+            dirty.update(guild_id for guild_id, _ in changes.reactions)
+        return dirty
+
+    async def append_journal(self) -> None:
+        """Append the buffered journal entries to the database in one transaction on the writer thread.
+
+        If the write fails, the entries are kept and retried on the next append."""
+        entries = [entry for entry in self.journal if entry[0] > self.compacted_seq]
+        self.journal = []
+        if not entries:
+            return
+
+        try:
+            await self.db.run_write(append_journal, entries)
+        except sqlite3.Error as e:
+            print(f"Failed to append {len(entries)} journal entries: {e}")
+            self.journal = entries + self.journal
+
+    async def flush(self) -> None:
+        """Write all pending and journaled changes to the database in one transaction on the writer thread, folding the journal.
+
+        If the write fails, the changes are kept and retried on the next flush. Flushes run one at a time, so a flush never folds journal entries whose changes an earlier flush failed to write."""
+        async with self.flush_lock:
+            if not self.pending and not self.deferred:
+                return
+
+            pending, deferred, journal = self.pending, self.deferred, self.journal
+            compacted_seq = self.last_seq
+            self.pending = PendingChanges()
+            self.deferred = PendingChanges()
+            # every buffered entry is reflected in the rows, so it never needs appending
+            self.journal = []
+
+            changes = PendingChanges()
+            changes.merge(pending)
+            changes.merge(deferred)
+            self.in_flight.append(changes)
+            try:
+                await self.db.run_write(
+                    write_changes,
+                    prepare_changes(self.guilds, self.user_info, changes),
+                    compacted_seq,
+                )
+                self.compacted_seq = compacted_seq
+                self.last_compaction = time.monotonic()
+            except sqlite3.Error as e:
+                print(f"Failed to flush {len(changes)} changes: {e}")
+                pending.merge(self.pending)
+                deferred.merge(self.deferred)
+                self.pending, self.deferred = pending, deferred
+                self.journal = journal + self.journal
+            finally:
+                self.in_flight.remove(changes)
+
+    @tasks.loop(seconds=FLUSH_INTERVAL / 1000)
+    async def flush_changes(self):
+        """Append buffered journal entries, then flush once there are at least `FLUSH_MAX_CHANGES` pending rows, the oldest is `FLUSH_MAX_LAG` ms old, or the journal is due to be folded.
+
+        Runs every `FLUSH_INTERVAL` ms."""
+        if self.journal:
+            await self.append_journal()
+
+        if self.pending:
+            lag = (time.monotonic() - self.pending.first_change) * 1000
+            if len(self.pending) >= FLUSH_MAX_CHANGES or lag >= FLUSH_MAX_LAG:
+                await self.flush()
+                return
+
+        if self.deferred and (
+            self.last_seq - self.compacted_seq >= JOURNAL_COMPACT_SIZE
+            or time.monotonic() - self.last_compaction >= JOURNAL_COMPACT_INTERVAL
+        ):
+            await self.flush()
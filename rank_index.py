@@ -0,0 +1,198 @@
+"""Contains the RankIndex class, an indexable skip list that keeps a guild's users ordered by aura."""
+
+import random
+
+from models import User
+
+MAX_LEVELS = 24  # enough for ~16 million users per guild
+
+
+class _Node:
+    """A skip list node. `width[level]` is the number of positions to `next[level]`."""
+
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key: tuple[int, int], levels: int) -> None:
+        self.key = key
+        self.next: list[_Node] = [None] * levels
+        self.width: list[int] = [1] * levels
+
+
+def _random_levels() -> int:
+    """Pick a node height, each level half as likely as the one below."""
+    levels = 1
+    while levels < MAX_LEVELS and random.random() < 0.5:
+        levels += 1
+    return levels
+
+
+class RankIndex:
+    """Class that keeps a guild's opted in users ordered by aura, highest first, in an indexable skip list.
+
+    Updating a user, finding a user's rank and reading the user at a rank take O(log n). Users with equal aura are ordered by user ID.
+
+    Parameters
+    ----------
+    users: `dict[int, User]`
+        The guild's users. Only opted in users are indexed.
+    """
+
+    def __init__(self, users: dict[int, User]) -> None:
+        """Build the index from the guild's users in O(n log n)."""
+        self.head = _Node(None, MAX_LEVELS)
+        self.keys: dict[int, tuple[int, int]] = {
+            user_id: (-user.aura, user_id)
+            for user_id, user in users.items()
+            if user.opted_in
+        }
+
+        # link nodes in sorted order, tracking the last node and its position at each level
+        last = [self.head] * MAX_LEVELS
+        last_pos = [0] * MAX_LEVELS
+        for pos, key in enumerate(sorted(self.keys.values()), 1):
+            node = _Node(key, _random_levels())
+            for level in range(len(node.next)):
+                last[level].next[level] = node
+                last[level].width[level] = pos - last_pos[level]
+                last[level], last_pos[level] = node, pos
+        for level in range(MAX_LEVELS):
+            last[level].width[level] = len(self.keys) + 1 - last_pos[level]
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, user_id: object) -> bool:
+        return user_id in self.keys
+
+    def _insert(self, key: tuple[int, int]) -> None:
+        """Insert a key into the skip list."""
+        chain = [None] * MAX_LEVELS
+        steps = [0] * MAX_LEVELS
+        node = self.head
+        for level in reversed(range(MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].key < key:
+                steps[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        new = _Node(key, _random_levels())
+        distance = 0
+        for level in range(len(new.next)):
+            prev = chain[level]
+            new.next[level] = prev.next[level]
+            prev.next[level] = new
+            new.width[level] = prev.width[level] - distance
+            prev.width[level] = distance + 1
+            distance += steps[level]
+        for level in range(len(new.next), MAX_LEVELS):
+            chain[level].width[level] += 1
+
+    def _remove(self, key: tuple[int, int]) -> None:
+        """Remove a key from the skip list."""
+        chain = [None] * MAX_LEVELS
+        node = self.head
+        for level in reversed(range(MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+
+        target = chain[0].next[0]
+        for level in range(len(target.next)):
+            prev = chain[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+        for level in range(len(target.next), MAX_LEVELS):
+            chain[level].width[level] -= 1
+
+    def _node_at(self, index: int) -> _Node:
+        """Get the node at a 0-based position."""
+        node = self.head
+        remaining = index + 1
+        for level in reversed(range(MAX_LEVELS)):
+            while node.next[level] is not None and node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        return node
+
+    def update(self, user_id: int, user: User | None) -> None:
+        """Move a user to their current position, removing them if they no longer exist or opted out.
+
+        Parameters
+        ----------
+        user_id: `int`
+            The ID of the user.
+        user: `User | None`
+            The user's current data, or `None` if they were removed."""
+        key = (-user.aura, user_id) if user is not None and user.opted_in else None
+        old = self.keys.get(user_id)
+        if old == key:
+            return
+
+        if old is not None:
+            self._remove(old)
+            del self.keys[user_id]
+        if key is not None:
+            self._insert(key)
+            self.keys[user_id] = key
+
+    def rank(self, user_id: int) -> int | None:
+        """Get a user's 1-based rank.
+
+        Parameters
+        ----------
+        user_id: `int`
+            The ID of the user.
+
+        Returns
+        -------
+        `int | None`
+            The rank, or `None` if the user is not indexed."""
+        key = self.keys.get(user_id)
+        if key is None:
+            return None
+
+        node = self.head
+        rank = 0
+        for level in reversed(range(MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].key <= key:
+                rank += node.width[level]
+                node = node.next[level]
+        return rank
+
+    def page(self, start: int, count: int) -> list[tuple[int, int]]:
+        """Get a range of the leaderboard.
+
+        Parameters
+        ----------
+        start: `int`
+            The 0-based position of the first entry.
+        count: `int`
+            The maximum number of entries.
+
+        Returns
+        -------
+        `list[tuple[int, int]]`
+            The `(user_id, aura)` of each entry, highest aura first."""
+        if start >= len(self.keys) or count <= 0:
+            return []
+
+        entries = []
+        node = self._node_at(start)
+        while node is not None and len(entries) < count:
+            entries.append((node.key[1], -node.key[0]))
+            node = node.next[0]
+        return entries
+
+    def top(self, count: int) -> list[tuple[int, int]]:
+        """Get the top of the leaderboard.
+
+        Parameters
+        ----------
+        count: `int`
+            The maximum number of entries.
+
+        Returns
+        -------
+        `list[tuple[int, int]]`
+            The `(user_id, aura)` of each entry, highest aura first."""
+        return self.page(0, count)
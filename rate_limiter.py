@@ -0,0 +1,135 @@
+"""Contains the RateLimiter class, which counts each user's recent reactions in a short and a long sliding window."""
+
+import sys
+import time
+
+from discord.ext import tasks
+
+from models import ReactionEvent
+from guild_store import GuildStore
+from config import RATE_LIMIT_SWEEP_INTERVAL
+
+
+class _Window:
+    """The times of a user's recent reactions of one kind, with the first entry inside each window.
+
+    Entries before `long_head` have left both windows and are dropped in bulk once they make up half the list."""
+
+    __slots__ = ("times", "long_head", "short_head")
+
+    def __init__(self) -> None:
+        self.times: list[float] = []
+        self.long_head = 0
+        self.short_head = 0
+
+    def hit(
+        self, now: float, interval_short: int, interval_long: int
+    ) -> tuple[int, int]:
+        """Add a reaction and get the number of reactions in the short and long windows."""
+        times = self.times
+        times.append(now)
+
+        long_cutoff = now - interval_long
+        while times[self.long_head] < long_cutoff:
+            self.long_head += 1
+        short_cutoff = now - interval_short
+        self.short_head = max(self.short_head, self.long_head)
+        while times[self.short_head] < short_cutoff:
+            self.short_head += 1
+
+        if self.long_head > len(times) // 2:
+            del times[: self.long_head]
+            self.short_head -= self.long_head
+            self.long_head = 0
+
+        return len(times) - self.short_head, len(times) - self.long_head
+
+    def size(self) -> int:
+        """Get the approximate memory used by the window, in bytes."""
+        return sys.getsizeof(self) + sys.getsizeof(self.times) + 24 * len(self.times)
+
+
+class RateLimiter:
+    """Class that counts each user's recent reactions in a guild's short and long rate limit windows.
+
+    Adds and removes are counted separately. Each user's window keeps the times of their reactions within the long interval, with a head pointer per window, so recording a reaction and reading both counts take amortised O(1).
+    Windows with no reactions in the long interval are dropped by `sweep` every `RATE_LIMIT_SWEEP_INTERVAL` seconds.
+
+    Parameters
+    ----------
+    guilds: `GuildStore`
+        The guild store, mapping guild IDs to `Guild` objects, for their limits.
+    """
+
+    def __init__(self, guilds: GuildStore) -> None:
+        """Initialise the RateLimiter with no windows."""
+        self.guilds = guilds
+        # guild ID -> (user ID, is add) -> window
+        self.windows: dict[int, dict[tuple[int, bool], _Window]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(windows) for windows in self.windows.values())
+
+    def hit(self, guild_id: int, user_id: int, event: ReactionEvent) -> bool:
+        """Record a reaction and check if the user has exceeded either of the guild's rate limits.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The ID of the guild.
+        user_id: `int`
+            The ID of the user giving or removing the reaction.
+        event: `ReactionEvent`
+            The event type that triggered the reaction.
+
+        Returns
+        -------
+        `bool`
+            Whether the user has exceeded the short or long limit."""
+        limits = self.guilds[guild_id].limits
+        windows = self.windows.get(guild_id)
+        if windows is None:
+            windows = self.windows[guild_id] = {}
+        key = (user_id, event.is_add)
+        window = windows.get(key)
+        if window is None:
+            window = windows[key] = _Window()
+
+        short, long = window.hit(
+            time.monotonic(), limits.interval_short, limits.interval_long
+        )
+        return long > limits.threshold_long or short > limits.threshold_short
+
+    def memory(self) -> dict[int, int]:
+        """Get the approximate memory used by each guild's windows.
+
+        Returns
+        -------
+        `dict[int, int]`
+            Maps each guild ID to the bytes used by its windows."""
+        return {
+            guild_id: sys.getsizeof(windows)
+            + sum(
+                sys.getsizeof(key) + window.size() for key, window in windows.items()
+            )
+            for guild_id, windows in self.windows.items()
+        }
+
+    @tasks.loop(seconds=RATE_LIMIT_SWEEP_INTERVAL)
+    async def sweep(self):
+        """Drop the windows with no reactions within their guild's long interval, and the windows of guilds that are no longer resident.
+
+        Runs every `RATE_LIMIT_SWEEP_INTERVAL` seconds."""
+        now = time.monotonic()
+        for guild_id in list(self.windows):
+            # evicted guilds have been idle for far longer than any window
+            guild = self.guilds.resident.get(guild_id)
+            windows = self.windows[guild_id]
+            if guild is not None:
+                cutoff = now - guild.limits.interval_long
+                for key in [
+                    key for key, window in windows.items() if window.times[-1] < cutoff
+                ]:
+                    del windows[key]
+            if guild is None or not windows:
+                del self.windows[guild_id]
@@ -0,0 +1,59 @@
+"""Contains the SingleFlight class, which coalesces concurrent identical API calls into one."""
+
+import asyncio
+
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    """Class that runs at most one call at a time per key, so concurrent callers asking for the same thing share one result.
+
+    Keys are `(kind, id)`, such as `("user", user_id)`. The first caller for a key starts the call, and callers that arrive while it is in flight wait for it instead of making their own. Once the call finishes the key is free again, so later callers should check their cache first.
+    A caller that is cancelled stops waiting without cancelling the call for the others.
+    """
+
+    def __init__(self) -> None:
+        """Initialise the SingleFlight with no calls in flight."""
+        self.in_flight: dict[tuple[str, Hashable], asyncio.Task] = {}
+        # kind -> number of calls made, and of callers that joined a call in flight
+        self.calls: defaultdict[str, int] = defaultdict(int)
+        self.coalesced: defaultdict[str, int] = defaultdict(int)
+
+    def __len__(self) -> int:
+        return len(self.in_flight)
+
+    async def run(
+        self,
+        kind: str,
+        id: Hashable,
+        func: Callable[..., Awaitable[Any]],
+        *args: Any,
+    ) -> Any:
+        """Run `func(*args)` for a key, or wait for the call already in flight for it.
+
+        Parameters
+        ----------
+        kind: `str`
+            The kind of call, such as `"user"` or `"message"`.
+        id: `Hashable`
+            The ID of what is being fetched.
+        func: `Callable[..., Awaitable[Any]]`
+            The coroutine function making the call. Should also store its result in the relevant cache.
+        *args: `Any`
+            The arguments to call `func` with.
+
+        Returns
+        -------
+        `Any`
+            The call's return value. Exceptions raised by the call are raised to every caller."""
+        key = (kind, id)
+        task = self.in_flight.get(key)
+        if task is None:
+            task = self.in_flight[key] = asyncio.create_task(func(*args))
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+            self.calls[kind] += 1
+        else:
+            self.coalesced[kind] += 1
+
+        return await asyncio.shield(task)
@@ -3,18 +3,30 @@
 import discord
 import time
 import datetime
-import sqlite3
+import asyncio
 
 from discord.ext import tasks
 
-from models import Guild
+from guild_store import GuildStore
 from funcs import Functions
-from config import UPDATE_INTERVAL, DB
+from database import ConnectionManager
+from persistence import PersistenceManager
+from baselines import BaselineManager
+from board_scheduler import LeaderboardScheduler
+from db_functions import take_snapshots
+from config import LAG_PROBE_INTERVAL, GUILD_EVICT_INTERVAL
 
 
 class TasksManager:
     def __init__(
-        self, client: discord.Client, guilds: dict[int, Guild], funcs: Functions
+        self,
+        client: discord.Client,
+        db: ConnectionManager,
+        guilds: GuildStore,
+        funcs: Functions,
+        persistence_manager: PersistenceManager,
+        baseline_manager: BaselineManager,
+        board_scheduler: LeaderboardScheduler,
     ):
         """Initialise the TasksManager with the Discord client and guilds.
 
@@ -22,46 +34,49 @@ class TasksManager:
         ----------
         client: `discord.Client`
             The Discord client instance.
-        guilds: `dict[int, Guild]`
-            A dictionary of guilds, where the key is the guild ID and the value is a `Guild` object.
+        db: `ConnectionManager`
+            The connection manager used for database access.
+        guilds: `GuildStore`
+            The guild store, mapping guild IDs to `Guild` objects.
+        funcs: `Functions`
+            The shared utility functions.
+        persistence_manager: `PersistenceManager`
+            The persistence manager, flushed before snapshots are taken.
+        baseline_manager: `BaselineManager`
+            The baseline manager, rebuilt after snapshots are taken.
+        board_scheduler: `LeaderboardScheduler`
+            The leaderboard scheduler, whose history of evicted guilds is dropped.
         """
         self.client = client
+        self.db = db
         self.guilds = guilds
         self.funcs = funcs
+        self.persistence_manager = persistence_manager
+        self.baseline_manager = baseline_manager
+        self.board_scheduler = board_scheduler
+        self.loop_lag = 0.0
+        self.max_loop_lag = 0.0
 
-    @tasks.loop(seconds=UPDATE_INTERVAL)
-    async def update_leaderboards(self, skip=False):
-        """Update the leaderboard and emoji list for all guilds.
+    @tasks.loop(seconds=LAG_PROBE_INTERVAL)
+    async def measure_loop_lag(self):
+        """Measure how late the event loop wakes a sleeping coroutine, in seconds.
 
-        Runs every `UPDATE_INTERVAL` seconds.
+        Runs every `LAG_PROBE_INTERVAL` seconds. A high lag means something is blocking the event loop."""
+        start = time.perf_counter()
+        await asyncio.sleep(0.1)
+        self.loop_lag = max(time.perf_counter() - start - 0.1, 0.0)
+        self.max_loop_lag = max(self.max_loop_lag, self.loop_lag)
 
-        Parameters
-        ----------
-        skip: `bool`, optional
-            Whether to ignore the update interval and force an update. Defaults to `False`. Is True when the bot is first started.
-        """
-        for guild_id in self.guilds:
-            guild = self.guilds[guild_id]
-            if skip or int(time.time()) - guild.last_update < UPDATE_INTERVAL + 10:
-                if guild.msgs_channel_id is not None:
-                    channel = self.client.get_channel(guild.msgs_channel_id)
-                    if channel is not None:
-                        if guild.board_msg_id is not None:
-                            try:
-                                board_msg = channel.get_partial_message(
-                                    guild.board_msg_id
-                                )
-                                await board_msg.edit(
-                                    embed=await self.funcs.get_leaderboard(
-                                        guild_id, "all", True
-                                    )
-                                )
-                            except discord.NotFound:
-                                pass
-                            except discord.Forbidden:
-                                print(
-                                    f"Forbidden to send leaderboard to channel {guild.msgs_channel_id} in guild {guild_id}."
-                                )
+    @tasks.loop(seconds=GUILD_EVICT_INTERVAL)
+    async def evict_idle_guilds(self):
+        """Evict idle and least recently used guilds from memory once their changes have been flushed.
+
+        Runs every `GUILD_EVICT_INTERVAL` seconds."""
+        evicted = self.guilds.evict(self.persistence_manager.dirty_guilds())
+        self.baseline_manager.evict()
+        self.board_scheduler.evict()
+        if evicted:
+            print(f"Evicted {evicted} guilds from memory.")
 
     @tasks.loop(
         time=[datetime.time(hour=0, minute=0), datetime.time(hour=12, minute=0)]
@@ -69,33 +84,12 @@ class TasksManager:
     async def take_snapshots_and_cleanup(self):
         now = datetime.datetime.now()
 
-        conn = sqlite3.connect(DB)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-
-        cursor.execute(
-            """
-            INSERT INTO user_snapshots (
-                guild_id, user_id, aura, aura_contribution, 
-                num_pos_given, num_pos_received, num_neg_given, num_neg_received
-            )
-            SELECT 
-                guild_id, user_id, aura, aura_contribution, 
-                num_pos_given, num_pos_received, num_neg_given, num_neg_received
-            FROM users
-        """
-        )
-
-        cursor.execute(
-            """
-            DELETE FROM user_snapshots 
-            WHERE snapshot_time < DATETIME('now', '-30 days')
-        """
-        )
-
-        conn.commit()
-        conn.close()
+        # fold the journal first so the users table is current
+        await self.persistence_manager.flush()
+        taken, deleted = await self.db.run_write(take_snapshots)
 
         print(
-            f"Snapshots taken and old data cleaned up at {now.strftime('%Y-%m-%d %H:%M:%S')}"
+            f"{taken} changed users snapshotted and {deleted} old snapshots rolled up at {now.strftime('%Y-%m-%d %H:%M:%S')}"
         )
+
+        await self.baseline_manager.rebuild()
@@ -0,0 +1,113 @@
+"""Stress tests for GuildActors: many tasks hammering one guild must not interleave their read-await-write updates."""
+
+import asyncio
+
+from actors import GuildActors
+
+TASKS = 2000
+
+
+def test_run_serializes_one_guild():
+    async def main():
+        actors = GuildActors()
+        counters = {1: 0, 2: 0}
+
+        async def increment(guild_id):
+            value = counters[guild_id]
+            await asyncio.sleep(0)
+            counters[guild_id] = value + 1
+
+        await asyncio.gather(
+            *(
+                actors.run(guild_id, increment, guild_id)
+                for _ in range(TASKS)
+                for guild_id in (1, 2)
+            )
+        )
+        return counters, actors.jobs
+
+    counters, jobs = asyncio.run(main())
+    assert counters == {1: TASKS, 2: TASKS}
+    assert jobs == 2 * TASKS
+
+
+def test_unserialized_updates_interleave():
+    """The same updates without actors lose increments, so the test above can fail."""
+
+    async def main():
+        counter = 0
+
+        async def increment():
+            nonlocal counter
+            value = counter
+            await asyncio.sleep(0)
+            counter = value + 1
+
+        await asyncio.gather(*(increment() for _ in range(TASKS)))
+        return counter
+
+    assert asyncio.run(main()) < TASKS
+
+
+def test_turn_serializes_one_guild():
+    async def main():
+        actors = GuildActors()
+        counter = 0
+        inside = 0
+        most_inside = 0
+
+        async def increment():
+            nonlocal counter, inside, most_inside
+            async with actors.turn(1):
+                inside += 1
+                most_inside = max(most_inside, inside)
+                value = counter
+                await asyncio.sleep(0)
+                counter = value + 1
+                inside -= 1
+
+        await asyncio.gather(*(increment() for _ in range(TASKS)))
+        return counter, most_inside
+
+    counter, most_inside = asyncio.run(main())
+    assert counter == TASKS
+    assert most_inside == 1
+
+
+def test_guilds_run_concurrently():
+    async def main():
+        actors = GuildActors()
+        both_started = asyncio.Event()
+        started = set()
+
+        async def wait_for_other(guild_id):
+            started.add(guild_id)
+            if len(started) == 2:
+                both_started.set()
+            await asyncio.wait_for(both_started.wait(), 1)
+
+        await asyncio.gather(
+            actors.run(1, wait_for_other, 1), actors.run(2, wait_for_other, 2)
+        )
+
+    asyncio.run(main())
+
+
+def test_jobs_run_in_order_and_survive_errors():
+    async def main():
+        actors = GuildActors()
+        order = []
+
+        def job(i):
+            if i == 50:
+                raise ValueError(i)
+            order.append(i)
+
+        results = await asyncio.gather(
+            *(actors.run(1, job, i) for i in range(100)), return_exceptions=True
+        )
+        return order, results
+
+    order, results = asyncio.run(main())
+    assert order == [i for i in range(100) if i != 50]
+    assert isinstance(results[50], ValueError)
@@ -0,0 +1,117 @@
+"""Tests for the schema migrations: a database from before migrations existed is brought up to date without losing rows, and migrating again does nothing."""
+
+import sqlite3
+
+import pytest
+
+from migrations import MIGRATIONS, STRICT, _create_tables, migrate
+
+# (guild_id, user_id, aura, aura_contribution, num_pos_given, num_pos_received, num_neg_given, num_neg_received)
+SNAPSHOTS = [
+    (1, 10, 5, 0, 1, 1, 0, 0),
+    (1, 10, 5, 0, 1, 1, 0, 0),  # unchanged, removed by v4
+    (1, 10, 7, 0, 1, 2, 0, 0),
+    (1, 10, 5, 0, 1, 2, 0, 1),  # same aura as an earlier snapshot, but not the previous one
+    (1, 11, 2, 0, 0, 1, 0, 0),
+    (2, 10, 1, 0, 0, 1, 0, 0),
+]
+
+
+@pytest.fixture
+def conn(tmp_path):
+    """A database with the baseline schema at `user_version` 0, as created before migrations, with a few rows."""
+    conn = sqlite3.connect(tmp_path / "aura.db")
+    with conn:
+        _create_tables(conn.cursor())
+        conn.executemany(
+            "INSERT INTO guilds (id, last_update) VALUES (?, ?)", [(1, 100), (2, 200)]
+        )
+        conn.executemany(
+            "INSERT INTO users VALUES (?, ?, ?, 0, 0, 0, 0, 0, 1, 1, 1)",
+            [(1, 10, 5), (1, 11, 2), (2, 10, 1)],
+        )
+        conn.executemany(
+            "INSERT INTO reactions VALUES (?, ?, ?)",
+            [(1, "👍", 1), (1, "👎", -1), (2, "🔥", 2)],
+        )
+        conn.execute("INSERT INTO limits VALUES (1, 60, 10, 15, 5, 300, 10, 10)")
+        conn.executemany(
+            """
+            INSERT INTO user_snapshots (
+                guild_id, user_id, aura, aura_contribution, num_pos_given,
+                num_pos_received, num_neg_given, num_neg_received
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+            SNAPSHOTS,
+        )
+    yield conn
+    conn.close()
+
+
+def rows(conn: sqlite3.Connection, table: str) -> list[tuple]:
+    return conn.execute(f"SELECT * FROM {table} ORDER BY 1, 2").fetchall()
+
+
+def schema(conn: sqlite3.Connection) -> list[tuple]:
+    return conn.execute(
+        "SELECT type, name, sql FROM sqlite_master ORDER BY name"
+    ).fetchall()
+
+
+def test_migrate_keeps_rows(conn):
+    users = rows(conn, "users")
+    reactions = rows(conn, "reactions")
+    limits = rows(conn, "limits")
+
+    assert migrate(conn) == MIGRATIONS[-1][0]
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == MIGRATIONS[-1][0]
+
+    assert rows(conn, "users") == users
+    assert rows(conn, "reactions") == reactions
+    assert rows(conn, "limits") == limits
+    assert conn.execute("SELECT COUNT(*) FROM guilds").fetchone()[0] == 2
+
+
+def test_rebuilds_hot_tables_without_rowid(conn):
+    migrate(conn)
+
+    for table in ("users", "reactions"):
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute(f"SELECT rowid FROM {table}")
+        sql = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE name = ?", (table,)
+        ).fetchone()[0]
+        assert sql.rstrip().endswith(f"WITHOUT ROWID{STRICT}")
+    if STRICT:
+        with pytest.raises(sqlite3.IntegrityError):
+            conn.execute("INSERT INTO users (guild_id, user_id) VALUES (1, 'text')")
+
+
+def test_removes_only_unchanged_snapshots(conn):
+    migrate(conn)
+
+    snapshots = conn.execute(
+        """
+        SELECT
+            guild_id, user_id, aura, aura_contribution, num_pos_given,
+            num_pos_received, num_neg_given, num_neg_received
+        FROM user_snapshots ORDER BY id
+    """
+    ).fetchall()
+    assert snapshots == SNAPSHOTS[:1] + SNAPSHOTS[2:]
+
+
+def test_migrate_again_changes_nothing(conn, capsys):
+    migrate(conn)
+    tables = {
+        table: rows(conn, table)
+        for table in ("guilds", "users", "reactions", "limits", "user_snapshots")
+    }
+    before = schema(conn)
+    capsys.readouterr()
+
+    assert migrate(conn) == MIGRATIONS[-1][0]
+    assert capsys.readouterr().out == ""
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == MIGRATIONS[-1][0]
+    assert schema(conn) == before
+    assert {table: rows(conn, table) for table in tables} == tables
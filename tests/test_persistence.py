@@ -0,0 +1,122 @@
+"""Tests for the aura journal: entries survive a crash, failed flushes are retried, and folded entries are never applied twice."""
+
+import asyncio
+import sqlite3
+
+import db_functions
+
+from database import ConnectionManager
+from guild_store import GuildStore
+from persistence import PersistenceManager
+from models import Guild
+
+GUILD_ID = 1
+USER_ID = 10
+
+
+def open_db(path):
+    """Open the database at `path` as the bot does on startup, replaying the journal."""
+    db = ConnectionManager(str(path))
+    guilds = GuildStore(db)
+    persistence_manager = PersistenceManager(db, guilds, {})
+    persistence_manager.replay_journal()
+    return db, guilds, persistence_manager
+
+
+def saved_aura(db):
+    """Get the aura saved in the users table, or `None` if the user has no row."""
+    with db.reader() as conn:
+        row = conn.execute(
+            "SELECT aura FROM users WHERE guild_id = ? AND user_id = ?",
+            (GUILD_ID, USER_ID),
+        ).fetchone()
+    return row[0] if row is not None else None
+
+
+def set_up_guild(path):
+    """Create a database with one set up guild."""
+    db, guilds, persistence_manager = open_db(path)
+    guilds[GUILD_ID] = Guild()
+    persistence_manager.mark_guild_created(GUILD_ID)
+    asyncio.run(persistence_manager.flush())
+    db.close()
+
+
+def test_replay_restores_journaled_changes_after_crash(tmp_path):
+    path = tmp_path / "aura.db"
+    set_up_guild(path)
+
+    db, guilds, persistence_manager = open_db(path)
+    persistence_manager.apply_change(GUILD_ID, USER_ID, aura=3, num_pos_received=1)
+    persistence_manager.apply_change(GUILD_ID, USER_ID, aura=2, num_pos_received=1)
+    asyncio.run(persistence_manager.append_journal())
+    # crash: the changes were journaled but never flushed
+    assert saved_aura(db) is None
+    db.close()
+
+    db, guilds, persistence_manager = open_db(path)
+    user = guilds[GUILD_ID].users[USER_ID]
+    assert (user.aura, user.num_pos_received) == (5, 2)
+    assert persistence_manager.last_seq == 2
+    db.close()
+
+
+def test_failed_flush_is_retried(tmp_path):
+    path = tmp_path / "aura.db"
+    set_up_guild(path)
+
+    db, guilds, persistence_manager = open_db(path)
+    persistence_manager.apply_change(GUILD_ID, USER_ID, aura=4)
+
+    run_write = db.run_write
+    failures = []
+
+    async def failing_run_write(func, *args):
+        if func is db_functions.write_changes and not failures:
+            failures.append(func)
+            raise sqlite3.OperationalError("database is locked")
+        return await run_write(func, *args)
+
+    db.run_write = failing_run_write
+    asyncio.run(persistence_manager.flush())
+    assert failures
+    assert (GUILD_ID, USER_ID) in persistence_manager.deferred.users
+    assert persistence_manager.journal
+    assert persistence_manager.compacted_seq == 0
+    assert saved_aura(db) is None
+
+    asyncio.run(persistence_manager.flush())
+    assert not persistence_manager.pending and not persistence_manager.deferred
+    assert persistence_manager.compacted_seq == 1
+    assert saved_aura(db) == 4
+    db.close()
+
+    db, guilds, persistence_manager = open_db(path)
+    assert guilds[GUILD_ID].users[USER_ID].aura == 4
+    db.close()
+
+
+def test_folded_entries_are_not_applied_twice(tmp_path):
+    path = tmp_path / "aura.db"
+    set_up_guild(path)
+
+    db, guilds, persistence_manager = open_db(path)
+    persistence_manager.apply_change(GUILD_ID, USER_ID, aura=7)
+    folded = list(persistence_manager.journal)
+    asyncio.run(persistence_manager.flush())
+    assert persistence_manager.compacted_seq == 1
+
+    # an append that lands after the fold must not re-add the folded entry
+    persistence_manager.journal = list(folded)
+    asyncio.run(persistence_manager.append_journal())
+    # even if a folded entry is left in the table, replay skips it
+    asyncio.run(db.run_write(db_functions.append_journal, folded))
+    persistence_manager.apply_change(GUILD_ID, USER_ID, aura=1)
+    asyncio.run(persistence_manager.append_journal())
+    db.close()
+
+    db, guilds, persistence_manager = open_db(path)
+    assert guilds[GUILD_ID].users[USER_ID].aura == 8
+    assert persistence_manager.compacted_seq == 1
+    assert persistence_manager.last_seq == 2
+    db.close()
@@ -0,0 +1,83 @@
+"""Randomised tests for RankIndex: every rank, page and top read must match a full sort of the users."""
+
+import random
+
+import pytest
+
+from models import User
+from rank_index import RankIndex
+
+
+def expected_order(users: dict[int, User]) -> list[tuple[int, int]]:
+    """Get the opted in users as `(user_id, aura)`, highest aura first and ties by user ID."""
+    return [
+        (user_id, user.aura)
+        for user_id, user in sorted(
+            users.items(), key=lambda item: (-item[1].aura, item[0])
+        )
+        if user.opted_in
+    ]
+
+
+def check(ranks: RankIndex, users: dict[int, User], rng: random.Random) -> None:
+    """Compare every read of the index against a full sort."""
+    order = expected_order(users)
+    assert len(ranks) == len(order)
+    assert ranks.page(0, len(order) + 1) == order
+
+    positions = {user_id: rank for rank, (user_id, _) in enumerate(order, 1)}
+    for user_id in users:
+        assert ranks.rank(user_id) == positions.get(user_id)
+        assert (user_id in ranks) == (user_id in positions)
+
+    for _ in range(5):
+        start = rng.randint(0, len(order) + 2)
+        count = rng.randint(0, 30)
+        assert ranks.page(start, count) == order[start : start + count]
+    count = rng.randint(0, 30)
+    assert ranks.top(count) == order[:count]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_operations_match_full_sort(seed):
+    rng = random.Random(seed)
+    # a narrow aura range makes ties common
+    users = {
+        user_id: User(aura=rng.randint(-5, 5), opted_in=rng.random() < 0.9)
+        for user_id in rng.sample(range(1000), 50)
+    }
+    ranks = RankIndex(users)
+    check(ranks, users, rng)
+
+    for step in range(300):
+        user_id = rng.randrange(1000)
+        action = rng.random()
+        if action < 0.15:
+            # removal
+            users.pop(user_id, None)
+            ranks.update(user_id, None)
+        elif action < 0.3:
+            # opt out or back in
+            user = users.setdefault(user_id, User())
+            user.opted_in = not user.opted_in
+            ranks.update(user_id, user)
+        else:
+            user = users.setdefault(user_id, User())
+            user.aura += rng.randint(-3, 3)
+            ranks.update(user_id, user)
+
+        if step % 10 == 0:
+            check(ranks, users, rng)
+    check(ranks, users, rng)
+
+
+def test_unchanged_and_unknown_users():
+    users = {1: User(aura=5), 2: User(aura=5), 3: User(aura=1, opted_in=False)}
+    ranks = RankIndex(users)
+    ranks.update(1, users[1])
+    ranks.update(99, None)
+
+    assert ranks.top(10) == [(1, 5), (2, 5)]
+    assert ranks.rank(3) is None
+    assert ranks.rank(99) is None
+    assert ranks.page(5, 10) == []
@@ -1,33 +1,55 @@
-"""Contains the TimelinesManager class, which manages the rolling timelines for each guild and user. Also keeps track of message ids and authors for 1 hour."""
+"""Contains the TimelinesManager class, which manages the rolling timelines for each guild and user. Also keeps track of the authors of reacted to messages."""
 
 import discord
-import time
-import asyncio
-import bisect
-
-from collections import defaultdict, deque
-
-from models import Guild, ReactionEvent, LogEvent
-from logging_aura import LoggingManager
-
-MESSAGE_EXPIRY = 3600  # 1 hour expiry for message IDs -> author IDs
+import datetime
+import sqlite3
+
+from discord.ext import tasks
+
+from models import ReactionEvent
+from database import ConnectionManager
+from guild_store import GuildStore
+from bans import BanManager
+from rate_limiter import RateLimiter
+from author_cache import AuthorCache
+from single_flight import SingleFlight
+from negative_cache import NegativeCache
+from db_functions import (
+    load_message_author,
+    save_message_authors,
+    prune_message_authors,
+)
+from config import (
+    MESSAGE_AUTHOR_FLUSH_INTERVAL,
+    MESSAGE_AUTHOR_PRUNE_INTERVAL,
+    MESSAGE_AUTHOR_RETENTION,
+    MESSAGE_AUTHOR_ROWS,
+)
 
 
 class TimelinesManager:
     def __init__(
         self,
         client: discord.Client,
-        guilds: dict[int, Guild],
-        logging_manager: LoggingManager,
+        db: ConnectionManager,
+        guilds: GuildStore,
+        ban_manager: BanManager,
+        single_flight: SingleFlight,
     ):
         self.client = client
+        self.db = db
         self.guilds = guilds
-        self.logging_manager = logging_manager
-        self.rolling_add = defaultdict(deque)
-        self.rolling_remove = defaultdict(deque)
-        self.temp_banned_users = defaultdict(list)
-
-        self.recent_messages = deque()
+        self.ban_manager = ban_manager
+        self.single_flight = single_flight
+        self.rate_limiter = RateLimiter(guilds)
+
+        self.authors = AuthorCache()
+        # messages and channels that could not be fetched, or were deleted
+        self.unresolved = NegativeCache()
+        # message ID -> author ID, seen since the last save
+        self.unsaved_authors: dict[int, int] = {}
+        self.author_reads = 0
+        self.author_fetches = 0
 
     async def update_rolling_timelines(
         self, guild_id: int, user_id: int, event: ReactionEvent
@@ -46,68 +68,11 @@ class TimelinesManager:
             The ID of the user giving or removing the reaction.
         event: `ReactionEvent`
             The event type that triggered the reaction."""
-        current_time = time.time()
-
-        if event.is_add:
-            rolling = (
-                self.rolling_add
-            )  # uses mutability of dict. rolling is just a pointer
-        else:
-            rolling = self.rolling_remove
-
-        rolling[(guild_id, user_id)].append(current_time)
-
-        # remove expired timestamps from the deque
-        while (
-            rolling[(guild_id, user_id)]
-            and rolling[(guild_id, user_id)][0]
-            < current_time - self.guilds[guild_id].limits.interval_long
-        ):
-            rolling[(guild_id, user_id)].popleft()
-
-        # long interval check
-        if (
-            len(rolling[(guild_id, user_id)])
-            > self.guilds[guild_id].limits.threshold_long
-        ):
-            await self.handle_spam(guild_id, user_id)
-            return
-
-        # short interval check
-        short_rolling = [
-            1
-            for t in rolling[(guild_id, user_id)]
-            if t >= current_time - self.guilds[guild_id].limits.interval_short
-        ]
-        if sum(short_rolling) > self.guilds[guild_id].limits.threshold_short:
-            await self.handle_spam(guild_id, user_id)
-            return
-
-    async def handle_spam(self, guild_id: int, user_id: int) -> None:
-        """Handle spamming reactions by temporarily banning a user from giving aura.
-
-        Parameters
-        ----------
-        guild_id: `int`
-            The ID of the guild.
-        user_id: `int`
-            The ID of the user to tempban."""
-        self.temp_banned_users[guild_id].append(user_id)
-        await (await self.client.fetch_user(user_id)).send(
-            f"<@{user_id}\nYou have been temporarily banned for {self.guilds[guild_id].limits.penalty} seconds from giving aura in {self.client.get_guild(guild_id).name} due to spamming reactions."
-        )
-        print(f"Fetched user {user_id}. Reason: Temp ban direct message.")
-        if self.guilds[guild_id].log_channel_id is not None:
-            self.logging_manager.log_event(
-                guild_id, user_id, user_id, LogEvent.SPAMMING
-            )
-
-        # start a timer to allow the user to give aura again after LIMIT_PENALTY seconds
-        await asyncio.sleep(self.guilds[guild_id].limits.penalty)
-        self.temp_banned_users[guild_id].remove(user_id)
+        if self.rate_limiter.hit(guild_id, user_id, event):
+            self.ban_manager.ban(guild_id, user_id)
 
     def add_message_author_id(self, message_id: int, message_author_id: int) -> None:
-        """Add the author ID of a message to the rolling deque.
+        """Cache the author ID of a message, and queue it to be saved.
 
         Parameters
         ----------
@@ -116,18 +81,12 @@ class TimelinesManager:
         message_author_id: `int`
             The ID of the author of the message.
         """
-        current_time = time.time()
-        self.recent_messages.append((current_time, message_id, message_author_id))
-
-        # remove expired messages from the deque
-        while (
-            self.recent_messages
-            and self.recent_messages[0][0] < current_time - MESSAGE_EXPIRY
-        ):
-            self.recent_messages.popleft()
+        if message_author_id is not None:
+            self.authors.put(message_id, message_author_id)
+            self.unsaved_authors[message_id] = message_author_id
 
     async def get_message_author_id(self, channel_id: int, message_id: int) -> int:
-        """Get the author ID of a message in a channel.
+        """Get the author ID of a message in a channel, from the cache, else the database, else the API.
 
         Parameters
         ----------
@@ -139,23 +98,90 @@ class TimelinesManager:
         Returns
         -------
         int
-            The ID of the author of the message.
+            The ID of the author of the message, or `None` if it could not be found.
         """
-        message_ids = [msg[1] for msg in self.recent_messages]
-
-        i = bisect.bisect_left(message_ids, message_id)
-
-        if i != len(message_ids) and self.recent_messages[i][1] == message_id:
-            return self.recent_messages[i][2]
+        author_id = self.authors.get(message_id)
+        if author_id is None:
+            author_id = self.unsaved_authors.get(message_id)
+        if author_id is None:
+            self.author_reads += 1
+            author_id = await self.db.run_read(load_message_author, message_id)
+        if author_id is not None:
+            self.authors.put(message_id, author_id)
+            return author_id
+
+        # skip the API for deleted messages, and channels that cannot be fetched
+        if ("message", message_id) in self.unresolved:
+            return None
+        if ("channel", channel_id) in self.unresolved:
+            return None
+
+        # else fallback to API call, shared with any concurrent lookups of the message
+        return await self.single_flight.run(
+            "message", message_id, self._fetch_message_author_id, channel_id, message_id
+        )
 
-        # else fallback to API call
+    async def _fetch_message_author_id(
+        self, channel_id: int, message_id: int
+    ) -> int:
+        """Fetch a message from Discord and cache its author ID, or remember that it could not be fetched."""
         channel = self.client.get_channel(channel_id)
-        if channel is not None:
+        if channel is None:
+            # such as threads that are not cached
             try:
-                print(
-                    f"Fetching message {message_id} from API. Reason: Need message author id."
-                )
-                msg = await channel.fetch_message(message_id)
-                return msg.author.id
+                channel = await self.client.fetch_channel(channel_id)
             except (discord.NotFound, discord.Forbidden):
+                self.unresolved.add("channel", channel_id)
                 return None
+
+        try:
+            print(
+                f"Fetching message {message_id} from API. Reason: Need message author id."
+            )
+            self.author_fetches += 1
+            msg = await channel.fetch_message(message_id)
+            self.add_message_author_id(message_id, msg.author.id)
+            return msg.author.id
+        except (discord.NotFound, discord.Forbidden):
+            self.unresolved.add("message", message_id)
+            return None
+
+    @tasks.loop(seconds=MESSAGE_AUTHOR_FLUSH_INTERVAL)
+    async def flush_authors(self):
+        """Save the message authors seen since the last save.
+
+        Runs every `MESSAGE_AUTHOR_FLUSH_INTERVAL` seconds."""
+        if self.unsaved_authors:
+            await self.save_authors()
+
+    async def save_authors(self) -> None:
+        """Save the message authors seen since the last save in one transaction.
+
+        If the write fails, the authors are kept and retried on the next save."""
+        rows = list(self.unsaved_authors.items())
+        try:
+            await self.db.run_write(save_message_authors, rows)
+        except sqlite3.Error as e:
+            print(f"Failed to save {len(rows)} message authors: {e}")
+            return
+        # keep authors seen while saving
+        for message_id, _ in rows:
+            self.unsaved_authors.pop(message_id, None)
+
+    @tasks.loop(seconds=MESSAGE_AUTHOR_PRUNE_INTERVAL)
+    async def prune_authors(self):
+        """Delete the saved authors of messages older than `MESSAGE_AUTHOR_RETENTION` days, and of the oldest messages over `MESSAGE_AUTHOR_ROWS`.
+
+        Runs every `MESSAGE_AUTHOR_PRUNE_INTERVAL` seconds."""
+        oldest_id = discord.utils.time_snowflake(
+            discord.utils.utcnow() - datetime.timedelta(days=MESSAGE_AUTHOR_RETENTION)
+        )
+        try:
+            deleted = await self.db.run_write(
+                prune_message_authors, oldest_id, MESSAGE_AUTHOR_ROWS
+            )
+        except sqlite3.Error as e:
+            print(f"Failed to prune saved message authors: {e}")
+            return
+        if deleted:
+            print(f"Pruned {deleted} saved message authors.")
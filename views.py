@@ -1,5 +1,7 @@
 import discord
 
+from typing import Awaitable, Callable
+
 class ConfirmView(discord.ui.View):
     def __init__(self, user_id: int):
         super().__init__(timeout=10)
@@ -39,3 +41,89 @@ class ConfirmView(discord.ui.View):
         await interaction.message.edit(content="Action cancelled.", view=None)
         await interaction.response.defer()
         self.stop()
+
+
+class PageView(discord.ui.View):
+    """Previous, next and jump buttons for a paginated embed. Pages are rendered on demand by `render`, which takes a 0-based page and returns the embed and the current number of pages."""
+
+    def __init__(
+        self,
+        user_id: int,
+        render: Callable[[int], Awaitable[tuple[discord.Embed, int]]],
+        page_count: int,
+    ):
+        super().__init__(timeout=120)
+        self.user_id = user_id
+        self.render = render
+        self.page = 0
+        self.page_count = page_count
+        self.message: discord.Message | None = None
+        self.update_buttons()
+
+    def update_buttons(self):
+        self.previous.disabled = self.page <= 0
+        self.next.disabled = self.page >= self.page_count - 1
+
+    async def show(self, interaction: discord.Interaction, page: int):
+        embed, self.page_count = await self.render(page)
+        # the list may have shrunk since the last page was shown
+        if page >= self.page_count:
+            page = self.page_count - 1
+            embed, self.page_count = await self.render(page)
+
+        self.page = page
+        self.update_buttons()
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.user_id:
+            await interaction.response.send_message(
+                "Run the command yourself to browse its pages.", ephemeral=True
+            )
+            return False
+        return True
+
+    async def on_timeout(self):
+        if self.message is not None:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary)
+    async def previous(
+        self, interaction: discord.Interaction, button: discord.ui.Button
+    ):
+        await self.show(interaction, max(self.page - 1, 0))
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary)
+    async def next(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show(interaction, self.page + 1)
+
+    @discord.ui.button(label="Jump to page", style=discord.ButtonStyle.primary)
+    async def jump(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await interaction.response.send_modal(JumpModal(self))
+
+
+class JumpModal(discord.ui.Modal, title="Jump to page"):
+    number = discord.ui.TextInput(label="Page", max_length=6)
+
+    def __init__(self, page_view: PageView):
+        super().__init__()
+        self.page_view = page_view
+        self.number.placeholder = f"1-{page_view.page_count}"
+
+    async def on_submit(self, interaction: discord.Interaction):
+        try:
+            page = int(self.number.value)
+        except ValueError:
+            page = 0
+
+        if not 1 <= page <= self.page_view.page_count:
+            await interaction.response.send_message(
+                f"Page must be a number from 1 to {self.page_view.page_count}.",
+                ephemeral=True,
+            )
+            return
+
+        await self.page_view.show(interaction, page - 1)